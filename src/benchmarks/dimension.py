@@ -0,0 +1,92 @@
+"""Cost of Time arithmetic, comparison and hashing in the recursion path, against the previous dataclass Dimension.
+
+Run from the repository root with ``python -m src.benchmarks.dimension``.
+"""
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any
+
+from src.lib.dimension import Time
+
+
+@dataclass(frozen=True)
+class _DataclassDimension:
+    """Replica of the frozen dataclass Dimension, whose arithmetic returned a new base Dimension."""
+    name: str
+    value: Any
+
+    def __sub__(self, other):
+        if isinstance(other, _DataclassDimension):
+            self._check_equal_name(other)
+            return _DataclassDimension(self.name, self.value - other.value)
+        return _DataclassDimension(self.name, self.value - other)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, _DataclassDimension):
+            self._check_equal_name(other)
+            return self.value == other.value
+        return self.value == other
+
+    def _check_equal_name(self, other: '_DataclassDimension'):
+        if self.name != other.name:
+            raise ValueError('Trying to perform operation on two different dimensions')
+
+
+def _dataclass_time(value: Any) -> _DataclassDimension:
+    return _DataclassDimension('t', value)
+
+
+def _recursion_path(t, cache: dict) -> int:
+    """Walk a lagged chain as num_alive does: compare, step back, then hash the key for the cache."""
+    steps = 0
+    while not t == 0:
+        t = t - 1
+        cache[t] = steps
+        steps += 1
+    return steps
+
+
+def _lagged_chain(t) -> list:
+    chain = []
+    while not t == 0:
+        t = t - 1
+        chain.append(t)
+    return chain
+
+
+def _allocations_per_step(t) -> float:
+    """Memory blocks allocated per lagged step, keeping every step alive so none are freed and reused."""
+    _lagged_chain(t)
+    tracemalloc.start()
+    chain = _lagged_chain(t)
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    # The list holding the chain is a single block
+    return (blocks - 1) / len(chain)
+
+
+def _per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def measure_dimension_cost(horizon: int = 1_200, number: int = 200) -> dict[str, float]:
+    new_t = Time(horizon)
+    old_t = _dataclass_time(horizon)
+    results = {
+        'dataclass_sub_ns': _per_call_us(lambda: old_t - 1, number * 1_000) * 1e3,
+        'time_sub_ns': _per_call_us(lambda: new_t - 1, number * 1_000) * 1e3,
+        'dataclass_hash_ns': _per_call_us(lambda: hash(old_t), number * 1_000) * 1e3,
+        'time_hash_ns': _per_call_us(lambda: hash(new_t), number * 1_000) * 1e3,
+        'dataclass_recursion_us': _per_call_us(lambda: _recursion_path(old_t, {}), number),
+        'time_recursion_us': _per_call_us(lambda: _recursion_path(new_t, {}), number),
+    }
+    results['dataclass_allocations_per_step'] = _allocations_per_step(old_t)
+    results['time_allocations_per_step'] = _allocations_per_step(new_t)
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in measure_dimension_cost().items():
+        print(f"{name:>32}: {value:,.3f}")
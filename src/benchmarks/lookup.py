@@ -0,0 +1,47 @@
+"""Latency of CsvTable point lookups against the pandas MultiIndex lookup they replace.
+
+Run from the repository root with ``python -m src.benchmarks.lookup``.
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from src.lib.reference import CsvTable
+
+
+def synthetic_mortality(min_age: int = 16, max_age: int = 130) -> pd.DataFrame:
+    ages = np.arange(min_age, max_age + 1)
+    return pd.DataFrame({'age': ages, 'q_x': np.minimum(0.0005 * np.exp(0.08 * (ages - min_age)), 1.0)})
+
+
+def synthetic_select_table(num_ages: int = 100, num_terms: int = 40) -> pd.DataFrame:
+    ages, terms = np.meshgrid(np.arange(num_ages), np.arange(num_terms), indexing='ij')
+    return pd.DataFrame({'age': ages.ravel(), 'term': terms.ravel(),
+                         'rate': np.linspace(0.001, 0.5, num_ages * num_terms)})
+
+
+def _per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def measure_lookup_latency(number: int = 20_000, batch_size: int = 100_000) -> dict[str, float]:
+    mort = CsvTable(index_cols=['age'], csv=synthetic_mortality())
+    select = CsvTable(index_cols=['age', 'term'], csv=synthetic_select_table())
+    mort_df = mort._df
+    select_df = select._df
+    ages = np.random.default_rng(0).integers(16, 131, batch_size)
+
+    results = {
+        'pandas_loc_us': _per_call_us(lambda: mort_df.loc[(65,), 'q_x'], number),
+        'dense_lookup_us': _per_call_us(lambda: mort.lookup({'age': 65}, 'q_x'), number),
+        'pandas_multi_loc_us': _per_call_us(lambda: select_df.loc[(65, 10), 'rate'], number),
+        'hashed_lookup_us': _per_call_us(lambda: select.lookup({'age': 65, 'term': 10}, 'rate'), number),
+        'lookup_many_ns_per_key': _per_call_us(lambda: mort.lookup_many({'age': ages}, 'q_x'), 10) / batch_size * 1e3,
+    }
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in measure_lookup_latency().items():
+        print(f"{name:>24}: {value:,.3f}")
@@ -0,0 +1,40 @@
+"""Calcs taking an alt dimension, for measuring projection cost as the number of combos grows."""
+from src.lib.dimension import Time
+from src.lib.reference import RefData
+from src.lib.registry import register_func_group
+from src.model_dims import Life
+
+
+@register_func_group('fan_out')
+def fund_growth_pm(life: Life):
+    return 0.001 + 0.0001 * life.value
+
+
+@register_func_group('fan_out')
+def policy_year(t: Time):
+    if t == 0:
+        return 0
+    elif t % 12 == 0:
+        return policy_year(t - 1) + 1
+    else:
+        return policy_year(t - 1)
+
+
+@register_func_group('fan_out')
+def survival(t: Time, data: RefData, life: Life):
+    if t == 0:
+        return 1.0
+    q_x = data.tables['mort_table'].lookup({'age': data.policy_values['init_age'] + policy_year(t - 1)}, 'q_x')
+    return survival(t - 1, data, life) * (1 - q_x) ** (1 / 12)
+
+
+@register_func_group('fan_out')
+def fund_value(t: Time, data: RefData, life: Life):
+    if t == 0:
+        return data.policy_values['sum_assured']
+    return fund_value(t - 1, data, life) * (1 + fund_growth_pm(life))
+
+
+@register_func_group('fan_out')
+def expected_fund(t: Time, data: RefData, life: Life):
+    return fund_value(t, data, life) * survival(t, data, life)
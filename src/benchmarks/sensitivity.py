@@ -0,0 +1,51 @@
+"""Cost of a discount-rate sensitivity rerun with IncrementalProjection against a full rerun.
+
+Run from the repository root with ``python -m src.benchmarks.sensitivity``.
+"""
+import time
+
+from src.benchmarks.lookup import synthetic_mortality
+from src.lib.dimension import DimProjection
+from src.lib.incremental import IncrementalProjection, changes_between
+from src.lib.reference import CsvTable, RefData
+from src.lib.registry import CalcModule, CalcRegistry, FunctionPriority
+
+
+def _model_points(num_policies: int, mort_table: CsvTable, disc_rate_pm: float) -> list[RefData]:
+    return [RefData(policy_values=dict(init_age=30 + i % 40, sum_assured=1_000.0 * (i + 1)),
+                    tables={'mort_table': mort_table}, global_values={'disc_rate_pm': disc_rate_pm})
+            for i in range(num_policies)]
+
+
+def measure_sensitivity(num_policies: int = 100, horizon: int = 240) -> dict[str, float]:
+    dim_projection = DimProjection(range(horizon))
+    registry = (
+        CalcRegistry()
+        .register_modules(CalcModule.from_tuples([('src.model_funcs', FunctionPriority.GENERAL)]))
+        .register_function_groups({'a'})
+    )
+    calcs = registry.create_calculations(dim_projection)
+    mort_table = CsvTable(index_cols=['age'], csv=synthetic_mortality())
+    base = _model_points(num_policies, mort_table, 0.003)
+    shocked = _model_points(num_policies, mort_table, 0.004)
+
+    projection = IncrementalProjection(calcs, dim_projection, registry.dependency_graph)
+    start = time.perf_counter()
+    projection.run(base)
+    full_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    projection.recalculate(shocked, changes_between(base[0], shocked[0]))
+    incremental_s = time.perf_counter() - start
+
+    return {
+        'full_run_s': full_s,
+        'incremental_run_s': incremental_s,
+        'recalculated_calcs': len(projection.recalculated),
+        'total_calcs': len(calcs),
+    }
+
+
+if __name__ == "__main__":
+    for name, value in measure_sensitivity().items():
+        print(f"{name:>20}: {value:,.3f}")
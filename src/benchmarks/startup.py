@@ -0,0 +1,107 @@
+"""Per-partition startup cost of building calcs from the registry against loading a precompiled CalcPlan,
+and time to first calc in a fresh process.
+
+Run from the repository root with ``python -m src.benchmarks.startup``.
+"""
+import pickle
+import subprocess
+import sys
+import tempfile
+import timeit
+from typing import Optional
+
+from src.lib.dimension import DimProjection
+from src.lib.execution import CallPlans
+from src.lib.registry import CalcModule, CalcRegistry, FunctionPriority
+
+
+def _build_from_registry(dim_projection: DimProjection) -> CallPlans:
+    registry = (
+        CalcRegistry()
+        .register_modules(CalcModule.from_tuples([('src.model_funcs', FunctionPriority.GENERAL)]))
+        .register_function_groups({'a'})
+    )
+    calcs = registry.create_calculations(dim_projection)
+    return CallPlans(calcs, registry.dependency_graph)
+
+
+def _per_call_ms(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e3
+
+
+# Imports the engine, builds the model and projects one model point against an ArrayTable, so pandas is
+# only paid for if something on the path still imports it
+_FIRST_CALC_SCRIPT = """
+import time
+start = time.perf_counter()
+import sys
+import numpy as np
+from src.lib.dimension import DimProjection
+from src.lib.execution import run_calcs
+from src.lib.reference import ArrayTable, RefData
+from src.lib.registry import CalcModule, CalcRegistry, FunctionPriority
+from src.lib.results import MemoryWriter, ResultHandler
+
+dim_projection = DimProjection(range(0, 10))
+registry = (
+    CalcRegistry(sys.argv[1] if len(sys.argv) > 1 else None)
+    .register_modules(CalcModule.from_tuples([('src.model_funcs', FunctionPriority.GENERAL)]))
+    .register_function_groups({'a'})
+)
+calcs = registry.create_calculations(dim_projection)
+ages = np.arange(16, 131)
+mort_table = ArrayTable(['age'], {'age': ages}, {'q_x': np.minimum(0.0005 * np.exp(0.08 * (ages - 16)), 1.0)})
+data = RefData(policy_values=dict(init_age=40, sum_assured=100_000.0), tables={'mort_table': mort_table},
+               global_values={'disc_rate_pm': 0.003})
+with ResultHandler(size=2, writer=MemoryWriter()) as result_handler:
+    run_calcs(calcs, [data], dim_projection, result_handler, registry.dependency_graph)
+print((time.perf_counter() - start) * 1e3, 'pandas' in sys.modules)
+"""
+
+
+def _first_calc_ms(discovery_cache: Optional[str], repeat: int) -> tuple[float, bool]:
+    runs = []
+    for _ in range(repeat):
+        args = [sys.executable, '-c', _FIRST_CALC_SCRIPT] + ([discovery_cache] if discovery_cache else [])
+        output = subprocess.run(args, capture_output=True, text=True, check=True).stdout.split()
+        runs.append((float(output[0]), output[1] == 'True'))
+    return min(runs)
+
+
+def measure_time_to_first_calc(repeat: int = 5) -> dict[str, float]:
+    """Milliseconds from the first import to the first projected model point, in fresh processes."""
+    cold_ms, imports_pandas = _first_calc_ms(None, repeat)
+    with tempfile.TemporaryDirectory() as discovery_cache:
+        # Populates the on-disk discovery cache for the timed runs
+        _first_calc_ms(discovery_cache, 1)
+        cached_ms, _ = _first_calc_ms(discovery_cache, repeat)
+    return {
+        'first_calc_ms': cold_ms,
+        'first_calc_disk_discovery_ms': cached_ms,
+        'imports_pandas': float(imports_pandas),
+    }
+
+
+def measure_startup(number: int = 50) -> dict[str, float]:
+    dim_projection = DimProjection(range(0, 10))
+    plan = (
+        CalcRegistry()
+        .register_modules(CalcModule.from_tuples([('src.model_funcs', FunctionPriority.GENERAL)]))
+        .register_function_groups({'a'})
+    ).compile_plan(dim_projection)
+    payload = pickle.dumps(plan)
+
+    return {
+        'plan_bytes': len(payload),
+        'registry_build_ms': _per_call_ms(lambda: _build_from_registry(dim_projection), number),
+        # A fresh unpickled plan has no memoized fingerprint, as on a worker seeing its first partition
+        'plan_cold_load_ms': _per_call_ms(lambda: CallPlans(pickle.loads(payload).create_calculations(),
+                                                            plan.graph), number),
+        'plan_warm_load_ms': _per_call_ms(lambda: pickle.loads(payload).load(), number),
+        **measure_time_to_first_calc(),
+    }
+
+
+if __name__ == "__main__":
+    for name, value in measure_startup().items():
+        print(f"{name:>30}: {value:,.3f}")
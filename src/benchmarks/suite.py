@@ -0,0 +1,262 @@
+"""Benchmark suite for the projection engine and reference lookups, on synthetic policies and mortality.
+
+Every measurement is written to one JSON file, with the version and machine it ran on, so runs from
+different versions can be compared. Run from the repository root with
+``python -m src.benchmarks.suite --output results.json``, adding ``--baseline previous.json`` to report
+metrics that regressed against an earlier run.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections.abc import Callable, Sequence
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from src.benchmarks.dimension import measure_dimension_cost
+from src.benchmarks.lookup import measure_lookup_latency, synthetic_mortality
+from src.benchmarks.sensitivity import measure_sensitivity
+from src.benchmarks.startup import measure_startup
+from src.lib.calculation import Calc
+from src.lib.dimension import DimProjection
+from src.lib.execution import run_calcs
+from src.lib.fused import FusedPlans, run_fused
+from src.lib.policies import model_points_from_columns
+from src.lib.reference import CsvTable, RefData
+from src.lib.registry import CalcModule, CalcRegistry, FunctionPriority
+from src.lib.results import MemoryWriter, NpyWriter, ResultHandler
+from src.lib.scheduler import CalcGraph
+from src.model_dims import Life
+
+HORIZONS = (10, 60, 120, 360, 600, 1_200)
+FAN_OUTS = (1, 4, 16, 64)
+# Metric name suffixes where a larger value is a regression, and those where a smaller value is
+_LOWER_IS_BETTER = ('_s', '_ms', '_us', '_ns', '_mib', '_per_step')
+_HIGHER_IS_BETTER = ('_per_s',)
+
+
+def synthetic_policies(num_policies: int, seed: int = 0) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return {
+        'init_age': rng.integers(20, 71, num_policies),
+        'sum_assured': rng.uniform(10_000, 500_000, num_policies).round(2),
+    }
+
+
+def _model_points(policies: dict[str, np.ndarray], mort_table: CsvTable) -> list[RefData]:
+    return list(model_points_from_columns(policies, {'mort_table': mort_table}, {'disc_rate_pm': 0.003}))
+
+
+def _create_calcs(module: str, group: str, dim_projection: DimProjection) -> tuple[list[Calc], CalcGraph]:
+    registry = (
+        CalcRegistry()
+        .register_modules(CalcModule.from_tuples([(module, FunctionPriority.GENERAL)]))
+        .register_function_groups({group})
+    )
+    calcs = registry.create_calculations(dim_projection)
+    return calcs, registry.dependency_graph
+
+
+def _project(calcs: list[Calc], graph: CalcGraph, model_points: list[RefData],
+             dim_projection: DimProjection) -> tuple[float, int]:
+    writer = MemoryWriter()
+    start = time.perf_counter()
+    with ResultHandler(size=2, writer=writer) as result_handler:
+        run_calcs(calcs, model_points, dim_projection, result_handler, graph)
+    return time.perf_counter() - start, result_handler.rows_written
+
+
+def measure_plan_build(number: int = 20) -> dict[str, float]:
+    builds = {
+        'create_calculations_t120_ms': ('src.model_funcs', 'a', DimProjection(range(120))),
+        'create_calculations_t1200_ms': ('src.model_funcs', 'a', DimProjection(range(1_200))),
+        'create_calculations_64_combos_ms': ('src.benchmarks.model', 'fan_out',
+                                             DimProjection(range(120), {Life: range(64)})),
+    }
+    # The fastest build is the least disturbed by other load on the machine
+    return {metric: min(timeit.repeat(lambda: _create_calcs(*args), number=1, repeat=number)) * 1e3
+            for metric, args in builds.items()}
+
+
+def measure_horizons(num_policies: int = 20, horizons: Sequence[int] = HORIZONS) -> dict[str, float]:
+    mort_table = CsvTable(index_cols=['age'], csv=synthetic_mortality(max_age=250))
+    model_points = _model_points(synthetic_policies(num_policies), mort_table)
+    results = {}
+    for horizon in horizons:
+        dim_projection = DimProjection(range(horizon))
+        calcs, graph = _create_calcs('src.model_funcs', 'a', dim_projection)
+        seconds, rows = _project(calcs, graph, model_points, dim_projection)
+        results[f't{horizon}_per_policy_ms'] = seconds / num_policies * 1e3
+        results[f't{horizon}_rows_per_s'] = rows / seconds
+    return results
+
+
+def measure_fan_out(num_policies: int = 5, horizon: int = 120,
+                    fan_outs: Sequence[int] = FAN_OUTS) -> dict[str, float]:
+    mort_table = CsvTable(index_cols=['age'], csv=synthetic_mortality(max_age=250))
+    model_points = _model_points(synthetic_policies(num_policies), mort_table)
+    results = {}
+    for num_lives in fan_outs:
+        dim_projection = DimProjection(range(horizon), {Life: range(num_lives)})
+        calcs, graph = _create_calcs('src.benchmarks.model', 'fan_out', dim_projection)
+        seconds, _ = _project(calcs, graph, model_points, dim_projection)
+        results[f'combos{num_lives}_per_policy_ms'] = seconds / num_policies * 1e3
+        results[f'combos{num_lives}_per_combo_ms'] = seconds / num_policies / num_lives * 1e3
+    return results
+
+
+def measure_fused(num_policies: int = 200, horizon: int = 360) -> dict[str, float]:
+    mort_table = CsvTable(index_cols=['age'], csv=synthetic_mortality(max_age=250))
+    model_points = _model_points(synthetic_policies(num_policies), mort_table)
+    dim_projection = DimProjection(range(horizon))
+    calcs, graph = _create_calcs('src.model_funcs', 'a', dim_projection)
+    fused = FusedPlans(calcs, graph)
+
+    start = time.perf_counter()
+    with ResultHandler(size=2, writer=MemoryWriter()) as result_handler:
+        run_fused(fused, model_points, dim_projection, result_handler, verify=0)
+    seconds = time.perf_counter() - start
+    return {
+        f't{horizon}_per_policy_ms': seconds / num_policies * 1e3,
+        f't{horizon}_rows_per_s': result_handler.rows_written / seconds,
+        'uses_numba': float(fused.uses_numba),
+    }
+
+
+def measure_memory(num_policies: int = 10, horizon: int = 360) -> dict[str, float]:
+    mort_table = CsvTable(index_cols=['age'], csv=synthetic_mortality(max_age=250))
+    model_points = _model_points(synthetic_policies(num_policies), mort_table)
+    dim_projection = DimProjection(range(horizon))
+    calcs, graph = _create_calcs('src.model_funcs', 'a', dim_projection)
+
+    tracemalloc.start()
+    _project(calcs, graph, model_points, dim_projection)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_bytes = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return {
+        f't{horizon}_peak_traced_mib': peak / 2 ** 20,
+        'process_max_rss_mib': max_rss_bytes / 2 ** 20,
+    }
+
+
+def measure_write_throughput(num_rows: int = 2_000_000, num_cols: int = 10,
+                             rows_per_call: int = 1_200) -> dict[str, float]:
+    rng = np.random.default_rng(0)
+    columns = {f'col{i}': rng.random(rows_per_call) for i in range(num_cols)}
+    num_calls = num_rows // rows_per_call
+    row_bytes = num_cols * 8
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for label, writer in (('memory', MemoryWriter()), ('npy', NpyWriter(directory))):
+            start = time.perf_counter()
+            with ResultHandler(size=2, writer=writer) as result_handler:
+                for _ in range(num_calls):
+                    result_handler.add_results(columns)
+            seconds = time.perf_counter() - start
+            results[f'{label}_rows_per_s'] = num_calls * rows_per_call / seconds
+            results[f'{label}_mib_per_s'] = num_calls * rows_per_call * row_bytes / seconds / 2 ** 20
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[], dict[str, float]]] = {
+    'plan_build': measure_plan_build,
+    'startup': measure_startup,
+    'lookup': measure_lookup_latency,
+    'horizons': measure_horizons,
+    'fan_out': measure_fan_out,
+    'fused': measure_fused,
+    'memory': measure_memory,
+    'write_throughput': measure_write_throughput,
+    'dimension': measure_dimension_cost,
+    'sensitivity': measure_sensitivity,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True)
+        return completed.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment() -> dict[str, Any]:
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_suite(names: Optional[Sequence[str]] = None) -> dict[str, Any]:
+    unknown = set(names or ()) - BENCHMARKS.keys()
+    if unknown:
+        raise KeyError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        if names is None or name in names:
+            results[name] = {metric: float(value) for metric, value in benchmark().items()}
+    return {'environment': _environment(), 'results': results}
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], tolerance: float = 0.1) -> list[str]:
+    """Describe each metric in both runs that is worse in current by more than tolerance, as a fraction."""
+    regressions = []
+    for name, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            previous = baseline['results'].get(name, {}).get(metric)
+            if not previous:
+                continue
+            change = value / previous - 1
+            if metric.endswith(_HIGHER_IS_BETTER):
+                change = -change
+            elif not metric.endswith(_LOWER_IS_BETTER):
+                continue
+            if change > tolerance:
+                regressions.append(f'{name}.{metric}: {previous:,.3f} -> {value:,.3f} ({change:+.0%} worse)')
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', type=Path, default=Path('benchmark-results.json'))
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='Benchmarks to run, defaulting to all')
+    parser.add_argument('--baseline', type=Path, help='Earlier results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.only)
+    args.output.write_text(json.dumps(report, indent=2))
+    for name, metrics in report['results'].items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f"{metric:>36}: {value:,.3f}")
+
+    if args.baseline is not None:
+        regressions = compare(json.loads(args.baseline.read_text()), report, args.tolerance)
+        for regression in regressions:
+            print(f'Regression in {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
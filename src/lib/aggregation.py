@@ -0,0 +1,197 @@
+import math
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from src.lib.calculation import Calc
+from src.lib.results import ResultWriter
+
+# Groups results by the function group of the calc that produced them, rather than by a policy value
+CALC_GROUP = 'group_name'
+
+_STATS = ('sum', 'mean', 'min', 'max')
+
+
+@dataclass(frozen=True)
+class Aggregation:
+    """Statistics of result columns over the rows sharing a t and the values of the ``by`` columns.
+
+    ``by`` names policy values written with each row, and may include CALC_GROUP to group each column by
+    its calc's group_name instead.
+    """
+    values: tuple[str, ...]
+    by: tuple[str, ...] = ()
+    stats: tuple[str, ...] = ('sum',)
+
+    def __post_init__(self):
+        unknown = [stat for stat in self.stats if stat not in _STATS]
+        if unknown:
+            raise ValueError(f"Unknown statistics {', '.join(unknown)}, expected some of {', '.join(_STATS)}")
+        if not self.values or not self.stats:
+            raise ValueError('An aggregation needs at least one value column and statistic')
+
+    @property
+    def policy_columns(self) -> tuple[str, ...]:
+        """Policy values that must be written with each row for the aggregation to group by them."""
+        return tuple(col for col in self.by if col != CALC_GROUP)
+
+    @staticmethod
+    def column_name(value: str, stat: str) -> str:
+        return f'{value}[{stat}]'
+
+
+def calc_groups(calcs: Iterable[Calc]) -> dict[str, str]:
+    """Group name of each calc's results, for aggregations by CALC_GROUP."""
+    return {calc.name: calc.group_name for calc in calcs}
+
+
+class GroupedTotals(ResultWriter):
+    """Streaming group-by of results, reducing each batch as the ResultHandler writes it.
+
+    Holds a sum, count, minimum and maximum per group, t and value column, so memory grows with the number
+    of groups rather than of policies, and totals from other workers can be merged before taking result().
+    """
+
+    def __init__(self, aggregation: Aggregation, t_values: Iterable, groups: Optional[Mapping[str, str]] = None):
+        self.aggregation: Aggregation = aggregation
+        self._t_values: np.ndarray = np.asarray(list(t_values))
+        self._t_order: np.ndarray = np.argsort(self._t_values, kind='stable')
+        self._value_groups: dict[str, Optional[str]] = {value: None for value in aggregation.values}
+        if CALC_GROUP in aggregation.by:
+            if groups is None:
+                raise ValueError('Grouping by calc group needs the group name of each calc')
+            for value in aggregation.values:
+                # Scenario reducer columns such as name[mean] and alt dimension combos belong to their calc's group
+                calc_name = value.partition('[')[0]
+                group = groups.get(value, groups.get(calc_name, groups.get(calc_name.partition('(')[0].strip())))
+                if group is None:
+                    raise KeyError(f'No calc group is known for {value}')
+                self._value_groups[value] = group
+
+        self._keys: dict[tuple, int] = {}
+        num_t = len(self._t_values)
+        self._sum = {value: np.zeros((0, num_t)) for value in aggregation.values}
+        self._count = {value: np.zeros((0, num_t), dtype=np.int64) for value in aggregation.values}
+        self._min = {value: np.full((0, num_t), np.inf) for value in aggregation.values}
+        self._max = {value: np.full((0, num_t), -np.inf) for value in aggregation.values}
+
+    @property
+    def num_groups(self) -> int:
+        return len(self._keys)
+
+    def _grow(self, num_groups: int):
+        capacity = len(next(iter(self._sum.values())))
+        if num_groups <= capacity:
+            return
+        extra = max(num_groups, 2 * capacity) - capacity
+        num_t = len(self._t_values)
+        for value in self.aggregation.values:
+            self._sum[value] = np.concatenate([self._sum[value], np.zeros((extra, num_t))])
+            self._count[value] = np.concatenate([self._count[value], np.zeros((extra, num_t), dtype=np.int64)])
+            self._min[value] = np.concatenate([self._min[value], np.full((extra, num_t), np.inf)])
+            self._max[value] = np.concatenate([self._max[value], np.full((extra, num_t), -np.inf)])
+
+    def _group_index(self, key: tuple) -> int:
+        index = self._keys.get(key)
+        if index is None:
+            index = self._keys[key] = len(self._keys)
+            self._grow(len(self._keys))
+        return index
+
+    def _steps(self, t: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self._t_values, t, sorter=self._t_order)
+        steps = self._t_order[np.minimum(positions, len(self._t_values) - 1)]
+        if not np.array_equal(self._t_values[steps], t):
+            raise ValueError('Results hold t values outside the aggregation t range')
+        return steps
+
+    def write(self, batch: dict[str, np.ndarray]):
+        if 't' not in batch:
+            raise KeyError('Results must hold a t column to be aggregated')
+        num_rows = len(batch['t'])
+        if num_rows == 0:
+            return
+        steps = self._steps(batch['t'])
+
+        # Rows are grouped by their combination of policy key values, found once per batch
+        policy_columns = self.aggregation.policy_columns
+        if policy_columns:
+            missing = [col for col in policy_columns if col not in batch]
+            if missing:
+                raise KeyError(f"Results do not hold policy columns {', '.join(missing)} to aggregate by")
+            uniques, codes = zip(*(np.unique(batch[col], return_inverse=True) for col in policy_columns))
+            combos, combo_of_row = np.unique(np.stack([code.ravel() for code in codes], axis=1), axis=0,
+                                             return_inverse=True)
+            unique_values = [unique.tolist() for unique in uniques]
+            combo_keys = [tuple(values[code] for values, code in zip(unique_values, combo)) for combo in combos]
+            combo_of_row = combo_of_row.ravel()
+        else:
+            combo_keys = [()]
+            combo_of_row = np.zeros(num_rows, dtype=np.intp)
+
+        for value in self.aggregation.values:
+            if value not in batch:
+                raise KeyError(f'Results do not hold a {value} column to aggregate')
+            group = self._value_groups[value]
+            prefix = () if group is None else (group,)
+            group_of_combo = np.array([self._group_index(prefix + key) for key in combo_keys], dtype=np.intp)
+            cells = group_of_combo[combo_of_row] * len(self._t_values) + steps
+            values = np.asarray(batch[value], dtype=np.float64)
+
+            shape = self._sum[value].shape
+            self._sum[value] += np.bincount(cells, weights=values, minlength=math.prod(shape)).reshape(shape)
+            self._count[value] += np.bincount(cells, minlength=math.prod(shape)).reshape(shape)
+            np.minimum.at(self._min[value].reshape(-1), cells, values)
+            np.maximum.at(self._max[value].reshape(-1), cells, values)
+
+    def merge(self, other: 'GroupedTotals'):
+        """Add the totals of another worker, aggregated over the same t range."""
+        if other.aggregation != self.aggregation or not np.array_equal(other._t_values, self._t_values):
+            raise ValueError('Cannot merge totals of a different aggregation or t range')
+        for key, other_index in other._keys.items():
+            index = self._group_index(key)
+            for value in self.aggregation.values:
+                self._sum[value][index] += other._sum[value][other_index]
+                self._count[value][index] += other._count[value][other_index]
+                np.minimum(self._min[value][index], other._min[value][other_index], out=self._min[value][index])
+                np.maximum(self._max[value][index], other._max[value][other_index], out=self._max[value][index])
+
+    def _ordered_keys(self) -> list[tuple]:
+        try:
+            return sorted(self._keys)
+        except TypeError:
+            return list(self._keys)
+
+    def result(self) -> dict[str, np.ndarray]:
+        """One row per group and t, holding the key columns, calc group first, then t and a ``value[stat]``
+        column per statistic.
+
+        Statistics of a value with no rows in a group, as when grouping by calc group, are NaN, or 0 for sums.
+        """
+        keys = self._ordered_keys()
+        indices = np.array([self._keys[key] for key in keys], dtype=np.intp)
+        num_t = len(self._t_values)
+        key_columns = self.aggregation.policy_columns
+        if CALC_GROUP in self.aggregation.by:
+            key_columns = (CALC_GROUP, *key_columns)
+        columns: dict[str, Any] = {col: np.repeat(np.array([key[position] for key in keys]), num_t)
+                                   for position, col in enumerate(key_columns)}
+        columns['t'] = np.tile(self._t_values, len(keys))
+
+        for value in self.aggregation.values:
+            count = self._count[value][indices].ravel()
+            empty = count == 0
+            for stat in self.aggregation.stats:
+                if stat == 'sum':
+                    reduced = self._sum[value][indices].ravel()
+                elif stat == 'mean':
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        reduced = self._sum[value][indices].ravel() / count
+                elif stat == 'min':
+                    reduced = np.where(empty, math.nan, self._min[value][indices].ravel())
+                else:
+                    reduced = np.where(empty, math.nan, self._max[value][indices].ravel())
+                columns[Aggregation.column_name(value, stat)] = reduced
+        return columns
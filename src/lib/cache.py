@@ -0,0 +1,254 @@
+import functools
+import inspect
+from collections import defaultdict, deque
+from collections.abc import Callable, Collection, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, replace
+from typing import Any, Optional
+
+from src.lib.profiling import _active_profiler
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    size: int
+    # Lookups of whole result vectors in a persistent ResultStore
+    stored_hits: int = 0
+    stored_misses: int = 0
+
+    @property
+    def stored_hit_rate(self) -> Optional[float]:
+        lookups = self.stored_hits + self.stored_misses
+        return self.stored_hits / lookups if lookups else None
+
+
+class _Column:
+    """Results of one calc and alt dimension combo, addressed by integer t offset from the first stored t."""
+
+    def __init__(self):
+        self._start: int = 0
+        self._values: deque = deque()
+        self._other: dict[Any, Any] = {}
+        self.size: int = 0
+
+    @classmethod
+    def from_values(cls, start: int, values: Sequence) -> '_Column':
+        """Column holding values for consecutive t from start."""
+        column = cls()
+        column._start = start
+        column._values = deque(values)
+        column.size = len(column._values)
+        return column
+
+    def get(self, t: Any) -> Any:
+        if isinstance(t, int):
+            index = t - self._start
+            if 0 <= index < len(self._values):
+                return self._values[index]
+        return self._other.get(t, _MISSING)
+
+    def set(self, t: Any, value: Any):
+        if isinstance(t, int):
+            if not self._values:
+                self._start = t
+            index = t - self._start
+            if 0 <= index < len(self._values):
+                self.size += self._values[index] is _MISSING
+                self._values[index] = value
+                return
+            elif index >= len(self._values):
+                self._values.extend([_MISSING] * (index - len(self._values)))
+                self._values.append(value)
+                self.size += 1
+                return
+        self.size += t not in self._other
+        self._other[t] = value
+
+    def drop_before(self, t: int):
+        while self._values and self._start < t:
+            self.size -= self._values.popleft() is not _MISSING
+            self._start += 1
+        for key in [key for key in self._other if isinstance(key, int) and key < t]:
+            del self._other[key]
+            self.size -= 1
+
+
+class CalcCache:
+    """Calc results for one model point at a time, cleared explicitly between model points.
+
+    Values are held per calc and alt dimension combo in columns indexed by t. Hit and miss counts
+    accumulate for the lifetime of the cache so one instance can report on a whole run.
+    """
+
+    def __init__(self, windows: Optional[dict[str, Optional[int]]] = None):
+        self._windows: dict[str, Optional[int]] = windows or {}
+        self._columns: dict[tuple[str, tuple], _Column] = {}
+        self._shared: dict[tuple[str, tuple], _Column] = {}
+        self._hits: dict[str, int] = defaultdict(int)
+        self._misses: dict[str, int] = defaultdict(int)
+        self._model_point: Any = None
+        self._tokens: list[Token] = []
+
+    @property
+    def model_point(self) -> Any:
+        return self._model_point
+
+    def bind(self, model_point: Any, shared: Optional[dict[tuple[str, tuple], _Column]] = None):
+        """Start caching for model_point, serving any shared columns alongside its own values.
+
+        Shared columns hold results that are the same for every model point. They are only read, so one
+        set can back the caches of many model points.
+        """
+        self.clear()
+        self._model_point = model_point
+        self._shared = shared or {}
+        profiler = _active_profiler.get()
+        if profiler is not None:
+            profiler.name_tables(getattr(model_point, 'tables', None))
+
+    def clear(self):
+        self._columns.clear()
+        self._shared = {}
+        self._model_point = None
+
+    @contextmanager
+    def scope(self, model_point: Any) -> Iterator['CalcCache']:
+        self.bind(model_point)
+        try:
+            with self:
+                yield self
+        finally:
+            self.clear()
+
+    def __enter__(self) -> 'CalcCache':
+        self._tokens.append(_active_cache.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _active_cache.reset(self._tokens.pop())
+
+    def get(self, name: str, combo: tuple, t: Any) -> Any:
+        column = self._columns.get((name, combo))
+        value = _MISSING if column is None else column.get(t)
+        if value is _MISSING and self._shared:
+            column = self._shared.get((name, combo))
+            value = _MISSING if column is None else column.get(t)
+        if value is _MISSING:
+            self._misses[name] += 1
+        else:
+            self._hits[name] += 1
+        return value
+
+    def set(self, name: str, combo: tuple, t: Any, value: Any):
+        column = self._columns.get((name, combo))
+        if column is None:
+            column = self._columns[(name, combo)] = _Column()
+        column.set(t, value)
+
+    def columns(self, names: Collection[str]) -> dict[tuple[str, tuple], _Column]:
+        """Cached columns of the named calcs, by calc name and alt dimension combo."""
+        return {key: column for key, column in self._columns.items() if key[0] in names}
+
+    def evict(self, t: int):
+        """Drop values that fall outside each calc's lag window once step t is complete."""
+        for (name, _), column in self._columns.items():
+            window = self._windows.get(name, _MISSING)
+            if window is not _MISSING and window is not None:
+                column.drop_before(t - window + 1)
+
+    def size(self, name: Optional[str] = None) -> int:
+        return sum(column.size for (col_name, _), column in self._columns.items() if name in (None, col_name))
+
+    def stats(self, name: Optional[str] = None) -> CacheStats:
+        if name is None:
+            return CacheStats(sum(self._hits.values()), sum(self._misses.values()), self.size())
+        return CacheStats(self._hits[name], self._misses[name], self.size(name))
+
+
+_active_cache: ContextVar[Optional[CalcCache]] = ContextVar('_active_cache', default=None)
+
+
+def active_cache() -> Optional[CalcCache]:
+    return _active_cache.get()
+
+
+class CachedFunction:
+    """Wraps a calc function so that calls are memoised in the active CalcCache.
+
+    Calls made with no active cache open a temporary one for the duration of the outermost call,
+    so recursion stays memoised without results outliving the call.
+    """
+
+    def __init__(self, func: Callable, name: str, t_arg: Optional[str], data_arg: Optional[str],
+                 params: Optional[Sequence[str]] = None):
+        functools.update_wrapper(self, func)
+        self._func: Callable = func
+        self._name: str = name
+        self._params: list[str] = list(params) if params is not None else list(inspect.signature(func).parameters)
+        self._t_arg: Optional[str] = t_arg
+        self._data_arg: Optional[str] = data_arg
+        self._last_cache: Optional[CalcCache] = None
+        self._stored_hits: int = 0
+        self._stored_misses: int = 0
+
+    def _bind(self, args: tuple, kwargs: dict[str, Any]) -> tuple[Any, Any, tuple]:
+        bound = dict(zip(self._params, args))
+        bound.update(kwargs)
+        t = bound.get(self._t_arg)
+        combo = tuple(sorted((name, value) for name, value in bound.items()
+                             if name != self._t_arg and name != self._data_arg))
+        return getattr(t, 'value', t), bound.get(self._data_arg), combo
+
+    def __call__(self, *args, **kwargs):
+        t, data, combo = self._bind(args, kwargs)
+        cache = _active_cache.get()
+        if cache is None:
+            with CalcCache().scope(data) as cache:
+                return self._call_cached(cache, t, data, combo, args, kwargs)
+        return self._call_cached(cache, t, data, combo, args, kwargs)
+
+    def _call_cached(self, cache: CalcCache, t: Any, data: Any, combo: tuple, args: tuple, kwargs: dict):
+        if self._data_arg is not None and data is not cache.model_point:
+            raise ValueError(f'{self._name} called with a different model point to the one its cache is bound to')
+
+        self._last_cache = cache
+        profiler = _active_profiler.get()
+        if profiler is not None:
+            return profiler.profile_call(self._name, self._get_or_compute, cache, t, combo, args, kwargs)
+
+        value = cache.get(self._name, combo, t)
+        if value is _MISSING:
+            value = self._func(*args, **kwargs)
+            cache.set(self._name, combo, t, value)
+        return value
+
+    def _get_or_compute(self, cache: CalcCache, t: Any, combo: tuple, args: tuple, kwargs: dict) -> tuple[Any, bool]:
+        value = cache.get(self._name, combo, t)
+        if value is not _MISSING:
+            return value, True
+        value = self._func(*args, **kwargs)
+        cache.set(self._name, combo, t, value)
+        return value, False
+
+    def record_stored_lookups(self, hits: int, misses: int):
+        self._stored_hits += hits
+        self._stored_misses += misses
+
+    def cache_info(self) -> Optional[CacheStats]:
+        """Statistics from the active cache, or from the last cache this function was called with.
+
+        Lookups made in a persistent ResultStore are counted for the lifetime of the function.
+        """
+        cache = _active_cache.get() or self._last_cache
+        if cache is None and not (self._stored_hits or self._stored_misses):
+            return None
+        stats = cache.stats(self._name) if cache is not None else CacheStats(0, 0, 0)
+        return replace(stats, stored_hits=self._stored_hits, stored_misses=self._stored_misses)
+
+    def __repr__(self):
+        return f'CachedFunction({self._name})'
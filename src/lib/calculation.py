@@ -1,12 +1,13 @@
 import functools
 import inspect
-from collections.abc import Callable
-from dataclasses import dataclass
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, replace
 from enum import Enum
 from typing import NewType, Optional
 
-from src.lib.dimension import DimProjection, _AltDimensionDict, Time, AltDimension, Dimension
-from src.lib.reference import RefData
+from src.lib.dimension import (AltDimCombos, DimProjection, _AltDimensionDict, AltDimension, Dimension,
+                               ScenarioDimension)
+from src.lib.discovery import signature_of
 from src.lib.types import FunctionDetails
 
 TimeArgName = NewType('TimeArgName', str)
@@ -55,11 +56,51 @@ class Calc:
     data_arg: Optional[RefDataArgName]
     group_name: str
     origin_module: str
+    # Alt dimension argument names, in combo order, and the combos this calc runs over. Bound combo by combo
+    # as the calc runs, so a large combo space costs nothing until it is used.
+    dim_args: tuple[str, ...] = ()
+    combos: Optional[AltDimCombos] = None
 
     @property
     def t_dependent(self):
         return self.t_arg is not None
 
+    @property
+    def num_combos(self) -> int:
+        return 1 if self.combos is None else len(self.combos)
+
+    def combo_kwargs(self, combo: tuple[AltDimension, ...]) -> dict[str, AltDimension]:
+        return dict(zip(self.dim_args, combo))
+
+    @property
+    def scenario_arg(self) -> Optional[str]:
+        """Argument receiving the scenario axis, when this calc returns one value per scenario."""
+        if self.combos is None:
+            return None
+        for arg, dim_type in zip(self.dim_args, self.combos.dim_types):
+            if issubclass(dim_type, ScenarioDimension):
+                return arg
+        return None
+
+    def combo_name(self, combo: tuple[AltDimension, ...]) -> str:
+        # The scenario axis is carried in the value rather than the name
+        args_str = ", ".join(f"{arg}={repr(dim.value)}" for arg, dim in zip(self.dim_args, combo)
+                             if not isinstance(dim, ScenarioDimension))
+        return f"{self.name}({args_str})" if args_str else self.name
+
+    def bind(self, combo: tuple[AltDimension, ...]) -> 'Calc':
+        """This calc with its alt dimension arguments fixed to one combo."""
+        func = functools.partial(self.function, **self.combo_kwargs(combo))
+        return replace(self, name=self.combo_name(combo), function=func, dim_args=(), combos=None)
+
+    def bound_calcs(self) -> Iterator['Calc']:
+        """One calc per combo, bound as they are iterated, or just this calc when it takes no alt dimensions."""
+        if self.combos is None:
+            yield self
+            return
+        for combo in self.combos:
+            yield self.bind(combo)
+
     @property
     def original_name(self):
         name, sep, _ = self.name.partition('(')
@@ -92,56 +133,20 @@ class _CalcCreator:
             )
 
         if non_t_dims and dim_ranges.t_range:
-            dim_combinations: list[tuple[AltDimension, ...]] = dim_ranges.create_altdim_combos(non_t_dims.keys())
-            return _CalcCreator._create_partial_applied_calcs(dim_combinations, non_t_dims, template_instance)
+            return [replace(template_instance, dim_args=tuple(non_t_dims.values()),
+                            combos=dim_ranges.create_altdim_combos(non_t_dims.keys()))]
         else:
             return [template_instance]
 
     @staticmethod
-    def _find_dim_data_and_t_args(func: Callable) -> tuple[_AltDimensionDict[str], Optional[TimeArgName], Optional[RefDataArgName]]:
+    def _find_dim_data_and_t_args(func: Callable) -> tuple[_AltDimensionDict[str], Optional[TimeArgName],
+                                                            Optional[RefDataArgName]]:
+        signature = signature_of(func)
+        annotations = inspect.unwrap(func).__annotations__
         dimension_tracker: _AltDimensionDict[str] = _AltDimensionDict[str]()
-        ref_data_name: Optional[RefDataArgName] = None
-        t_arg_name: Optional[TimeArgName] = None
-
-        for param in inspect.signature(func).parameters.values():
-            if issubclass(param.annotation, AltDimension):
-                dimension_tracker[param.annotation] = param.name
-            elif param.annotation == Time:
-                if t_arg_name is None:
-                    t_arg_name = TimeArgName(param.name)
-                else:
-                    raise ValueError('More than 1 Time argument in function')
-            elif param.annotation == RefData:
-                if ref_data_name is None:
-                    ref_data_name = RefDataArgName(param.name)
-                else:
-                    raise ValueError('More than 1 RefData argument in function')
+        for arg in signature.dim_args:
+            dimension_tracker[annotations[arg]] = arg
 
+        t_arg_name = TimeArgName(signature.t_arg) if signature.t_arg is not None else None
+        ref_data_name = RefDataArgName(signature.data_arg) if signature.data_arg is not None else None
         return dimension_tracker, t_arg_name, ref_data_name
-
-    @staticmethod
-    def _create_partial_applied_calcs(dim_combinations: list[tuple[AltDimension, ...]],
-                                      dim_arg_names: _AltDimensionDict[str],
-                                      template: Calc) -> list[Calc]:
-        calcs: list[Calc] = []
-        for combo in dim_combinations:
-            kwargs = {dim_arg_names[type(dim)]: dim for dim in combo}
-
-            partial_func = functools.partial(template.function, **kwargs)
-
-            args_str = ", ".join(f"{dim_arg_names[type(dim)]}={repr(dim.value)}" for dim in combo)
-            combo_name = f"{template.name}({args_str})"
-
-            new_calc = Calc(
-                name=combo_name,
-                function=partial_func,
-                type=template.type,
-                t_arg=template.t_arg,
-                data_arg=template.data_arg,
-                group_name=template.group_name,
-                origin_module=template.origin_module
-            )
-
-            calcs.append(new_calc)
-
-        return calcs
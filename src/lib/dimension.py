@@ -1,102 +1,212 @@
-import itertools
-from abc import ABC
-from dataclasses import dataclass
-from typing import Union, TypeVar, Iterable, Type, Generic, Any, Optional
+import math
+from collections.abc import Callable, Iterator, Sequence
+from dataclasses import FrozenInstanceError
+from typing import TYPE_CHECKING, Union, TypeVar, Iterable, Type, Generic, Any, Optional, ClassVar
 
+import numpy as np
+
+if TYPE_CHECKING:
+    from src.lib.reference import RefData
+
+
+_set_attribute = object.__setattr__
+
+# Integer values in this range share one instance per dimension type, so lagged calls such as t - 1
+# look up an existing instance instead of allocating
+_INTERNED_MIN = -1
+_INTERNED_MAX = 2_048
+
+
+class Dimension:
+    """Immutable named dimension value.
+
+    Equality and ordering against plain values compare the value, and the hash is the hash of the value,
+    so a dimension and its raw value are interchangeable as cache keys. Dimensions of different names are
+    never equal, and combining or ordering them raises ValueError.
+    """
+    __slots__ = ('name', 'value')
 
-@dataclass(frozen=True)
-class Dimension(ABC):
     name: str
     value: Any
 
+    def __init__(self, name: str, value: Any):
+        _set_attribute(self, 'name', name)
+        _set_attribute(self, 'value', value)
+
+    def _with_value(self, value: Any) -> 'Dimension':
+        return Dimension(self.name, value)
+
+    def __setattr__(self, name: str, value: Any):
+        raise FrozenInstanceError(f'cannot assign to field {name!r}')
+
+    def __delattr__(self, name: str):
+        raise FrozenInstanceError(f'cannot delete field {name!r}')
+
+    def __reduce__(self):
+        return Dimension, (self.name, self.value)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(name={self.name!r}, value={self.value!r})'
+
+    def __hash__(self) -> int:
+        return hash(self.value)
+
+    def _other_value(self, other: Any) -> Any:
+        if not isinstance(other, Dimension):
+            return other
+        # Names of the named dimension types are shared strings, so the identity test usually settles it
+        if other.name is not self.name:
+            self._check_equal_name(other)
+        return other.value
+
     # Arithmetic operations
     def __add__(self, other: Union['Dimension', Any]):
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return Dimension(self.name, self.value + other.value)
-        else:
-            return Dimension(self.name, self.value + other)
+        return self._with_value(self.value + self._other_value(other))
 
     def __sub__(self, other: Union['Dimension', Any]):
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return Dimension(self.name, self.value - other.value)
-        else:
-            return Dimension(self.name, self.value - other)
+        return self._with_value(self.value - self._other_value(other))
 
     def __mul__(self, other: Union['Dimension', Any]):
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return Dimension(self.name, self.value * other.value)
-        else:
-            return Dimension(self.name, self.value * other)
+        return self._with_value(self.value * self._other_value(other))
 
     def __truediv__(self, other: Union['Dimension', Any]):
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return Dimension(self.name, self.value / other.value)
-        else:
-            return Dimension(self.name, self.value / other)
+        return self._with_value(self.value / self._other_value(other))
 
     # Comparison operations
     def __eq__(self, other: object) -> bool:
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return self.value == other.value
-        else:
-            return self.value == other
+        if isinstance(other, Dimension) and other.name is not self.name and other.name != self.name:
+            # Unequal rather than an error, so dimensions of different names sharing a value hash can be keys
+            return False
+        return self.value == self._other_value(other)
 
     def __lt__(self, other: Union['Dimension', Any]) -> bool:
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return self.value < other.value
-        return self.value < other
+        return self.value < self._other_value(other)
 
     def __le__(self, other: Union['Dimension', Any]) -> bool:
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return self.value <= other.value
-        return self.value <= other
+        return self.value <= self._other_value(other)
 
     def __gt__(self, other: Union['Dimension', Any]) -> bool:
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return self.value > other.value
-        return self.value > other
+        return self.value > self._other_value(other)
 
     def __ge__(self, other: Union['Dimension', Any]) -> bool:
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return self.value >= other.value
-        return self.value >= other
+        return self.value >= self._other_value(other)
 
     def __mod__(self, other):
-        if isinstance(other, Dimension):
-            self._check_equal_name(other)
-            return self.value % other.value
-        return self.value % other
+        return self.value % self._other_value(other)
 
     def _check_equal_name(self, other: 'Dimension'):
         if self.name != other.name:
             raise ValueError('Trying to perform operation on two different dimensions')
 
 
-class Time(Dimension):
+class _NamedDimension(Dimension):
+    """Dimension whose name is fixed by its type, with small integer values interned per type."""
+    __slots__ = ()
+
+    dim_name: ClassVar[str]
+    _interned: ClassVar[dict[int, '_NamedDimension']]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._interned = {}
+
+    def __new__(cls, value: Any):
+        if type(value) is int and _INTERNED_MIN <= value <= _INTERNED_MAX:
+            instance = cls._interned.get(value)
+            if instance is None:
+                instance = cls._interned[value] = cls._create(value)
+            return instance
+        return cls._create(value)
+
     def __init__(self, value: Any):
-        super().__init__(name='t', value=value)
+        # Fields are set in __new__, so interned instances are returned untouched
+        pass
+
+    @classmethod
+    def _create(cls, value: Any) -> '_NamedDimension':
+        instance = object.__new__(cls)
+        _set_attribute(instance, 'name', cls.dim_name)
+        _set_attribute(instance, 'value', value)
+        return instance
+
+    def _with_value(self, value: Any) -> '_NamedDimension':
+        if type(value) is int:
+            instance = self._interned.get(value)
+            if instance is not None:
+                return instance
+        return type(self)(value)
+
+    # Integer steps are the common case in lagged calls, so they skip the generic operand handling
+    def __add__(self, other: Union['Dimension', Any]):
+        if type(other) is int and type(self.value) is int:
+            instance = self._interned.get(self.value + other)
+            if instance is not None:
+                return instance
+        return super().__add__(other)
+
+    def __sub__(self, other: Union['Dimension', Any]):
+        if type(other) is int and type(self.value) is int:
+            instance = self._interned.get(self.value - other)
+            if instance is not None:
+                return instance
+        return super().__sub__(other)
 
+    def __reduce__(self):
+        return type(self), (self.value,)
 
-class AltDimension(Dimension, ABC):
-    pass
+    def __repr__(self):
+        return f'{type(self).__name__}({self.value!r})'
+
+
+class Time(_NamedDimension):
+    __slots__ = ()
+    dim_name = 't'
+
+
+class AltDimension(_NamedDimension):
+    __slots__ = ()
 
 
 def alt_dimension_type(name: str) -> Type[AltDimension]:
     class _NewAltDimension(AltDimension):
-        def __init__(self, value):
-            super().__init__(name=name, value=value)
+        __slots__ = ()
+        dim_name = name
     return _NewAltDimension
 
 
+class ScenarioDimension(AltDimension):
+    """Alt dimension evaluated as a NumPy axis: a calc receives every scenario at once as an array value.
+
+    Arithmetic and ordering work elementwise on the array. Equality and hashing treat the dimension as a
+    whole, so it can key the calc cache without comparing every scenario.
+    """
+    __slots__ = ()
+
+    @property
+    def num_scenarios(self) -> int:
+        return len(self.value)
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, ScenarioDimension) or other.name != self.name:
+            return False
+        return self.value is other.value or bool(np.array_equal(self.value, other.value))
+
+    def __hash__(self) -> int:
+        return hash((self.name, len(self.value)))
+
+    def __repr__(self):
+        return f'{type(self).__name__}(<{len(self.value)} scenarios>)'
+
+
+def scenario_dimension_type(name: str) -> Type[ScenarioDimension]:
+    class _NewScenarioDimension(ScenarioDimension):
+        __slots__ = ()
+        dim_name = name
+    return _NewScenarioDimension
+
+
 T = TypeVar('T')
 
 
@@ -115,11 +225,107 @@ class _AltDimensionDict(dict[type[AltDimension], T], Generic[T]):
         super().__setitem__(key, value)
 
 
+class AltDimCombos(Sequence[tuple[AltDimension, ...]]):
+    """Lazy sequence of alt dimension combinations, in itertools.product order.
+
+    Combos are decoded from their position on access rather than stored. A sparse or filtered space keeps
+    only the positions of its combos in the full product, so slicing and indexing never build the product.
+    """
+
+    def __init__(self, dim_types: Sequence[Type[AltDimension]], value_ranges: Sequence[Sequence],
+                 positions: Optional[Sequence[int]] = None):
+        self.dim_types: tuple[Type[AltDimension], ...] = tuple(dim_types)
+        self.value_ranges: tuple[Sequence, ...] = tuple(value_ranges)
+        sizes = [len(values) for values in self.value_ranges]
+        self._strides: tuple[int, ...] = tuple(math.prod(sizes[i + 1:]) for i in range(len(sizes)))
+        self.positions: Sequence[int] = positions if positions is not None else range(math.prod(sizes))
+
+    @classmethod
+    def from_values(cls, dim_types: Sequence[Type[AltDimension]], value_ranges: Sequence[Sequence],
+                    combos: Iterable[Sequence]) -> 'AltDimCombos':
+        """Sparse space holding only the given value combos, one value per dimension type."""
+        full = cls(dim_types, value_ranges)
+        offsets = [{value: i for i, value in enumerate(values)} for values in full.value_ranges]
+        try:
+            positions = [sum(offset[value] * stride for offset, value, stride in zip(offsets, combo, full._strides))
+                         for combo in combos]
+        except KeyError as e:
+            raise KeyError(f'Combo value {e.args[0]!r} is not in its dimension range') from None
+        return cls(dim_types, value_ranges, np.unique(np.asarray(positions, dtype=np.int64)))
+
+    def values_at(self, position: int) -> tuple:
+        return tuple(values[(position // stride) % len(values)]
+                     for values, stride in zip(self.value_ranges, self._strides))
+
+    def filter(self, predicate: Callable[[dict[Type[AltDimension], Any]], bool]) -> 'AltDimCombos':
+        """Combos whose values, keyed by dimension type, satisfy predicate."""
+        keep = [position for position in self.positions
+                if predicate(dict(zip(self.dim_types, self.values_at(position))))]
+        return AltDimCombos(self.dim_types, self.value_ranges, np.asarray(keep, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return AltDimCombos(self.dim_types, self.value_ranges, self.positions[index])
+        values = self.values_at(int(self.positions[index]))
+        return tuple(dim_type(value) for dim_type, value in zip(self.dim_types, values))
+
+    def __iter__(self) -> Iterator[tuple[AltDimension, ...]]:
+        for position in self.positions:
+            values = self.values_at(int(position))
+            yield tuple(dim_type(value) for dim_type, value in zip(self.dim_types, values))
+
+    def __repr__(self):
+        names = ', '.join(dim_type.dim_name for dim_type in self.dim_types)
+        return f'AltDimCombos(({names}), {len(self)} combos)'
+
+
 class DimProjection:
-    def __init__(self, t_range: Iterable, non_t_ranges: Optional[dict[Type[AltDimension], Iterable]] = None):
+    """Time range and alt dimension ranges a model is projected over.
+
+    ``combo_filter`` restricts the combos of every calc to those whose values, keyed by dimension type,
+    satisfy it. ``sparse_combos`` declares the exact value combos for a set of dimension types, given in the
+    order of the key, and applies to calcs taking exactly those dimensions.
+
+    At most one ScenarioDimension may be given, with either a scenario count or the scenario values. It is
+    not expanded into combos: calcs taking it run once with all scenarios held in a single array.
+
+    Model points can stop before the end of the t range. ``term`` gives the number of steps each is projected
+    for, as the name of a policy value or a function of the model point. ``run_off`` is called with each
+    step's results, and once it returns True no later step is computed. Rows for steps that are not
+    computed still appear in the results, holding ``padding`` for every calc. For batched model points
+    terms and run-off flags are per policy, and a batch stops once all its policies have.
+    """
+
+    def __init__(self, t_range: Iterable, non_t_ranges: Optional[dict[Type[AltDimension], Iterable]] = None,
+                 combo_filter: Optional[Callable[[dict[Type[AltDimension], Any]], bool]] = None,
+                 sparse_combos: Optional[dict[tuple[Type[AltDimension], ...], Iterable[Sequence]]] = None,
+                 term: Optional[str | Callable[['RefData'], Any]] = None,
+                 run_off: Optional[Callable[[dict[str, Any]], Any]] = None, padding: Any = 0.0):
         self.t_range: Iterable = t_range
-        if non_t_ranges:
-            self._alt_dim_ranges: _AltDimensionDict[Iterable] = _AltDimensionDict(non_t_ranges)
+        self.term: Optional[str | Callable[['RefData'], Any]] = term
+        self.run_off: Optional[Callable[[dict[str, Any]], Any]] = run_off
+        self.padding: Any = padding
+        self._scenario_type: Optional[Type[ScenarioDimension]] = None
+        self._alt_dim_ranges: _AltDimensionDict[Sequence] = _AltDimensionDict()
+        for dim_type, values in (non_t_ranges or {}).items():
+            if issubclass(dim_type, ScenarioDimension):
+                if self._scenario_type is not None:
+                    raise ValueError('Only one scenario dimension can be projected at a time')
+                self._scenario_type = dim_type
+                scenarios = np.arange(values) if isinstance(values, int) else np.asarray(values)
+                # A single point in the combo space that carries every scenario
+                self._alt_dim_ranges[dim_type] = (scenarios,)
+            else:
+                # Ranges are indexed repeatedly when decoding combos, so one-shot iterables are captured once
+                self._alt_dim_ranges[dim_type] = values if isinstance(values, Sequence) else tuple(values)
+        self._combo_filter: Optional[Callable[[dict[Type[AltDimension], Any]], bool]] = combo_filter
+        self._sparse_combos: dict[frozenset, tuple[tuple[Type[AltDimension], ...], list[Sequence]]] = {
+            frozenset(dim_types): (tuple(dim_types), [tuple(combo) for combo in combos])
+            for dim_types, combos in (sparse_combos or {}).items()
+        }
 
     @property
     def altdim_ranges(self) -> dict[Type[AltDimension], Iterable]:
@@ -128,16 +334,41 @@ class DimProjection:
         else:
             return {}
 
-    def create_altdim_combos(self, dimensions: Iterable[Type[AltDimension]]) -> list[tuple[AltDimension, ...]]:
-        if not self._alt_dim_ranges:
-            return []
+    @property
+    def scenario_type(self) -> Optional[Type[ScenarioDimension]]:
+        return self._scenario_type
+
+    @property
+    def num_scenarios(self) -> Optional[int]:
+        if self._scenario_type is None:
+            return None
+        return len(self._alt_dim_ranges[self._scenario_type][0])
+
+    @property
+    def stops_early(self) -> bool:
+        return self.term is not None or self.run_off is not None
 
+    def steps(self, model_point: 'RefData') -> Optional[int | np.ndarray]:
+        """Number of steps model_point is projected for, one per policy for a batch, None for the whole t range."""
+        if self.term is None:
+            return None
+        term = self.term(model_point) if callable(self.term) else model_point.policy_values[self.term]
+        return np.maximum(np.asarray(term), 0).astype(np.int64) if np.ndim(term) > 0 else max(int(term), 0)
+
+    def create_altdim_combos(self, dimensions: Iterable[Type[AltDimension]]) -> AltDimCombos:
         dim_types = list(dimensions)
-        value_ranges = [self._alt_dim_ranges[dim_type] for dim_type in dim_types]
+        if not self._alt_dim_ranges:
+            return AltDimCombos(dim_types, [()] * len(dim_types))
 
-        combinations = []
-        for values in itertools.product(*value_ranges):
-            combo = tuple(dim_type(value) for dim_type, value in zip(dim_types, values))
-            combinations.append(combo)
+        value_ranges = [self._alt_dim_ranges[dim_type] for dim_type in dim_types]
+        sparse = self._sparse_combos.get(frozenset(dim_types))
+        if sparse is not None:
+            declared_types, combos = sparse
+            order = [declared_types.index(dim_type) for dim_type in dim_types]
+            combos = AltDimCombos.from_values(dim_types, value_ranges, ([combo[i] for i in order] for combo in combos))
+        else:
+            combos = AltDimCombos(dim_types, value_ranges)
 
-        return combinations
+        if self._combo_filter is not None:
+            combos = combos.filter(self._combo_filter)
+        return combos
@@ -0,0 +1,213 @@
+"""Discovery of calc functions in modules, cached per module version in memory and optionally on disk.
+
+Discovering a module means finding its functions and their groups, analysing each grouped function's
+signature, and parsing its source for dependency tracing. The results only change when the module file
+does, so they are kept per module version and reused by every later registry in the process, and by
+later processes when a cache directory is given.
+"""
+import ast
+import importlib
+import inspect
+import os
+import pickle
+import sys
+import textwrap
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Optional
+
+from src.lib.dimension import AltDimension, Time
+from src.lib.reference import RefData
+
+
+@dataclass(frozen=True)
+class FunctionSignature:
+    """Parameter names of a calc function and the roles of its Time, RefData and alt dimension arguments."""
+    params: tuple[str, ...]
+    t_arg: Optional[str]
+    data_arg: Optional[str]
+    dim_args: tuple[str, ...]
+
+    @classmethod
+    def from_function(cls, func: Callable) -> 'FunctionSignature':
+        dim_args: list[str] = []
+        t_arg: Optional[str] = None
+        data_arg: Optional[str] = None
+
+        params = inspect.signature(func).parameters
+        for param in params.values():
+            if issubclass(param.annotation, AltDimension):
+                dim_args.append(param.name)
+            elif param.annotation == Time:
+                if t_arg is None:
+                    t_arg = param.name
+                else:
+                    raise ValueError('More than 1 Time argument in function')
+            elif param.annotation == RefData:
+                if data_arg is None:
+                    data_arg = param.name
+                else:
+                    raise ValueError('More than 1 RefData argument in function')
+        return cls(tuple(params), t_arg, data_arg, tuple(dim_args))
+
+
+@dataclass(frozen=True)
+class DiscoveredFunction:
+    name: str
+    func_group: Optional[str]
+    # Only grouped functions defined in the module are analysed up front
+    signature: Optional[FunctionSignature] = None
+    tree: Optional[ast.FunctionDef] = field(default=None, compare=False, repr=False)
+
+
+@dataclass(frozen=True)
+class _ModuleDiscovery:
+    version: tuple
+    functions: tuple[DiscoveredFunction, ...]
+
+
+_modules: dict[str, _ModuleDiscovery] = {}
+# Keyed by code object, so copies of a function bound to another namespace share the analysis
+_signatures: dict[Any, FunctionSignature] = {}
+_trees: dict[Any, Optional[ast.FunctionDef]] = {}
+
+
+def _raw(func: Callable) -> Callable:
+    return inspect.unwrap(func)
+
+
+def _key(func: Callable) -> Any:
+    return getattr(func, '__code__', func)
+
+
+def is_function(obj: Any) -> bool:
+    return (inspect.isfunction(obj) or
+            (callable(obj) and hasattr(obj, '__wrapped__') and inspect.isfunction(obj.__wrapped__))
+            )
+
+
+def signature_of(func: Callable) -> FunctionSignature:
+    raw = _raw(func)
+    key = _key(raw)
+    if key not in _signatures:
+        _signatures[key] = FunctionSignature.from_function(raw)
+    return _signatures[key]
+
+
+def _first_function_def(source: str) -> Optional[ast.FunctionDef]:
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return node
+    return None
+
+
+def parse_function(func: Callable) -> Optional[ast.FunctionDef]:
+    """Syntax tree of a function's definition, None when its source is not available."""
+    raw = _raw(func)
+    key = _key(raw)
+    if key not in _trees:
+        try:
+            _trees[key] = _first_function_def(textwrap.dedent(inspect.getsource(raw)))
+        except (OSError, TypeError):
+            _trees[key] = None
+    return _trees[key]
+
+
+def _module_version(mod: ModuleType) -> Optional[tuple]:
+    path = getattr(mod, '__file__', None)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return path, stat.st_mtime_ns, stat.st_size, sys.version_info[:2]
+
+
+def _top_level_defs(mod: ModuleType) -> dict[str, ast.FunctionDef]:
+    """Function definitions at the top of a module, parsed from its file once instead of per function."""
+    try:
+        tree = ast.parse(inspect.getsource(mod))
+    except (OSError, TypeError, SyntaxError):
+        return {}
+    return {node.name: node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+
+
+def _defined_by(node: ast.FunctionDef, func: Callable) -> bool:
+    first_line = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+    return getattr(func, '__code__', None) is not None and func.__code__.co_firstlineno == first_line
+
+
+def _discover(mod: ModuleType, version: tuple) -> _ModuleDiscovery:
+    defs = None
+    functions = []
+    for name, func in inspect.getmembers(mod, is_function):
+        func_group = getattr(func, '_group_name', None)
+        raw = _raw(func)
+        if func_group is None or raw.__module__ != mod.__name__:
+            functions.append(DiscoveredFunction(name, func_group))
+            continue
+
+        if defs is None:
+            defs = _top_level_defs(mod)
+        node = defs.get(raw.__name__)
+        tree = node if node is not None and _defined_by(node, raw) else parse_function(raw)
+        functions.append(DiscoveredFunction(name, func_group, signature_of(raw), tree))
+    return _ModuleDiscovery(version, tuple(functions))
+
+
+def _cache_file(cache_dir: Path, module_name: str) -> Path:
+    return cache_dir / f'{module_name}.discovery.pickle'
+
+
+def _read_cache(cache_dir: Path, module_name: str, version: tuple) -> Optional[_ModuleDiscovery]:
+    try:
+        with open(_cache_file(cache_dir, module_name), 'rb') as f:
+            discovery = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    return discovery if isinstance(discovery, _ModuleDiscovery) and discovery.version == version else None
+
+
+def _write_cache(cache_dir: Path, module_name: str, discovery: _ModuleDiscovery):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = _cache_file(cache_dir, module_name)
+    # Written under a temporary name and renamed, so concurrent workers never read a partial file
+    temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(temp_path, 'wb') as f:
+        pickle.dump(discovery, f)
+    os.replace(temp_path, path)
+
+
+def discover_module(module_name: str, cache_dir: Optional[str | Path] = None
+                    ) -> tuple[ModuleType, list[tuple[DiscoveredFunction, Callable]]]:
+    """Import a module and pair each function it holds with its discovery details."""
+    mod = importlib.import_module(module_name)
+    version = _module_version(mod)
+    discovery = _modules.get(module_name)
+    if version is None or discovery is None or discovery.version != version:
+        discovery = None
+        if version is not None and cache_dir is not None:
+            discovery = _read_cache(Path(cache_dir), module_name, version)
+        if discovery is None:
+            discovery = _discover(mod, version)
+            if version is not None and cache_dir is not None:
+                _write_cache(Path(cache_dir), module_name, discovery)
+        if version is not None:
+            _modules[module_name] = discovery
+
+    functions = []
+    for details in discovery.functions:
+        func = mod.__dict__.get(details.name)
+        if func is None or not is_function(func):
+            continue
+        key = _key(_raw(func))
+        # Seeded for the live function, which a reload replaces while the module version stays the same
+        if details.signature is not None:
+            _signatures.setdefault(key, details.signature)
+        if details.tree is not None:
+            _trees.setdefault(key, details.tree)
+        functions.append((details, func))
+    return mod, functions
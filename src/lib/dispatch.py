@@ -0,0 +1,87 @@
+import inspect
+import types
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from typing import Any
+
+from src.lib.cache import CachedFunction
+from src.lib.discovery import signature_of
+from src.lib.types import FunctionDetails, FunctionPriority
+
+_COPIED_ATTRIBUTES = ('__module__', '__name__', '__qualname__', '__doc__')
+
+
+def resolve_overrides(candidates: Iterable[tuple[FunctionDetails, FunctionPriority]]) -> list[FunctionDetails]:
+    """The highest priority definition of each function name, in the order names were first seen.
+
+    The same function reached through several modules, such as one importing it from another, is not a
+    conflict. Two different definitions at the same priority are, since neither can be preferred.
+    """
+    winners: dict[str, tuple[FunctionDetails, FunctionPriority]] = {}
+    for details, priority in candidates:
+        current = winners.get(details.name)
+        if current is None:
+            winners[details.name] = (details, priority)
+            continue
+
+        current_details, current_priority = current
+        func = inspect.unwrap(details.func)
+        if func is inspect.unwrap(current_details.func):
+            # Attributed to the module defining it, at the highest priority it was registered with
+            preferred = details if func.__module__ == details.module else current_details
+            winners[details.name] = (preferred, max(priority, current_priority, key=lambda p: p.value))
+        elif priority.value > current_priority.value:
+            winners[details.name] = (details, priority)
+        elif priority == current_priority:
+            raise ValueError(f'{details.name} is defined in both {current_details.module} and {details.module} '
+                             f'with {priority.name} priority')
+    return [details for details, _ in winners.values()]
+
+
+def _rebind(func: Callable, namespace: dict[str, Any]) -> Callable:
+    """Copy of func that resolves global names in namespace rather than in its module."""
+    bound = types.FunctionType(func.__code__, namespace, func.__name__, func.__defaults__, func.__closure__)
+    bound.__kwdefaults__ = func.__kwdefaults__
+    bound.__annotations__ = dict(func.__annotations__)
+    for attr in _COPIED_ATTRIBUTES:
+        setattr(bound, attr, getattr(func, attr))
+    bound.__dict__.update(func.__dict__)
+    return bound
+
+
+class DispatchTable(Mapping[str, CachedFunction]):
+    """The implementation of every function name in one model, memoised and bound to each other.
+
+    Each function runs with a namespace of its own module's globals overlaid with the table, so a call to
+    another function by name reaches the model's winning implementation directly, whichever module
+    defines it. Modules themselves are left untouched, so models with different overrides can share a
+    process. Module globals are captured when the table is built.
+    """
+
+    def __init__(self, functions: Iterable[FunctionDetails]):
+        namespaces: dict[int, dict[str, Any]] = {}
+        self._functions: dict[str, CachedFunction] = {}
+        self._modules: dict[str, str] = {}
+        for details in functions:
+            raw = inspect.unwrap(details.func)
+            namespace = namespaces.setdefault(id(raw.__globals__), dict(raw.__globals__))
+            signature = signature_of(raw)
+            bound = _rebind(raw, namespace)
+            self._functions[details.name] = CachedFunction(bound, details.name, signature.t_arg,
+                                                           signature.data_arg, signature.params)
+            self._modules[details.name] = details.module
+
+        for namespace in namespaces.values():
+            namespace.update(self._functions)
+
+    def module(self, name: str) -> str:
+        """Module the winning implementation of name was loaded from."""
+        return self._modules[name]
+
+    def __getitem__(self, name: str) -> CachedFunction:
+        return self._functions[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._functions)
+
+    def __len__(self) -> int:
+        return len(self._functions)
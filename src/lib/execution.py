@@ -1,23 +1,384 @@
-from collections import defaultdict
+import functools
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass, replace
+from enum import Enum
+from typing import Any, Optional
 
+import numpy as np
+
+from src.lib.cache import CalcCache, _Column
 from src.lib.calculation import Calc, CalcType
+from src.lib.dimension import DimProjection
+from src.lib.discovery import signature_of
 from src.lib.reference import RefData
+from src.lib.results import ResultHandler
+from src.lib.scenario import Mean, ScenarioReducer, ScenarioTotals
+from src.lib.scheduler import CalcGraph
+
+
+_ONCE_PER_MODEL_POINT = (CalcType.NO_ARGS, CalcType.REF_ONLY, CalcType.ALT_DIMS_ONLY, CalcType.REF_AND_ALT_DIMS)
+
+
+def run_batch(calcs: list[Calc], data: RefData, dim_projection: DimProjection) -> dict[str, np.ndarray]:
+    """Evaluate each calc once per t for every model point held in a batched RefData.
+
+    Returns one array per calc with shape (number of time steps, batch size).
+    """
+    batch_size = data.batch_size
+    if batch_size is None:
+        raise ValueError('RefData does not hold a batch of policy values')
+
+    calcs = [bound for calc in calcs for bound in calc.bound_calcs()]
+    step_results: dict[str, list] = {calc.name: [] for calc in calcs}
+    with CalcCache().scope(data):
+        for t in dim_projection.t_range:
+            for calc in calcs:
+                kwargs = {calc.data_arg: data} if calc.data_arg is not None else {}
+                value = calc.function(t, **kwargs) if calc.t_dependent else calc.function(**kwargs)
+                step_results[calc.name].append(np.broadcast_to(value, (batch_size,)))
 
+    return {name: np.stack(values) for name, values in step_results.items()}
 
-def _group_calc_types(calcs: list[Calc]) -> dict[CalcType, list[Calc]]:
-    grouped = defaultdict(list)
-    for calc in calcs:
-        grouped[calc.type].append(calc)
-    return dict(grouped)
 
+class _CallShape(Enum):
+    T_DATA = 1
+    T = 2
+    DATA = 3
+    NONE = 4
+    KEYWORDS = 5
+    COMBOS = 6
 
-def run_calcs(calcs: list[Calc], data: list[RefData], dimension_projections: list[DimRange]):
-    calcs_by_type: dict[CalcType, list[Calc]] = _group_calc_types(calcs)
 
-    # Run dimensionless functions first
-    for calc in calcs_by_type[CalcType.ALL] or calcs_by_type[CalcType.TIME_AND_ALT_DIMS]:
-        if calc.type == CalcType.ALL:
-            result_handler.add_result(calc.function())
+@dataclass(frozen=True)
+class _CallPlan:
+    """How to invoke one calc, worked out once so the hot loop makes a plain positional call."""
+    name: str
+    func: Callable
+    shape: _CallShape
+    t_arg: Optional[str]
+    data_arg: Optional[str]
+    calc: Optional[Calc] = None
+    scenario: bool = False
+
+    @classmethod
+    def from_calc(cls, calc: Calc) -> '_CallPlan':
+        func = calc.function.func if isinstance(calc.function, functools.partial) else calc.function
+        params = list(signature_of(func).params)
+        leading = [arg for arg in (calc.t_arg, calc.data_arg) if arg is not None]
+
+        if calc.combos is not None:
+            return cls(calc.name, calc.function, _CallShape.COMBOS, calc.t_arg, calc.data_arg, calc,
+                       scenario=calc.scenario_arg is not None)
+        elif params[:len(leading)] != leading:
+            shape = _CallShape.KEYWORDS
+        elif calc.t_arg is not None:
+            shape = _CallShape.T_DATA if calc.data_arg is not None else _CallShape.T
         else:
-            result_handler.add_result(calc.function(**{calc.data_arg: data}))
+            shape = _CallShape.DATA if calc.data_arg is not None else _CallShape.NONE
+        return cls(calc.name, calc.function, shape, calc.t_arg, calc.data_arg)
+
+    @functools.cached_property
+    def bindings(self) -> list[tuple[str, dict[str, Any]]]:
+        """Result name and alt dimension arguments of each combo, bound on first evaluation."""
+        if self.calc is None or self.calc.combos is None:
+            return []
+        return [(self.calc.combo_name(combo), self.calc.combo_kwargs(combo)) for combo in self.calc.combos]
+
+    @property
+    def names(self) -> list[str]:
+        return [name for name, _ in self.bindings] if self.shape == _CallShape.COMBOS else [self.name]
+
+    def call_keywords(self, t: Any, data: RefData, dim_kwargs: Optional[dict[str, Any]] = None) -> Any:
+        kwargs = dict(dim_kwargs or {})
+        if self.t_arg is not None:
+            kwargs[self.t_arg] = t
+        if self.data_arg is not None:
+            kwargs[self.data_arg] = data
+        return self.func(**kwargs)
+
+
+def _evaluate(plans: list[_CallPlan], t: Any, data: RefData,
+              shared: Optional[dict[str, dict[str, Any]]] = None) -> dict[str, Any]:
+    values = {}
+    for plan in plans:
+        if shared is not None and plan.name in shared:
+            values.update(shared[plan.name])
+            continue
+        match plan.shape:
+            case _CallShape.T_DATA:
+                values[plan.name] = plan.func(t, data)
+            case _CallShape.T:
+                values[plan.name] = plan.func(t)
+            case _CallShape.DATA:
+                values[plan.name] = plan.func(data)
+            case _CallShape.NONE:
+                values[plan.name] = plan.func()
+            case _CallShape.KEYWORDS:
+                values[plan.name] = plan.call_keywords(t, data)
+            case _CallShape.COMBOS:
+                for name, dim_kwargs in plan.bindings:
+                    values[name] = plan.call_keywords(t, data, dim_kwargs)
+    return values
+
+
+@dataclass(frozen=True)
+class _SharedValues:
+    """Results served to a model point's cache and result rows instead of being evaluated for it.
+
+    Results of policy invariant calcs are only valid for model points holding the same tables and global
+    values they were computed from.
+    """
+    once: dict[str, dict[str, Any]]
+    steps: list[dict[str, dict[str, Any]]]
+    columns: dict[tuple[str, tuple], _Column]
+    tables: Optional[dict] = None
+    global_values: Optional[dict] = None
+    t_values: Optional[list] = None
+
+    @classmethod
+    def evaluate(cls, once: list[_CallPlan], per_step: list[_CallPlan], calc_names: set[str], model_point: RefData,
+                 t_values: list) -> '_SharedValues':
+        """Evaluate calcs for one model point over the t range, for reuse by others sharing its reference data."""
+        cache = CalcCache()
+        cache.bind(model_point)
+        try:
+            with cache:
+                once_values = {plan.name: _evaluate([plan], None, model_point) for plan in once}
+                steps = [{plan.name: _evaluate([plan], t, model_point) for plan in per_step} for t in t_values]
+            return cls(once_values, steps, cache.columns(calc_names), model_point.tables, model_point.global_values,
+                       t_values)
+        finally:
+            cache.clear()
+
+    @classmethod
+    def from_arrays(cls, values: dict[str, Sequence], t_values: list) -> '_SharedValues':
+        """Results already computed for every t of calcs with no alt dimensions, t_values being consecutive ints."""
+        steps: list[dict[str, dict[str, Any]]] = [{} for _ in t_values]
+        columns = {}
+        for name, column in values.items():
+            column = list(column)
+            for step, value in zip(steps, column):
+                step[name] = {name: value}
+            columns[(name, ())] = _Column.from_values(t_values[0], column)
+        return cls({}, steps, columns)
+
+    def serves(self, model_point: RefData, t_values: list) -> bool:
+        return (model_point.tables is self.tables and model_point.global_values is self.global_values
+                and t_values == self.t_values)
+
+    def merged(self, other: Optional['_SharedValues']) -> '_SharedValues':
+        """These results with other's added, other taking precedence."""
+        if other is None:
+            return self
+        return replace(self, once={**self.once, **other.once},
+                       steps=[{**mine, **theirs} for mine, theirs in zip(self.steps, other.steps)],
+                       columns={**self.columns, **other.columns})
+
+
+class CallPlans:
+    """Call plans for a set of calcs, split into those evaluated once per model point and once per t.
+
+    With a dependency graph, calcs reading no policy values are evaluated for the first model point only
+    and their results shared with later ones in the same run.
+    """
+
+    def __init__(self, calcs: list[Calc], graph: Optional[CalcGraph] = None):
+        if graph is not None:
+            rank = {name: i for i, name in enumerate(graph.evaluation_order())}
+            calcs = sorted(calcs, key=lambda calc: rank.get(calc.original_name, len(rank)))
+            self.windows: Optional[dict[str, Optional[int]]] = {name: graph.window(name) for name in graph.names}
+            self.invariant: set[str] = graph.policy_invariant()
+        else:
+            self.windows = None
+            self.invariant = set()
+
+        self.once: list[_CallPlan] = [_CallPlan.from_calc(calc) for calc in calcs if calc.type in _ONCE_PER_MODEL_POINT]
+        self.per_step: list[_CallPlan] = [
+            _CallPlan.from_calc(calc) for calc in calcs if calc.type not in _ONCE_PER_MODEL_POINT
+        ]
+        invariant_names = {calc.name for calc in calcs if calc.original_name in self.invariant}
+        self._shared_once = [plan for plan in self.once if plan.name in invariant_names]
+        self._shared_per_step = [plan for plan in self.per_step if plan.name in invariant_names]
+        self._shared: Optional[_SharedValues] = None
+
+    def reset_shared(self):
+        """Forget shared results, whose reference data may have been changed in place since they were computed."""
+        self._shared = None
+
+    def shared(self, model_point: RefData, t_values: list) -> Optional[_SharedValues]:
+        """Results of the policy invariant calcs for model_point, computed on first use for its reference data."""
+        if not self.invariant:
+            return None
+        if self._shared is None or not self._shared.serves(model_point, t_values):
+            self._shared = _SharedValues.evaluate(self._shared_once, self._shared_per_step, self.invariant,
+                                                  model_point, t_values)
+        return self._shared
+
+    @property
+    def names(self) -> list[str]:
+        return [name for plan in self.once + self.per_step for name in plan.names]
+
+    @property
+    def scenario_names(self) -> list[str]:
+        """Results holding one value per scenario rather than a single value."""
+        return [name for plan in self.once + self.per_step if plan.scenario for name in plan.names]
+
+
+def _reduce_scenarios(values: dict[str, Any], names: list[str], num_scenarios: int,
+                      reducers: Sequence[ScenarioReducer], totals: Optional[ScenarioTotals], step: int | slice):
+    sort = any(reducer.uses_order for reducer in reducers)
+    for name in names:
+        if name not in values:
+            continue
+        paths = values.pop(name)
+        if np.shape(paths) != (num_scenarios,):
+            paths = np.broadcast_to(paths, (num_scenarios,))
+        if totals is not None:
+            totals.add(name, step, paths)
+        sorted_paths = np.sort(paths) if sort else None
+        for reducer in reducers:
+            reduced = reducer.reduce_sorted(sorted_paths) if reducer.uses_order else reducer(paths)
+            values[reducer.column_name(name)] = reduced
+
+
+def _declare_result_dtypes(result_handler: ResultHandler, t_values: list):
+    dtypes = {'model_point': np.int64}
+    if np.asarray(t_values).dtype.kind in 'iu':
+        dtypes['t'] = np.int64
+    result_handler.declare_dtypes(dtypes)
+
+
+def _result_names(names: list[str], scenario_names: list[str], reducers: Sequence[ScenarioReducer]) -> list[str]:
+    """Result columns for calc names, ordered as _reduce_scenarios leaves them."""
+    columns = dict.fromkeys(names)
+    for name in scenario_names:
+        if name in columns:
+            del columns[name]
+            columns.update(dict.fromkeys(reducer.column_name(name) for reducer in reducers))
+    return list(columns)
+
+
+def _policy_keys(model_point: RefData, policy_columns: Sequence[str]) -> dict[str, Any]:
+    """Policy values written alongside each row, such as a product code to aggregate results by."""
+    try:
+        return {col: model_point.policy_values[col] for col in policy_columns}
+    except KeyError as e:
+        raise KeyError(f'Model point has no policy value {e} to write with its results') from None
+
+
+def _pad(result_handler: ResultHandler, ids: Any, t_values: list, columns: list[str], padding: Any,
+         policy_keys: Optional[dict[str, Any]] = None):
+    """Add the rows of steps that were not computed, holding padding for every calc."""
+    if not t_values:
+        return
+    policy_keys = policy_keys or {}
+    if np.ndim(ids) == 0:
+        rows = {'model_point': ids, 't': np.asarray(t_values), **policy_keys}
+    else:
+        rows = {'model_point': np.tile(ids, len(t_values)), 't': np.repeat(t_values, len(ids)),
+                **{col: np.tile(np.broadcast_to(value, np.shape(ids)), len(t_values))
+                   for col, value in policy_keys.items()}}
+    # A calc named like a key column shares it, and its padded rows keep the key values
+    result_handler.add_results({**rows, **{col: padding for col in columns if col not in rows}})
+
+
+def _project_model_point(plans: CallPlans, model_point: RefData, ids: Any, t_values: list, cache: CalcCache,
+                         result_handler: ResultHandler, shared: Optional[_SharedValues], dim_projection: DimProjection,
+                         scenario_reducers: Sequence[ScenarioReducer], scenario_totals: Optional[ScenarioTotals],
+                         policy_columns: Sequence[str] = ()):
+    """Evaluate one model point, or batch of them, over the t range and add a row per model point and t.
+
+    Steps after a model point's term or run-off are not evaluated, and are written as padding rows.
+    """
+    scenario_names = plans.scenario_names
+    batch_size = model_point.batch_size
+    if batch_size is not None and scenario_names:
+        raise ValueError('Scenario dimensions cannot be combined with batched model points')
+    num_scenarios = dim_projection.num_scenarios
+    run_off = dim_projection.run_off
+    steps = dim_projection.steps(model_point)
+    # Policies of a batch still being projected, whose other rows are padded until the whole batch stops
+    active = None if batch_size is None else np.ones(batch_size, dtype=bool)
+    end = len(t_values) if steps is None else min(int(np.max(steps, initial=0)), len(t_values))
+    policy_keys = _policy_keys(model_point, policy_columns)
+
+    cache.bind(model_point, shared.columns if shared is not None else None)
+    try:
+        with cache:
+            once_values = _evaluate(plans.once, None, model_point, shared.once if shared is not None else None)
+        if scenario_names:
+            _reduce_scenarios(once_values, scenario_names, num_scenarios, scenario_reducers, scenario_totals,
+                              slice(None))
+        for step, t in enumerate(t_values[:end]):
+            if active is not None and steps is not None:
+                active &= step < steps
+            with cache:
+                step_values = _evaluate(plans.per_step, t, model_point,
+                                        shared.steps[step] if shared is not None else None)
+            if scenario_names:
+                _reduce_scenarios(step_values, scenario_names, num_scenarios, scenario_reducers,
+                                  scenario_totals, step)
+            keys = {'model_point': ids, 't': t, **policy_keys}
+            values = {**once_values, **step_values}
+            if active is not None and not active.all():
+                values = {name: np.where(active, value, keys.get(name, dim_projection.padding))
+                          for name, value in values.items()}
+            result_handler.add_results({**keys, **values})
+
+            if run_off is not None:
+                stopped = run_off(values)
+                if active is None and stopped:
+                    end = step + 1
+                    break
+                elif active is not None:
+                    active &= ~np.broadcast_to(np.asarray(stopped, dtype=bool), active.shape)
+                    if not active.any():
+                        end = step + 1
+                        break
+            if plans.windows is not None:
+                cache.evict(getattr(t, 'value', t))
+    finally:
+        cache.clear()
+
+    if end < len(t_values):
+        _pad(result_handler, ids, t_values[end:], _result_names(plans.names, scenario_names, scenario_reducers),
+             dim_projection.padding, policy_keys)
+
+
+def run_calcs(calcs: list[Calc] | CallPlans, data: Iterable[RefData], dim_projection: DimProjection,
+              result_handler: ResultHandler, graph: Optional[CalcGraph] = None,
+              scenario_reducers: Sequence[ScenarioReducer] = (Mean(),),
+              scenario_totals: Optional[ScenarioTotals] = None, policy_columns: Sequence[str] = ()):
+    """Project every model point over the t range and stream one row per model point and t.
+
+    Calcs with no time argument are evaluated once per model point and repeated on each of its rows.
+    A model point may be a batched RefData, in which case each step adds one row per policy in the batch.
+    Passing the registry's dependency graph evaluates calcs in dependency order and lets the cache drop
+    values that fall outside each calc's lag window, and computes calcs reading no policy values, such as
+    discount factors, once for all model points rather than once per model point. Reference data must not
+    change in place during a run, but may between runs reusing the same CallPlans.
+
+    Calcs taking the projection's scenario dimension are written as one column per scenario reducer, such
+    as ``name[mean]``, so individual paths are never stored. Passing scenario_totals also accumulates
+    their per-scenario totals over all model points.
+
+    When the projection gives a term or run-off predicate, steps after a model point stops are not
+    evaluated but are still written, holding the projection's padding.
+
+    Policy values named in policy_columns are written on every row after model_point and t, so results
+    can be aggregated by them as they stream, as GroupedTotals does.
+    """
+    plans = calcs if isinstance(calcs, CallPlans) else CallPlans(calcs, graph)
+    plans.reset_shared()
+    t_values = list(dim_projection.t_range)
+    _declare_result_dtypes(result_handler, t_values)
 
+    cache = CalcCache(windows=plans.windows)
+    first_id = 0
+    for model_point in data:
+        batch_size = model_point.batch_size
+        ids = first_id if batch_size is None else np.arange(first_id, first_id + batch_size)
+        first_id += 1 if batch_size is None else batch_size
+        _project_model_point(plans, model_point, ids, t_values, cache, result_handler,
+                             plans.shared(model_point, t_values), dim_projection, scenario_reducers, scenario_totals,
+                             policy_columns)
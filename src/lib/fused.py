@@ -0,0 +1,553 @@
+"""Fused evaluation of pure numeric calcs, compiled with Numba when it is installed.
+
+Calcs whose bodies are arithmetic on t, policy values, global values, single index table lookups and other
+such calcs at the same or earlier t are translated into one generated kernel that loops over t and model
+points, writing every result into a preallocated array. With Numba the kernel is compiled to machine code
+and loops over each model point; without it the same translation runs as NumPy operations over all model
+points at each t. Table lookups are resolved to arrays before the kernel runs.
+
+Any other calc, and any calc calling one, is left to the interpreted engine, which is served the fused
+results through its cache. Model points the kernel cannot handle, such as ones whose recursion reaches
+back before the first t or whose table keys are missing, are projected by the interpreted engine instead.
+"""
+import ast
+import functools
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from src.lib.cache import CalcCache
+from src.lib.calculation import Calc
+from src.lib.dimension import DimProjection
+from src.lib.discovery import parse_function, signature_of
+from src.lib.execution import (CallPlans, _SharedValues, _declare_result_dtypes, _policy_keys,
+                               _project_model_point, _ONCE_PER_MODEL_POINT)
+from src.lib.reference import RefData, RefTable, _CompiledIndex
+from src.lib.results import ResultHandler
+from src.lib.scenario import Mean, ScenarioReducer, ScenarioTotals
+from src.lib.scheduler import CalcGraph, TimeSweep, _raw_function, _time_lag
+
+_BINARY_OPS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.Pow: '**', ast.Mod: '%', ast.FloorDiv: '//'}
+_UNARY_OPS = {ast.USub: '-', ast.UAdd: '+'}
+_COMPARE_OPS = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+# Relative tolerance of the check against the interpreted engine. NumPy may round powers differently from
+# Python by an ulp, which formulas such as 1 - (1 - q) ** (1 / 12) amplify by cancellation
+_RTOL = 1e-9
+
+
+class _Unsupported(Exception):
+    """A calc body uses something the fused kernel cannot express."""
+
+
+def _at(out, ti, i, flag):
+    if ti < 0:
+        flag[0] = 1
+        return 0.0
+    return out[ti, i]
+
+
+def _lookup(positions, values, offset, key, flag):
+    if key != key:
+        flag[0] = 1
+        return 0.0
+    whole = int(key)
+    position = whole - offset
+    if whole != key or position < 0 or position >= positions.shape[0] or positions[position] < 0:
+        flag[0] = 1
+        return 0.0
+    return values[positions[position]]
+
+
+def _row(out, ti, flag):
+    if ti < 0:
+        flag[0] = 1
+        return out[0]
+    return out[ti]
+
+
+def _lookup_row(positions, values, offset, keys, flag):
+    offsets = np.asarray(keys, dtype=np.float64) - offset
+    valid = (offsets >= 0) & (offsets < positions.shape[0]) & (offsets == np.floor(offsets))
+    rows = np.full(offsets.shape, -1, dtype=np.int64)
+    rows[valid] = positions[offsets[valid].astype(np.int64)]
+    if (rows < 0).any():
+        flag[0] = 1
+        rows = np.maximum(rows, 0)
+    return values[rows]
+
+
+@functools.cache
+def _numba() -> Any:
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba
+
+
+@dataclass(frozen=True)
+class _TableColumn:
+    table: str
+    index_col: str
+    return_col: str
+
+
+class _Inputs:
+    """Policy values, global values and table columns the kernel reads, each given its argument name."""
+
+    def __init__(self):
+        self.policies: dict[str, str] = {}
+        self.global_values: dict[str, str] = {}
+        self.tables: dict[_TableColumn, str] = {}
+
+    def policy(self, key: str) -> str:
+        return self.policies.setdefault(key, f'policy_{len(self.policies)}')
+
+    def global_value(self, key: str) -> str:
+        return self.global_values.setdefault(key, f'global_{len(self.global_values)}')
+
+    def table(self, column: _TableColumn) -> str:
+        return self.tables.setdefault(column, f'table_{len(self.tables)}')
+
+    @property
+    def names(self) -> list[str]:
+        tables = [f'{name}_{part}' for name in self.tables.values() for part in ('positions', 'values', 'offset')]
+        return [*self.policies.values(), *self.global_values.values(), *tables]
+
+
+class _Translator:
+    """Translates one calc body into kernel statements assigning its result at step ti."""
+
+    def __init__(self, calc: Calc, outputs: dict[str, str], calcs: dict[str, Calc], inputs: _Inputs,
+                 vectorised: bool):
+        self._calc: Calc = calc
+        self._outputs: dict[str, str] = outputs
+        self._calcs: dict[str, Calc] = calcs
+        self._inputs: _Inputs = inputs
+        self._vectorised: bool = vectorised
+        self._locals: dict[str, str] = {}
+        self._in_condition: bool = False
+
+    def translate(self, indent: str) -> list[str]:
+        tree = parse_function(_raw_function(self._calc.function))
+        if tree is None:
+            raise _Unsupported('source is not available')
+        return self._statements(list(tree.body), indent)
+
+    def _statements(self, stmts: list[ast.stmt], indent: str) -> list[str]:
+        lines = []
+        for position, stmt in enumerate(stmts):
+            rest = stmts[position + 1:]
+            match stmt:
+                case ast.Expr(value=ast.Constant(value=str())):
+                    continue
+                case ast.Return(value=value) if value is not None:
+                    out = self._outputs[self._calc.name]
+                    return lines + [f"{indent}{out}[ti{'' if self._vectorised else ', i'}] = {self._expr(value)}"]
+                case ast.Assign(targets=[ast.Name(id=name)], value=value):
+                    expr = self._expr(value)
+                    self._locals[name] = f'local_{self._outputs[self._calc.name]}_{name}'
+                    lines.append(f'{indent}{self._locals[name]} = {expr}')
+                case ast.If(test=test, body=body, orelse=orelse):
+                    # Later statements are repeated in both branches, so every path ends in a return
+                    condition = self._condition(test)
+                    scope = dict(self._locals)
+                    then_lines = self._statements(body + rest, indent + '    ')
+                    self._locals = dict(scope)
+                    else_lines = self._statements(orelse + rest, indent + '    ')
+                    self._locals = scope
+                    return lines + [f'{indent}if {condition}:', *then_lines, f'{indent}else:', *else_lines]
+                case _:
+                    raise _Unsupported(f'unsupported statement: {ast.unparse(stmt)}')
+        raise _Unsupported('not every path returns a value')
+
+    def _condition(self, node: ast.expr) -> str:
+        """Conditions may only depend on t and global values, so every model point takes the same branch."""
+        self._in_condition = True
+        try:
+            match node:
+                case ast.Compare(left=left, ops=[op], comparators=[right]) if type(op) in _COMPARE_OPS:
+                    return f'({self._expr(left)} {_COMPARE_OPS[type(op)]} {self._expr(right)})'
+                case ast.BoolOp(op=op, values=values):
+                    joiner = ' and ' if isinstance(op, ast.And) else ' or '
+                    return f'({joiner.join(self._condition(value) for value in values)})'
+                case ast.UnaryOp(op=ast.Not(), operand=operand):
+                    return f'(not {self._condition(operand)})'
+                case _:
+                    raise _Unsupported(f'unsupported condition: {ast.unparse(node)}')
+        finally:
+            self._in_condition = False
+
+    def _expr(self, node: ast.expr) -> str:
+        data_arg = self._calc.data_arg
+        match node:
+            case ast.Constant(value=value) if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return repr(value)
+            case ast.Name(id=name) if name == self._calc.t_arg:
+                return 't'
+            case ast.Name(id=name) if name in self._locals and not self._in_condition:
+                return self._locals[name]
+            case ast.BinOp(left=left, op=op, right=right) if type(op) in _BINARY_OPS:
+                return f'({self._expr(left)} {_BINARY_OPS[type(op)]} {self._expr(right)})'
+            case ast.UnaryOp(op=op, operand=operand) if type(op) in _UNARY_OPS:
+                return f'({_UNARY_OPS[type(op)]}{self._expr(operand)})'
+            case ast.Subscript(value=ast.Attribute(value=ast.Name(id=name), attr='global_values'),
+                               slice=ast.Constant(value=str() as key)) if name == data_arg:
+                return self._inputs.global_value(key)
+            case ast.Subscript(value=ast.Attribute(value=ast.Name(id=name), attr='policy_values'),
+                               slice=ast.Constant(value=str() as key)) if name == data_arg and not self._in_condition:
+                policy = self._inputs.policy(key)
+                return policy if self._vectorised else f'{policy}[i]'
+            case ast.Call(func=ast.Name(id=name)) if name in self._calcs and not self._in_condition:
+                return self._calc_call(name, node)
+            case ast.Call(func=ast.Attribute(
+                    value=ast.Subscript(value=ast.Attribute(value=ast.Name(id=name), attr='tables'),
+                                        slice=ast.Constant(value=str() as table)),
+                    attr='lookup')) if name == data_arg and not self._in_condition:
+                return self._lookup(table, node)
+            case _:
+                raise _Unsupported(f'unsupported expression: {ast.unparse(node)}')
+
+    def _calc_call(self, name: str, node: ast.Call) -> str:
+        callee = self._calcs[name]
+        if name not in self._outputs:
+            raise _Unsupported(f'calls {name}, which is not fused')
+        params = signature_of(_raw_function(callee.function)).params
+        if len(node.args) > len(params) or any(kw.arg is None for kw in node.keywords):
+            raise _Unsupported(f'unsupported call to {name}')
+        bound = dict(zip(params, node.args))
+        bound.update({kw.arg: kw.value for kw in node.keywords})
+        if set(bound) != set(params):
+            raise _Unsupported(f'unsupported call to {name}')
+
+        data_value = bound.get(callee.data_arg)
+        if data_value is not None and not (isinstance(data_value, ast.Name) and data_value.id == self._calc.data_arg):
+            raise _Unsupported(f'{name} is called with other data')
+        lag = _time_lag(bound[callee.t_arg], self._calc.t_arg) if self._calc.t_arg is not None else None
+        if lag is None or lag < 0:
+            raise _Unsupported(f'{name} is not called at the same or an earlier t')
+
+        out = self._outputs[name]
+        if lag == 0:
+            return f'{out}[ti]' if self._vectorised else f'{out}[ti, i]'
+        return f'_row({out}, ti - {lag}, flag)' if self._vectorised else f'_at({out}, ti - {lag}, i, flag)'
+
+    def _lookup(self, table: str, node: ast.Call) -> str:
+        names = ('index_values', 'return_col', 'interpolated_lookup')
+        if len(node.args) > len(names) or any(kw.arg not in names for kw in node.keywords):
+            raise _Unsupported('unsupported table lookup')
+        args = dict(zip(names, node.args))
+        args.update({kw.arg: kw.value for kw in node.keywords})
+        match args:
+            case {'index_values': ast.Dict(keys=[ast.Constant(value=str() as index_col)], values=[key]),
+                  'return_col': ast.Constant(value=str() as return_col)}:
+                pass
+            case _:
+                raise _Unsupported('table lookups must be on one index column with constant names')
+        interpolated = args.get('interpolated_lookup')
+        if interpolated is not None and not (isinstance(interpolated, ast.Constant) and interpolated.value is False):
+            raise _Unsupported('interpolated table lookup')
+
+        column = self._inputs.table(_TableColumn(table, index_col, return_col))
+        helper = '_lookup_row' if self._vectorised else '_lookup'
+        return f'{helper}({column}_positions, {column}_values, {column}_offset, {self._expr(key)}, flag)'
+
+
+def _fusable(calc: Calc) -> bool:
+    return (calc.t_arg is not None and calc.combos is None and calc.scenario_arg is None
+            and calc.type not in _ONCE_PER_MODEL_POINT)
+
+
+def _kernel_source(calcs: list[Calc], outputs: dict[str, str], calc_map: dict[str, Calc], inputs: _Inputs,
+                   vectorised: bool) -> str:
+    indent = '        ' if vectorised else '            '
+    body = []
+    for calc in calcs:
+        body.append(f'{indent}# {calc.name}')
+        body.extend(_Translator(calc, outputs, calc_map, inputs, vectorised).translate(indent))
+
+    args = ', '.join(['n', 't_values', 'flag', *outputs.values(), *inputs.names])
+    lines = [f'def kernel({args}):']
+    if vectorised:
+        lines.append('    for ti in range(t_values.shape[0]):')
+    else:
+        lines.extend(['    for i in range(n):', '        for ti in range(t_values.shape[0]):'])
+    lines.append(f'{indent}t = t_values[ti]')
+    return '\n'.join(lines + body) + '\n'
+
+
+def _dense_table(table: RefTable, column: _TableColumn) -> Optional[tuple[np.ndarray, np.ndarray, int]]:
+    """Row positions, column values and first key of a table with a dense integer index, None otherwise."""
+    if list(table.index_cols) != [column.index_col]:
+        return None
+    dense = _CompiledIndex([np.asarray(table.index_array(column.index_col))]).dense
+    if dense is None:
+        return None
+    offset, positions = dense
+    try:
+        values = np.asarray(table.col_array(column.return_col), dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return np.asarray(positions, dtype=np.int64), values, int(offset)
+
+
+class FusedPlans:
+    """Calcs split into those evaluated by a generated kernel and those left to the interpreted engine.
+
+    Numba is used when it is installed unless ``use_numba`` is False; True requires it.
+    """
+
+    def __init__(self, calcs: list[Calc], graph: Optional[CalcGraph] = None, use_numba: Optional[bool] = None):
+        self._graph: CalcGraph = graph if graph is not None else CalcGraph.from_calcs(calcs)
+        self._calcs: list[Calc] = calcs
+        self.plans: CallPlans = CallPlans(calcs, self._graph)
+
+        numba = _numba() if use_numba is not False else None
+        if use_numba and numba is None:
+            raise ImportError('Numba is not installed')
+        self._vectorised: bool = numba is None
+
+        rank = {name: i for i, name in enumerate(self._graph.evaluation_order())}
+        calc_map = {calc.name: calc for calc in calcs}
+        fused = sorted((calc for calc in calcs if _fusable(calc)), key=lambda calc: rank.get(calc.name, len(rank)))
+        self._unsupported: dict[str, str] = {calc.name: 'takes alt dimensions or no t'
+                                             for calc in calcs if not _fusable(calc)}
+        # Dropping a calc can make its callers unsupported in turn, so translate until nothing more is dropped
+        while True:
+            outputs = {calc.name: f'out_{i}' for i, calc in enumerate(fused)}
+            inputs = _Inputs()
+            for calc in fused:
+                try:
+                    _Translator(calc, outputs, calc_map, inputs, self._vectorised).translate('')
+                except _Unsupported as e:
+                    self._unsupported[calc.name] = str(e)
+            if not any(calc.name in self._unsupported for calc in fused):
+                break
+            fused = [calc for calc in fused if calc.name not in self._unsupported]
+
+        self._fused: list[Calc] = fused
+        self._outputs: dict[str, str] = outputs
+        self._inputs: _Inputs = inputs
+        self.source: Optional[str] = None
+        self._kernel: Optional[Callable] = None
+        if fused:
+            self._inputs = _Inputs()
+            self.source = _kernel_source(fused, outputs, calc_map, self._inputs, self._vectorised)
+            namespace = {'np': np, '_at': _at, '_lookup': _lookup, '_row': _row, '_lookup_row': _lookup_row}
+            if numba is not None:
+                namespace.update({name: numba.njit(namespace[name]) for name in ('_at', '_lookup')})
+            exec(compile(self.source, '<fused kernel>', 'exec'), namespace)
+            self._kernel = numba.njit(namespace['kernel']) if numba is not None else namespace['kernel']
+        self._bound: Optional[tuple[Any, Any, Optional[list]]] = None
+
+    @property
+    def calcs(self) -> list[Calc]:
+        return self._calcs
+
+    @property
+    def graph(self) -> CalcGraph:
+        return self._graph
+
+    @property
+    def fused(self) -> list[str]:
+        return [calc.name for calc in self._fused]
+
+    @property
+    def unsupported(self) -> dict[str, str]:
+        """Why each calc left to the interpreted engine could not be fused."""
+        return dict(self._unsupported)
+
+    @property
+    def uses_numba(self) -> bool:
+        return self._kernel is not None and not self._vectorised
+
+    @property
+    def complete(self) -> bool:
+        """Whether every calc is fused, so results can be written without the interpreted engine."""
+        return not self._unsupported
+
+    def reset(self):
+        """Forget reference data and shared results bound in an earlier run, which may have changed in place."""
+        self._bound = None
+        self.plans.reset_shared()
+
+    def _reference_args(self, model_point: RefData) -> Optional[list]:
+        """Kernel arguments for global values and tables, resolved once per set of reference data in a run."""
+        tables, global_values = model_point.tables, model_point.global_values
+        if self._bound is not None and self._bound[0] is tables and self._bound[1] is global_values:
+            return self._bound[2]
+
+        args: Optional[list] = []
+        try:
+            for key in self._inputs.global_values:
+                args.append(float(global_values[key]))
+            for column in self._inputs.tables:
+                dense = _dense_table(tables[column.table], column)
+                if dense is None:
+                    raise ValueError(f'{column.table} is not indexed by dense integers')
+                args.extend(dense)
+        except (KeyError, TypeError, ValueError):
+            args = None
+        self._bound = (tables, global_values, args)
+        return args
+
+    def evaluate(self, model_points: list[RefData], t_values: list) -> Optional[dict[str, np.ndarray]]:
+        """Fused results with shape (number of t, number of policies), for one batched RefData or several
+        unbatched ones sharing reference data. None when the kernel cannot evaluate them.
+        """
+        if self._kernel is None or not t_values:
+            return None
+        t_array = np.asarray(t_values)
+        # Earlier steps are addressed by offset, so t must be consecutive integers
+        if t_array.dtype.kind not in 'iu' or not np.array_equal(np.diff(t_array), np.ones(len(t_array) - 1)):
+            return None
+        reference_args = self._reference_args(model_points[0])
+        if reference_args is None:
+            return None
+
+        batch_size = model_points[0].batch_size
+        num_policies = batch_size if batch_size is not None else len(model_points)
+        try:
+            if batch_size is not None:
+                policies = [np.broadcast_to(np.asarray(model_points[0].policy_values[key], dtype=np.float64),
+                                            (batch_size,)) for key in self._inputs.policies]
+            else:
+                policies = [np.array([model_point.policy_values[key] for model_point in model_points],
+                                     dtype=np.float64) for key in self._inputs.policies]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        outputs = {name: np.empty((len(t_array), num_policies)) for name in self._outputs}
+        flag = np.zeros(1, dtype=np.int64)
+        self._kernel(num_policies, t_array.astype(np.int64), flag, *outputs.values(), *policies, *reference_args)
+        return outputs if not flag[0] else None
+
+
+def _groups(data: Iterable[RefData], batch_size: int) -> Iterator[list[RefData]]:
+    """A batched RefData on its own, or consecutive unbatched ones sharing reference data, up to batch_size.
+
+    Reference data is told apart by identity, so it must not change in place during a run.
+    """
+    group: list[RefData] = []
+    for model_point in data:
+        if group and (model_point.batch_size is not None or len(group) == batch_size
+                      or model_point.tables is not group[0].tables
+                      or model_point.global_values is not group[0].global_values):
+            yield group
+            group = []
+        if model_point.batch_size is not None:
+            yield [model_point]
+        else:
+            group.append(model_point)
+    if group:
+        yield group
+
+
+def _verify(sweep: TimeSweep, model_point: RefData, values: dict[str, np.ndarray]):
+    expected = sweep.run(model_point, only=set(values))
+    # Fused results may stop short of the t range when no model point's term reaches its end
+    different = [name for name, value in values.items()
+                 if not np.allclose(value, np.asarray(expected[name][:len(value)], dtype=np.float64), rtol=_RTOL,
+                                    atol=0.0, equal_nan=True)]
+    if different:
+        raise ValueError(f"Fused results differ from the interpreted engine for {', '.join(different)}")
+
+
+def _ends(dim_projection: DimProjection, group: list[RefData], num_t: int) -> np.ndarray:
+    """Number of steps each policy of a group is projected for, before any run-off."""
+    if group[0].batch_size is not None:
+        steps = dim_projection.steps(group[0])
+        return np.broadcast_to(np.minimum(num_t if steps is None else steps, num_t), (group[0].batch_size,))
+    return np.array([num_t if (steps := dim_projection.steps(model_point)) is None else min(steps, num_t)
+                     for model_point in group], dtype=np.int64)
+
+
+def _padded(values: dict[str, np.ndarray], names: list[str], ends: np.ndarray, dim_projection: DimProjection,
+            num_t: int) -> tuple[dict[str, np.ndarray], np.ndarray]:
+    """Fused results over the whole t range, holding padding from each policy's end or run-off onwards,
+    and the mask of steps that were computed.
+    """
+    if dim_projection.run_off is not None:
+        for step in range(min(int(ends.max(initial=0)), len(next(iter(values.values()))))):
+            stopped = np.broadcast_to(np.asarray(dim_projection.run_off({name: values[name][step] for name in names}),
+                                                 dtype=bool), ends.shape)
+            ends = np.where(stopped & (ends > step), step + 1, ends)
+    computed = np.arange(num_t)[:, np.newaxis] < ends
+    padded = {}
+    for name in names:
+        column = np.full((num_t, len(ends)), dim_projection.padding, dtype=np.float64)
+        column[:len(values[name])] = values[name]
+        padded[name] = np.where(computed, column, dim_projection.padding)
+    return padded, computed
+
+
+def run_fused(calcs: list[Calc] | FusedPlans, data: Iterable[RefData], dim_projection: DimProjection,
+              result_handler: ResultHandler, graph: Optional[CalcGraph] = None, batch_size: int = 1_000,
+              verify: int = 1, use_numba: Optional[bool] = None,
+              scenario_reducers: Sequence[ScenarioReducer] = (Mean(),),
+              scenario_totals: Optional[ScenarioTotals] = None, policy_columns: Sequence[str] = ()):
+    """Project every model point as run_calcs does, evaluating fusable calcs with a generated kernel.
+
+    Unbatched model points are fused ``batch_size`` at a time. The first ``verify`` groups of model points
+    are also projected by the interpreted engine, raising ValueError if any fused result differs from it.
+    Results are written with the same rows and columns as run_calcs. The kernel stops at the longest term
+    in each group, while run-off is applied to its results, so steps after a policy runs off are computed
+    but written as padding.
+    """
+    fused = calcs if isinstance(calcs, FusedPlans) else FusedPlans(calcs, graph, use_numba)
+    fused.reset()
+    plans = fused.plans
+    t_values = list(dim_projection.t_range)
+    _declare_result_dtypes(result_handler, t_values)
+    sweep = TimeSweep(fused.calcs, dim_projection, fused.graph) if verify > 0 else None
+    names = plans.names
+
+    cache = CalcCache(windows=plans.windows)
+    first_id = 0
+    for group in _groups(data, batch_size):
+        batch_size_of_group = group[0].batch_size
+        num_policies = batch_size_of_group if batch_size_of_group is not None else len(group)
+        ids = np.arange(first_id, first_id + num_policies)
+        first_id += num_policies
+
+        num_t = len(t_values)
+        ends = _ends(dim_projection, group, num_t)
+        values = fused.evaluate(group, t_values[:int(ends.max(initial=0))])
+        if values is not None and verify > 0:
+            verify -= 1
+            first = values if batch_size_of_group is not None else {name: value[:, 0] for name, value in values.items()}
+            _verify(sweep, group[0], first)
+
+        if values is not None and fused.complete:
+            computed = None
+            if dim_projection.stops_early:
+                values, computed = _padded(values, names, ends, dim_projection, num_t)
+            # Batches are written t-major and unbatched groups model point-major, as run_calcs does
+            layout = (lambda a: a.ravel()) if batch_size_of_group is not None else (lambda a: a.T.ravel())
+            rows = {'model_point': layout(np.broadcast_to(ids, (num_t, num_policies))),
+                    't': layout(np.broadcast_to(np.asarray(t_values)[:, np.newaxis], (num_t, num_policies)))}
+            for col in policy_columns:
+                found = [_policy_keys(model_point, (col,))[col] for model_point in group]
+                policy_values = found[0] if batch_size_of_group is not None else np.array(found)
+                rows[col] = layout(np.broadcast_to(policy_values, (num_t, num_policies)))
+            keys = dict(rows)
+            for name in names:
+                rows[name] = layout(values[name])
+                if name in keys and computed is not None:
+                    # A calc named like a key column shares it, and its padded rows keep the key values
+                    rows[name] = np.where(layout(computed), rows[name], keys[name])
+            result_handler.add_results(rows)
+            continue
+
+        for position, model_point in enumerate(group):
+            shared = plans.shared(model_point, t_values)
+            if values is not None:
+                columns = {name: list(value) if batch_size_of_group is not None else value[:, position].tolist()
+                           for name, value in values.items()}
+                fused_values = _SharedValues.from_arrays(columns, t_values)
+                shared = fused_values if shared is None else shared.merged(fused_values)
+            model_point_ids = ids if batch_size_of_group is not None else int(ids[position])
+            _project_model_point(plans, model_point, model_point_ids, t_values, cache, result_handler, shared,
+                                 dim_projection, scenario_reducers, scenario_totals, policy_columns)
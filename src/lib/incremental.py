@@ -0,0 +1,94 @@
+from collections.abc import Iterable
+from typing import Optional
+
+import numpy as np
+
+from src.lib.calculation import Calc
+from src.lib.dimension import DimProjection
+from src.lib.reference import RefData
+from src.lib.scheduler import CalcGraph, DataRead, TimeSweep
+
+
+def _values_differ(old, new) -> bool:
+    if old is new:
+        return False
+    try:
+        return not np.array_equal(old, new)
+    except TypeError:
+        return old != new
+
+
+def changes_between(old: RefData, new: RefData) -> list[DataRead]:
+    """Parts of new that differ from old. Tables are compared by identity, so a replaced table counts as changed."""
+    changes = []
+    for source, old_values, new_values in ((DataRead.policy, old.policy_values, new.policy_values),
+                                           (DataRead.global_value, old.global_values, new.global_values),
+                                           (DataRead.table, old.tables, new.tables)):
+        old_values, new_values = old_values or {}, new_values or {}
+        for key in old_values.keys() | new_values.keys():
+            if key not in old_values or key not in new_values:
+                changes.append(source(key))
+            elif source is DataRead.table:
+                if old_values[key] is not new_values[key]:
+                    changes.append(source(key))
+            elif _values_differ(old_values[key], new_values[key]):
+                changes.append(source(key))
+    return changes
+
+
+class IncrementalProjection:
+    """Projection that keeps full results per model point so a change to reference data reruns only what it affects.
+
+    After run(), recalculate() is given the same model points with their changed RefData and the parts that
+    changed. Calcs that read the changed data, and every calc that calls them, are recomputed; the rest are
+    served from the previous results. Results for every model point are held in memory.
+    """
+
+    def __init__(self, calcs: list[Calc], dim_projection: DimProjection, graph: Optional[CalcGraph] = None):
+        self._sweep: TimeSweep = TimeSweep(calcs, dim_projection, graph)
+        self._calcs: list[Calc] = calcs
+        self._results: list[dict[str, np.ndarray]] = []
+        self._recalculated: set[str] = set()
+
+    @property
+    def results(self) -> list[dict[str, np.ndarray]]:
+        return self._results
+
+    @property
+    def recalculated(self) -> set[str]:
+        """Calcs recomputed by the last recalculate()."""
+        return set(self._recalculated)
+
+    def affected(self, changes: Iterable[DataRead]) -> set[str]:
+        return self._sweep.graph.affected_by(changes)
+
+    def _bound_names(self, names: set[str]) -> set[str]:
+        return {bound.name for calc in self._calcs if calc.original_name in names for bound in calc.bound_calcs()}
+
+    def run(self, data: Iterable[RefData]) -> list[dict[str, np.ndarray]]:
+        self._results = [self._sweep.run(model_point) for model_point in data]
+        self._recalculated = {calc.original_name for calc in self._calcs}
+        return self._results
+
+    def recalculate(self, data: Iterable[RefData], changes: Iterable[DataRead]) -> list[dict[str, np.ndarray]]:
+        affected = self.affected(changes)
+        graph = self._sweep.graph
+        # Unaffected calcs called directly by recomputed ones are served from earlier results, which also
+        # stops the recursion reaching anything further down
+        reused = {callee for name in affected for callee in graph.callees(name)} - affected
+        only = self._bound_names(affected)
+        seed_names = self._bound_names(reused)
+
+        num_model_points = 0
+        for i, model_point in enumerate(data):
+            if i >= len(self._results):
+                raise ValueError('More model points given than were in the original run')
+            if only:
+                seed = {name: values for name, values in self._results[i].items() if name in seed_names}
+                self._results[i].update(self._sweep.run(model_point, only=only, seed=seed))
+            num_model_points += 1
+        if num_model_points != len(self._results):
+            raise ValueError('Fewer model points given than were in the original run')
+
+        self._recalculated = affected
+        return self._results
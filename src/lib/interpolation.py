@@ -0,0 +1,56 @@
+from enum import Enum
+from typing import Any
+
+import numpy as np
+
+
+class InterpolationMethod(Enum):
+    LINEAR = 'linear'
+    LOG_LINEAR = 'log_linear'
+
+
+class Interpolator:
+    """Piecewise interpolation between breakpoints, held flat beyond the first and last breakpoint.
+
+    Breakpoints, values and slopes are computed once so that evaluating a whole array of keys is a
+    single searchsorted plus a fused multiply-add.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, method: InterpolationMethod = InterpolationMethod.LINEAR):
+        order = np.argsort(x, kind='stable')
+        x = np.asarray(x, dtype=np.float64)[order]
+        y = np.asarray(y, dtype=np.float64)[order]
+
+        if x.size == 0:
+            raise ValueError('Cannot interpolate without any breakpoints')
+        elif np.any(np.diff(x) == 0):
+            raise ValueError('Interpolation breakpoints must be unique')
+
+        if method == InterpolationMethod.LOG_LINEAR:
+            if np.any(y <= 0):
+                raise ValueError('Log-linear interpolation requires strictly positive values')
+            y = np.log(y)
+
+        self._method: InterpolationMethod = method
+        self._x: np.ndarray = x
+        self._y: np.ndarray = y
+        self._slopes: np.ndarray = np.diff(y) / np.diff(x) if x.size > 1 else np.zeros(1)
+
+    @property
+    def breakpoints(self) -> np.ndarray:
+        return self._x
+
+    def __call__(self, x: Any) -> Any:
+        x = np.asarray(x, dtype=np.float64)
+        if self._x.size == 1:
+            y = np.full(x.shape, self._y[0])
+        else:
+            x = np.clip(x, self._x[0], self._x[-1])
+            segment = np.clip(np.searchsorted(self._x, x, side='right') - 1, 0, self._x.size - 2)
+            y = self._y[segment] + self._slopes[segment] * (x - self._x[segment])
+            # Keep the final breakpoint exact rather than reaching it through the last slope
+            y = np.where(x == self._x[-1], self._y[-1], y)
+
+        if self._method == InterpolationMethod.LOG_LINEAR:
+            y = np.exp(y)
+        return y[()] if y.ndim == 0 else y
@@ -1,8 +1,11 @@
 from abc import ABC
+from typing import TYPE_CHECKING
 
-from src.lib.conf import ModelConfig
+if TYPE_CHECKING:
+    # pydantic is only needed once a config is built
+    from src.lib.conf import ModelConfig
 
 
 class Model(ABC):
     def __init__(self):
-        self._conf: ModelConfig
+        self._conf: 'ModelConfig'
@@ -0,0 +1,392 @@
+import builtins
+import dis
+import hashlib
+import inspect
+import io
+import sqlite3
+import sys
+import time
+import types
+from collections.abc import Callable, Collection, Iterable, Mapping
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from src.lib.cache import CachedFunction
+from src.lib.calculation import Calc
+from src.lib.dimension import Dimension, DimProjection
+from src.lib.execution import _declare_result_dtypes
+from src.lib.reference import RefData, RefTable, _array_digest
+from src.lib.results import ResultHandler
+from src.lib.scheduler import CalcGraph, DataRead, DataSource, TimeSweep, _raw_function
+
+_SQL_VARIABLE_LIMIT = 500
+
+
+def _update_digest(digest, value: Any):
+    if isinstance(value, Dimension):
+        value = value.value
+    if isinstance(value, np.ndarray):
+        digest.update(_array_digest(value))
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _update_digest(digest, item)
+    elif isinstance(value, RefTable):
+        digest.update(value.fingerprint().encode())
+    else:
+        digest.update(f'{type(value).__name__}:{value!r}'.encode())
+
+
+def _is_library(module: types.ModuleType) -> bool:
+    """Whether a module is part of Python or an installed package, rather than of the model."""
+    if module.__name__.partition('.')[0] in sys.stdlib_module_names:
+        return True
+    path = getattr(module, '__file__', None)
+    return path is None or 'site-packages' in Path(path).parts or 'dist-packages' in Path(path).parts
+
+
+def _global_loads(code: types.CodeType) -> dict[str, set[str]]:
+    """Global names a function's code reads, including in nested functions, with attributes read off each."""
+    loads: dict[str, set[str]] = {}
+    pending = [code]
+    while pending:
+        current = pending.pop()
+        pending.extend(const for const in current.co_consts if isinstance(const, types.CodeType))
+        instructions = list(dis.get_instructions(current))
+        for ins, following in zip(instructions, instructions[1:] + [None]):
+            if ins.opname in ('LOAD_GLOBAL', 'LOAD_NAME'):
+                attrs = loads.setdefault(ins.argval, set())
+                if following is not None and following.opname in ('LOAD_ATTR', 'LOAD_METHOD'):
+                    attrs.add(following.argval)
+    return loads
+
+
+def _digest_function(digest, func: Callable, seen: set[types.CodeType]) -> bool:
+    """Add a function's source and everything it reads from its globals, False if any of it is unknown."""
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return False
+    if code in seen:
+        return True
+    seen.add(code)
+    try:
+        digest.update(inspect.getsource(func).encode())
+    except (OSError, TypeError):
+        digest.update(repr((code.co_code, code.co_consts, code.co_names)).encode())
+
+    for name, attrs in sorted(_global_loads(code).items()):
+        digest.update(name.encode())
+        if name in func.__globals__:
+            if not _digest_global(digest, func.__globals__[name], attrs, seen):
+                return False
+        elif not hasattr(builtins, name):
+            return False
+    return True
+
+
+def _digest_global(digest, value: Any, attrs: set[str], seen: set[types.CodeType]) -> bool:
+    if isinstance(value, types.ModuleType):
+        digest.update(value.__name__.encode())
+        if _is_library(value):
+            return True
+        # Constants and helpers of another model module, read as module.name
+        for attr in sorted(attrs):
+            digest.update(attr.encode())
+            if not hasattr(value, attr) or not _digest_global(digest, getattr(value, attr), set(), seen):
+                return False
+        return True
+
+    if callable(value):
+        raw = _raw_function(value)
+        if inspect.isfunction(raw):
+            return _digest_function(digest, raw, seen)
+        module = sys.modules.get(getattr(value, '__module__', None) or '')
+        if module is not None and _is_library(module):
+            digest.update(f'{module.__name__}.{getattr(value, "__qualname__", repr(value))}'.encode())
+            return True
+        if inspect.isclass(value):
+            try:
+                digest.update(inspect.getsource(value).encode())
+                return True
+            except (OSError, TypeError):
+                return False
+        return False
+
+    if not isinstance(value, np.ndarray) and ' at 0x' in repr(value):
+        # Default reprs hold an address, which differs between processes
+        return False
+    _update_digest(digest, value)
+    return True
+
+
+def _code_digest(calc: Calc) -> Optional[bytes]:
+    """Digest of a calc's code and the helpers and module constants it reads, None if any cannot be resolved."""
+    digest = hashlib.sha256(repr((calc.origin_module, calc.group_name, calc.original_name)).encode())
+    if not _digest_function(digest, _raw_function(calc.function), set()):
+        return None
+    return digest.digest()
+
+
+def _table_digest(table: RefTable, column: Optional[str]) -> str:
+    if column is not None and column in table.non_index_cols:
+        return table.fingerprint(column)
+    return table.fingerprint()
+
+
+def _data_digest(data: RefData, reads: frozenset[DataRead]) -> bytes:
+    sources = {
+        DataSource.POLICY: data.policy_values or {},
+        DataSource.GLOBAL: data.global_values or {},
+        DataSource.TABLE: data.tables or {},
+    }
+    if any(read.source is None for read in reads):
+        reads = frozenset(DataRead(source) for source in DataSource)
+
+    digest = hashlib.sha256()
+    for read in sorted(reads, key=repr):
+        values = sources[read.source]
+        keys = sorted(values, key=str) if read.key is None else [read.key]
+        for key in keys:
+            digest.update(repr((read.source.value, key)).encode())
+            if key not in values:
+                digest.update(b'missing')
+            elif read.source == DataSource.TABLE:
+                digest.update(_table_digest(values[key], read.column).encode())
+            else:
+                _update_digest(digest, values[key])
+    return digest.digest()
+
+
+class CalcFingerprints:
+    """Keys identifying the result vector of each calc, and each alt dimension combo, for a model point.
+
+    A key covers the source of the calc and of every calc it reaches through calls, the helper functions and
+    module constants any of them read, its group and module, its alt dimension arguments, the t range, and
+    the parts of RefData read anywhere along those calls. Calcs reading something that cannot be digested,
+    such as an object without a stable repr, have no key and are always computed.
+    """
+
+    def __init__(self, calcs: list[Calc], graph: CalcGraph, t_values: list):
+        code = {calc.original_name: _code_digest(calc) for calc in calcs}
+        t_digest = hashlib.sha256()
+        _update_digest(t_digest, list(t_values))
+
+        self._reads: dict[str, frozenset[DataRead]] = {}
+        self._static: dict[str, tuple[str, Optional[bytes]]] = {}
+        for calc in calcs:
+            name = calc.original_name
+            reachable = self._reachable(name, graph)
+            self._reads[name] = frozenset(read for callee in reachable for read in graph.reads(callee))
+            calc_digest = None
+            if all(code.get(callee, b'') is not None for callee in reachable):
+                # Mutually recursive calcs reach the same set, so the calc's own code leads the digest
+                calc_digest = hashlib.sha256(code[name])
+                for callee in sorted(reachable):
+                    calc_digest.update(code.get(callee, callee.encode()))
+                calc_digest.update(t_digest.digest())
+
+            for combo in (calc.combos if calc.combos is not None else [()]):
+                combo_name = calc.combo_name(combo) if calc.combos is not None else calc.name
+                if calc_digest is None:
+                    self._static[combo_name] = (name, None)
+                    continue
+                digest = calc_digest.copy()
+                _update_digest(digest, sorted(calc.combo_kwargs(combo).items()))
+                self._static[combo_name] = (name, digest.digest())
+
+    @staticmethod
+    def _reachable(name: str, graph: CalcGraph) -> set[str]:
+        reachable = {name}
+        pending = [name]
+        while pending:
+            for callee in graph.callees(pending.pop()):
+                if callee not in reachable:
+                    reachable.add(callee)
+                    pending.append(callee)
+        return reachable
+
+    def original_name(self, name: str) -> str:
+        return self._static[name][0]
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._static)
+
+    def keys(self, data: RefData) -> dict[str, str]:
+        """Keys of the calcs and combos that have one."""
+        data_digests: dict[frozenset[DataRead], bytes] = {}
+        keys = {}
+        for name, (original_name, static_digest) in self._static.items():
+            if static_digest is None:
+                continue
+            reads = self._reads[original_name]
+            if reads not in data_digests:
+                data_digests[reads] = _data_digest(data, reads)
+            keys[name] = hashlib.sha256(static_digest + data_digests[reads]).hexdigest()
+        return keys
+
+
+class ResultStore:
+    """Content-addressed store of result vectors in a local SQLite file.
+
+    Entries beyond ``max_bytes`` are evicted least recently used first. Pickling ships the path, so worker
+    processes open the same file.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 1 << 30):
+        self._path: Path = Path(path)
+        self._max_bytes: int = max_bytes
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path, timeout=60)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                     '(key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, '
+                                     'used INTEGER NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        return self._connection
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def get_many(self, keys: Collection[str]) -> dict[str, np.ndarray]:
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), _SQL_VARIABLE_LIMIT):
+            chunk = keys[start:start + _SQL_VARIABLE_LIMIT]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._db.execute(f'SELECT key, data FROM results WHERE key IN ({placeholders})', chunk)
+            for key, data in rows:
+                found[key] = np.load(io.BytesIO(data), allow_pickle=False)
+
+        if found:
+            with self._db:
+                self._db.executemany('UPDATE results SET used = ? WHERE key = ?',
+                                     [(time.time_ns(), key) for key in found])
+        return found
+
+    def put_many(self, arrays: Mapping[str, np.ndarray]):
+        rows = []
+        for key, arr in arrays.items():
+            arr = np.asarray(arr)
+            if arr.dtype == object:
+                # Only plain numeric and string vectors are stored
+                continue
+            buffer = io.BytesIO()
+            np.save(buffer, arr, allow_pickle=False)
+            data = buffer.getvalue()
+            rows.append((key, data, len(data), time.time_ns()))
+
+        if rows:
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO results (key, data, size, used) VALUES (?, ?, ?, ?)', rows)
+            self._evict()
+
+    def _evict(self):
+        excess = self.size_bytes() - self._max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in self._db.execute('SELECT key, size FROM results ORDER BY used'):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        with self._db:
+            self._db.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+    def size_bytes(self) -> int:
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        with self._db:
+            self._db.execute('DELETE FROM results')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {'path': self._path, 'max_bytes': self._max_bytes}
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(state['path'], state['max_bytes'])
+
+    def __enter__(self) -> 'ResultStore':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PersistentProjection:
+    """Projection that reuses result vectors from a ResultStore and stores the ones it has to compute.
+
+    Calcs whose key is found are not recomputed; the remainder run with the stored vectors of the calcs they
+    call served from the cache. Hits and misses are reported by each calc's cache_info.
+    """
+
+    def __init__(self, calcs: list[Calc], dim_projection: DimProjection, store: ResultStore,
+                 graph: Optional[CalcGraph] = None):
+        self._sweep: TimeSweep = TimeSweep(calcs, dim_projection, graph)
+        self._store: ResultStore = store
+        self._t_values: list = list(dim_projection.t_range)
+        self._fingerprints: CalcFingerprints = CalcFingerprints(calcs, self._sweep.graph, self._t_values)
+        self._functions: dict[str, CachedFunction] = {
+            calc.original_name: calc.function for calc in calcs if isinstance(calc.function, CachedFunction)
+        }
+
+    def _record_lookups(self, hits: Iterable[str], misses: Iterable[str]):
+        counts: dict[str, list[int]] = {}
+        for index, names in enumerate((hits, misses)):
+            for name in names:
+                counts.setdefault(self._fingerprints.original_name(name), [0, 0])[index] += 1
+        for name, (num_hits, num_misses) in counts.items():
+            if name in self._functions:
+                self._functions[name].record_stored_lookups(num_hits, num_misses)
+
+    def run(self, data: RefData) -> dict[str, np.ndarray]:
+        """Results for one model point as one array per calc, indexed by position in t_range."""
+        names = self._fingerprints.names
+        keys = self._fingerprints.keys(data)
+        stored = self._store.get_many(set(keys.values()))
+        results = {name: stored[key] for name, key in keys.items() if key in stored}
+        missed = {name for name in names if name not in results}
+        self._record_lookups(results, missed)
+        if not missed:
+            return {name: results[name] for name in names}
+
+        graph = self._sweep.graph
+        called = {callee for name in missed for callee in graph.callees(self._fingerprints.original_name(name))}
+        seed = {name: values for name, values in results.items() if self._fingerprints.original_name(name) in called}
+        computed = self._sweep.run(data, only=missed, seed=seed)
+        self._store.put_many({keys[name]: computed[name] for name in missed if name in keys})
+        results.update(computed)
+        return {name: results[name] for name in names}
+
+    def project(self, data: Iterable[RefData], result_handler: ResultHandler):
+        """Stream rows laid out as run_calcs does, one per model point and t."""
+        _declare_result_dtypes(result_handler, self._t_values)
+        t_values = np.asarray(self._t_values)
+        first_id = 0
+        for model_point in data:
+            results = self.run(model_point)
+            batch_size = model_point.batch_size
+            if batch_size is None:
+                result_handler.add_results({'model_point': first_id, 't': t_values, **results})
+                first_id += 1
+            else:
+                ids = np.tile(np.arange(first_id, first_id + batch_size), len(t_values))
+                result_handler.add_results({'model_point': ids, 't': np.repeat(t_values, batch_size),
+                                            **{name: values.ravel() for name, values in results.items()}})
+                first_id += batch_size
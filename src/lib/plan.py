@@ -0,0 +1,119 @@
+import functools
+import hashlib
+import importlib
+import pickle
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Optional
+
+from src.lib.calculation import Calc, CalcType
+from src.lib.dimension import AltDimCombos
+from src.lib.discovery import signature_of
+from src.lib.dispatch import DispatchTable
+from src.lib.execution import CallPlans
+from src.lib.scheduler import CalcDependency, CalcGraph, DataRead
+from src.lib.types import FunctionDetails
+
+
+@dataclass(frozen=True)
+class CalcSpec:
+    """Picklable description of one Calc, resolved back to its function by import on the worker."""
+    name: str
+    function_name: str
+    module: str
+    type: CalcType
+    t_arg: Optional[str]
+    data_arg: Optional[str]
+    group_name: str
+    params: tuple[str, ...]
+    # Alt dimension combos as raw value ranges and positions, since alt dimension types are not picklable
+    # by reference. The types are recovered from the function's annotations.
+    dim_args: tuple[str, ...] = ()
+    dim_value_ranges: Optional[tuple[Sequence, ...]] = None
+    combo_positions: Optional[Sequence[int]] = None
+
+    @classmethod
+    def from_calc(cls, calc: Calc) -> 'CalcSpec':
+        func = calc.function.func if isinstance(calc.function, functools.partial) else calc.function
+        combos = calc.combos
+        return cls(
+            name=calc.name,
+            function_name=calc.original_name,
+            module=calc.origin_module,
+            type=calc.type,
+            t_arg=calc.t_arg,
+            data_arg=calc.data_arg,
+            group_name=calc.group_name,
+            params=signature_of(func).params,
+            dim_args=calc.dim_args,
+            dim_value_ranges=None if combos is None else combos.value_ranges,
+            combo_positions=None if combos is None else combos.positions
+        )
+
+
+_loaded_plans: dict[str, CallPlans] = {}
+
+
+@dataclass(frozen=True)
+class CalcPlan:
+    """Precompiled, picklable set of calcs and their dependency graph.
+
+    Built once by CalcRegistry.compile_plan and shipped to workers, where load() resolves the functions
+    once per process and hands every later partition the same call plans and warm function wrappers.
+    """
+    calcs: tuple[CalcSpec, ...]
+    dependencies: tuple[CalcDependency, ...]
+    # Sorted rather than held as sets, so the pickled plan and its fingerprint do not depend on hash order
+    data_reads: tuple[tuple[str, tuple[DataRead, ...]], ...] = ()
+    # Name and module of every function in the dispatch table, including those that are not calcs
+    functions: tuple[tuple[str, str], ...] = ()
+
+    @classmethod
+    def from_calcs(cls, calcs: list[Calc], graph: CalcGraph,
+                   dispatch_table: Optional[DispatchTable] = None) -> 'CalcPlan':
+        data_reads = tuple((name, tuple(sorted(reads, key=repr))) for name, reads in graph.data_reads.items())
+        if dispatch_table is not None:
+            functions = tuple((name, dispatch_table.module(name)) for name in dispatch_table)
+        else:
+            functions = tuple(dict.fromkeys((calc.original_name, calc.origin_module) for calc in calcs))
+        return cls(tuple(CalcSpec.from_calc(calc) for calc in calcs), tuple(graph.dependencies), data_reads, functions)
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        return hashlib.sha256(pickle.dumps((self.calcs, self.dependencies, self.data_reads,
+                                            self.functions))).hexdigest()
+
+    @property
+    def graph(self) -> CalcGraph:
+        data_reads = {name: frozenset(reads) for name, reads in self.data_reads}
+        return CalcGraph([spec.function_name for spec in self.calcs], list(self.dependencies), data_reads)
+
+    def _dispatch_table(self) -> DispatchTable:
+        functions = []
+        for name, module_name in self.functions:
+            func = getattr(importlib.import_module(module_name), name)
+            functions.append(FunctionDetails(name, func, module_name, getattr(func, '_group_name', None)))
+        return DispatchTable(functions)
+
+    def create_calculations(self) -> list[Calc]:
+        calcs = []
+        dispatch_table = self._dispatch_table()
+        for spec in self.calcs:
+            func = dispatch_table[spec.function_name]
+
+            combos = None
+            if spec.dim_value_ranges is not None:
+                annotations = func.__wrapped__.__annotations__
+                dim_types = [annotations[arg] for arg in spec.dim_args]
+                combos = AltDimCombos(dim_types, spec.dim_value_ranges, spec.combo_positions)
+
+            calcs.append(Calc(name=spec.name, function=func, type=spec.type, t_arg=spec.t_arg,
+                              data_arg=spec.data_arg, group_name=spec.group_name, origin_module=spec.module,
+                              dim_args=spec.dim_args, combos=combos))
+        return calcs
+
+    def load(self) -> CallPlans:
+        """Call plans for this plan, built on first use in each process and reused afterwards."""
+        if self.fingerprint not in _loaded_plans:
+            _loaded_plans[self.fingerprint] = CallPlans(self.create_calculations(), self.graph)
+        return _loaded_plans[self.fingerprint]
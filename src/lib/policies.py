@@ -0,0 +1,119 @@
+import threading
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+from queue import Queue
+from typing import Any, Optional
+
+import numpy as np
+from numpy.typing import DTypeLike
+
+from src.lib.reference import RefData, RefTable
+
+_DONE = object()
+
+
+def model_points_from_columns(columns: Mapping[str, np.ndarray], tables: Optional[dict[str, RefTable]] = None,
+                              global_values: Optional[dict[str, Any]] = None,
+                              batched: bool = False) -> Iterator[RefData]:
+    """Model points for policies held as columns: one batched RefData, or one RefData of scalars per policy."""
+    if batched:
+        yield RefData(policy_values=dict(columns), tables=tables, global_values=global_values)
+        return
+
+    cols = list(columns.keys())
+    for values in zip(*(np.asarray(columns[col]).tolist() for col in cols)):
+        yield RefData(policy_values=dict(zip(cols, values)), tables=tables, global_values=global_values)
+
+
+class PolicySource:
+    """Streams a CSV or Parquet policy file in chunks of ``chunk_size`` rows, one array per column.
+
+    Only the columns named in ``dtypes`` are read, and each is parsed straight to its declared dtype, so
+    memory is bounded by the chunk size rather than the file size. The format is taken from the file
+    suffix unless given.
+    """
+
+    def __init__(self, path: str | Path, dtypes: Mapping[str, DTypeLike], chunk_size: int = 10_000,
+                 file_format: Optional[str] = None):
+        if chunk_size < 1:
+            raise ValueError('Chunk size must be at least 1')
+        self._path: Path = Path(path)
+        self._dtypes: dict[str, np.dtype] = {col: np.dtype(dtype) for col, dtype in dtypes.items()}
+        self._chunk_size: int = chunk_size
+        self._format: str = (file_format or self._path.suffix.lstrip('.')).lower()
+        if self._format not in ('csv', 'parquet'):
+            raise ValueError(f'Unsupported policy file format: {self._format}')
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def dtypes(self) -> dict[str, np.dtype]:
+        return dict(self._dtypes)
+
+    @property
+    def chunk_size(self) -> int:
+        return self._chunk_size
+
+    def _csv_chunks(self) -> Iterator[dict[str, np.ndarray]]:
+        import pandas as pd
+
+        with pd.read_csv(self._path, usecols=list(self._dtypes), dtype=self._dtypes,
+                         chunksize=self._chunk_size) as reader:
+            for frame in reader:
+                yield {col: frame[col].to_numpy(dtype=dtype) for col, dtype in self._dtypes.items()}
+
+    def _parquet_chunks(self) -> Iterator[dict[str, np.ndarray]]:
+        import pyarrow.parquet as pq
+
+        policy_file = pq.ParquetFile(self._path)
+        for batch in policy_file.iter_batches(batch_size=self._chunk_size, columns=list(self._dtypes)):
+            yield {col: batch.column(col).to_numpy(zero_copy_only=False).astype(dtype, copy=False)
+                   for col, dtype in self._dtypes.items()}
+
+    def chunks(self, prefetch: int = 0) -> Iterator[dict[str, np.ndarray]]:
+        """Chunks of policy columns in file order.
+
+        With ``prefetch`` above zero, chunks are read on a background thread up to that many ahead of the
+        consumer, so parsing the file overlaps with projecting the previous chunk.
+        """
+        chunks = self._csv_chunks() if self._format == 'csv' else self._parquet_chunks()
+        if prefetch <= 0:
+            yield from chunks
+            return
+
+        queue: Queue = Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def read():
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    queue.put(chunk)
+                queue.put(_DONE)
+            except BaseException as e:
+                queue.put(e)
+
+        reader = threading.Thread(target=read, name='policy-reader', daemon=True)
+        reader.start()
+        try:
+            while (item := queue.get()) is not _DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # Unblock a reader waiting on a full queue so it sees the stop flag
+            while reader.is_alive():
+                while not queue.empty():
+                    queue.get_nowait()
+                reader.join(timeout=0.01)
+
+    def model_points(self, tables: Optional[dict[str, RefTable]] = None,
+                     global_values: Optional[dict[str, Any]] = None, batched: bool = False,
+                     prefetch: int = 2) -> Iterator[RefData]:
+        """Model points for every policy in the file, one per policy or one batch per chunk, for run_calcs."""
+        for chunk in self.chunks(prefetch):
+            yield from model_points_from_columns(chunk, tables, global_values, batched)
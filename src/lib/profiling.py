@@ -0,0 +1,184 @@
+import json
+import time
+from collections import defaultdict
+from contextvars import ContextVar, Token
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+_UNNAMED_TABLE = 'unnamed'
+
+
+@dataclass
+class CalcProfile:
+    calls: int = 0
+    cache_hits: int = 0
+    cumulative_s: float = 0.0
+    self_s: float = 0.0
+    max_recursion_depth: int = 0
+    table_lookups: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        return self.cache_hits / self.calls if self.calls else None
+
+    def merge(self, other: 'CalcProfile'):
+        self.calls += other.calls
+        self.cache_hits += other.cache_hits
+        self.cumulative_s += other.cumulative_s
+        self.self_s += other.self_s
+        self.max_recursion_depth = max(self.max_recursion_depth, other.max_recursion_depth)
+        for table, count in other.table_lookups.items():
+            self.table_lookups[table] = self.table_lookups.get(table, 0) + count
+
+
+@dataclass
+class ProfileReport:
+    """Profile of one or more runs, picklable and mergeable so worker profiles can be combined."""
+    calcs: dict[str, CalcProfile] = field(default_factory=dict)
+    # Self time in seconds of each call stack, outermost calc first
+    stacks: dict[tuple[str, ...], float] = field(default_factory=dict)
+
+    @property
+    def table_lookups(self) -> dict[str, int]:
+        totals: dict[str, int] = defaultdict(int)
+        for profile in self.calcs.values():
+            for table, count in profile.table_lookups.items():
+                totals[table] += count
+        return dict(totals)
+
+    def merge(self, other: 'ProfileReport') -> 'ProfileReport':
+        for name, profile in other.calcs.items():
+            self.calcs.setdefault(name, CalcProfile()).merge(profile)
+        for stack, seconds in other.stacks.items():
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + seconds
+        return self
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'calcs': {name: {**asdict(profile), 'hit_ratio': profile.hit_ratio}
+                      for name, profile in sorted(self.calcs.items(), key=lambda item: -item[1].self_s)},
+            'table_lookups': self.table_lookups,
+        }
+
+    def collapsed_stacks(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope, weighted in microseconds."""
+        lines = [f"{';'.join(stack)} {round(seconds * 1e6)}" for stack, seconds in sorted(self.stacks.items())]
+        return '\n'.join(line for line in lines if not line.endswith(' 0'))
+
+    def write_json(self, path: str | Path):
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2))
+
+    def write_collapsed(self, path: str | Path):
+        Path(path).write_text(self.collapsed_stacks() + '\n')
+
+    def summary(self, limit: int = 20) -> str:
+        header = f"{'calc':<30}{'calls':>12}{'hit ratio':>11}{'self s':>10}{'cum s':>10}{'depth':>7}"
+        rows = [header]
+        for name, profile in sorted(self.calcs.items(), key=lambda item: -item[1].self_s)[:limit]:
+            hit_ratio = f'{profile.hit_ratio:.1%}' if profile.hit_ratio is not None else '-'
+            rows.append(f'{name:<30}{profile.calls:>12,}{hit_ratio:>11}{profile.self_s:>10.3f}'
+                        f'{profile.cumulative_s:>10.3f}{profile.max_recursion_depth:>7}')
+        return '\n'.join(rows)
+
+
+class _StackNode:
+    """Call stack position. Re-entering a calc already on the path returns to its node, folding recursion."""
+    __slots__ = ('name', 'path', 'children', 'ancestors', 'self_ns')
+
+    def __init__(self, name: Optional[str], parent: Optional['_StackNode']):
+        self.name: Optional[str] = name
+        self.path: tuple[str, ...] = () if parent is None else parent.path + (name,)
+        self.children: dict[str, _StackNode] = {}
+        self.ancestors: dict[str, _StackNode] = {} if parent is None else {**parent.ancestors, name: self}
+        self.self_ns: int = 0
+
+    def enter(self, name: str) -> '_StackNode':
+        node = self.ancestors.get(name) or self.children.get(name)
+        if node is None:
+            node = self.children[name] = _StackNode(name, self)
+        return node
+
+    def walk(self):
+        yield self
+        for child in self.children.values():
+            yield from child.walk()
+
+
+class CalcProfiler:
+    """Opt-in instrumentation of calc calls and table lookups while active.
+
+    Used as a context manager around a run. Each calc call records its count, whether it was a cache hit,
+    its self and cumulative time, and its recursion depth; table lookups are attributed to the calc
+    making them. Tables are named after their key in the RefData of the model point being run.
+    """
+
+    def __init__(self):
+        self._calcs: dict[str, CalcProfile] = defaultdict(CalcProfile)
+        self._root: _StackNode = _StackNode(None, None)
+        # Node, start time and time spent in calls made from it, for each active call
+        self._frames: list[list] = []
+        self._node: _StackNode = self._root
+        self._depths: dict[str, int] = defaultdict(int)
+        self._table_names: dict[int, str] = {}
+        self._tokens: list[Token] = []
+
+    def name_tables(self, tables: Optional[dict[str, Any]]):
+        for name, table in (tables or {}).items():
+            self._table_names[id(table)] = name
+
+    def profile_call(self, name: str, func: Callable[..., tuple[Any, bool]], *args) -> Any:
+        """Call func, which returns a value and whether it came from the cache, timing it as calc name."""
+        depth = self._depths[name] = self._depths[name] + 1
+        profile = self._calcs[name]
+        profile.max_recursion_depth = max(profile.max_recursion_depth, depth)
+        parent = self._node
+        self._node = parent.enter(name)
+        frame = [self._node, time.perf_counter_ns(), 0]
+        self._frames.append(frame)
+        hit = False
+        try:
+            value, hit = func(*args)
+            return value
+        finally:
+            elapsed = time.perf_counter_ns() - frame[1]
+            self._frames.pop()
+            self._node = parent
+            self_ns = elapsed - frame[2]
+            frame[0].self_ns += self_ns
+            if self._frames:
+                self._frames[-1][2] += elapsed
+
+            profile.calls += 1
+            profile.cache_hits += hit
+            profile.self_s += self_ns / 1e9
+            self._depths[name] = depth - 1
+            if depth == 1:
+                # Time inside recursive calls is already part of the outermost call
+                profile.cumulative_s += elapsed / 1e9
+
+    def count_lookup(self, table: Any):
+        caller = self._node.name if self._node.name is not None else '<no calc>'
+        table_name = self._table_names.get(id(table), _UNNAMED_TABLE)
+        lookups = self._calcs[caller].table_lookups
+        lookups[table_name] = lookups.get(table_name, 0) + 1
+
+    def report(self) -> ProfileReport:
+        stacks = {node.path: node.self_ns / 1e9 for node in self._root.walk() if node.self_ns}
+        calcs = {name: CalcProfile(**{**asdict(profile), 'table_lookups': dict(profile.table_lookups)})
+                 for name, profile in self._calcs.items()}
+        return ProfileReport(calcs, stacks)
+
+    def __enter__(self) -> 'CalcProfiler':
+        self._tokens.append(_active_profiler.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _active_profiler.reset(self._tokens.pop())
+
+
+_active_profiler: ContextVar[Optional[CalcProfiler]] = ContextVar('_active_profiler', default=None)
+
+
+def active_profiler() -> Optional[CalcProfiler]:
+    return _active_profiler.get()
@@ -1,10 +1,19 @@
+import hashlib
+import json
 from abc import ABC, abstractmethod
+from collections.abc import Iterator, Mapping
 from pathlib import Path
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 from dataclasses import dataclass
 
 import numpy as np
 
+from src.lib.interpolation import Interpolator, InterpolationMethod
+from src.lib.profiling import _active_profiler
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
 
 @dataclass(frozen=True)
 class LookupArgs:
@@ -13,10 +22,99 @@ class LookupArgs:
     interpolated_lookup: bool
 
 
+class _CompiledIndex:
+    """Maps index keys to row positions, addressing rows by integer offset when the index is dense integers."""
+
+    def __init__(self, index_arrays: list[np.ndarray]):
+        self._num_rows: int = len(index_arrays[0]) if index_arrays else 0
+        self._offset: Optional[int] = None
+        self._positions: Optional[np.ndarray] = None
+        self._row_map: Optional[dict[Any, int]] = None
+        self._position_list: Optional[list[int]] = None
+
+        if len(index_arrays) == 1 and self._is_dense_integer(index_arrays[0]):
+            keys = index_arrays[0].astype(np.int64)
+            self._offset = int(keys.min())
+            self._positions = np.full(int(keys.max()) - self._offset + 1, -1, dtype=np.int64)
+            self._positions[keys - self._offset] = np.arange(self._num_rows)
+            # Scalar lookups index a plain list, which is faster than indexing the array for single items
+            self._position_list = self._positions.tolist()
+        elif len(index_arrays) == 1:
+            self._row_map = {key: row for row, key in enumerate(index_arrays[0].tolist())}
+        else:
+            self._row_map = {key: row for row, key in enumerate(zip(*(arr.tolist() for arr in index_arrays)))}
+
+    @classmethod
+    def from_dense(cls, offset: int, positions: np.ndarray, num_rows: Optional[int] = None) -> '_CompiledIndex':
+        index = cls([])
+        # Counted from the positions only when not given, since that reads every page of them
+        index._num_rows = int((positions >= 0).sum()) if num_rows is None else num_rows
+        index._offset = offset
+        # Positions may be memory mapped, so they are not copied into a list here
+        index._positions = positions
+        return index
+
+    @property
+    def dense(self) -> Optional[tuple[int, np.ndarray]]:
+        """Offset and position array when keys are dense integers, None for a hashed index."""
+        return None if self._positions is None else (self._offset, self._positions)
+
+    @staticmethod
+    def _is_dense_integer(keys: np.ndarray) -> bool:
+        if keys.size == 0 or keys.dtype.kind not in 'iuf':
+            return False
+        if keys.dtype.kind == 'f' and not np.array_equal(keys, np.floor(keys)):
+            return False
+        span = keys.max() - keys.min() + 1
+        return span <= 2 * keys.size
+
+    def position(self, key: tuple) -> int:
+        if self._positions is not None:
+            key_value = int(key[0]) if isinstance(key[0], float) and key[0].is_integer() else key[0]
+            try:
+                offset = key_value - self._offset
+                positions = self._positions if self._position_list is None else self._position_list
+                row = int(positions[offset]) if offset >= 0 else -1
+            except (TypeError, IndexError):
+                row = -1
+            if row >= 0:
+                return row
+        else:
+            row = self._row_map.get(key[0] if len(key) == 1 else key)
+            if row is not None:
+                return row
+        raise KeyError(key[0] if len(key) == 1 else key)
+
+    def positions(self, keys: list[np.ndarray]) -> np.ndarray:
+        if self._positions is not None:
+            offsets = keys[0] - self._offset
+            valid = (offsets >= 0) & (offsets < len(self._positions)) & (offsets == np.floor(offsets))
+            rows = np.full(offsets.shape, -1, dtype=np.int64)
+            rows[valid] = self._positions[offsets[valid].astype(np.int64)]
+        else:
+            flat_keys = keys[0].tolist() if len(keys) == 1 else zip(*(key.tolist() for key in keys))
+            rows = np.fromiter((self._row_map.get(key, -1) for key in flat_keys), dtype=np.int64, count=keys[0].size)
+
+        if (rows < 0).any():
+            raise KeyError('Index values not found in table')
+        return rows
+
+
+def _array_digest(arr: np.ndarray) -> bytes:
+    arr = np.asarray(arr)
+    # Strings are digested as fixed width so object and memory-mapped copies of a table agree
+    arr = arr.astype(str) if arr.dtype == object else arr
+    digest = hashlib.sha256(f'{arr.dtype.str}{arr.shape}'.encode())
+    digest.update(np.ascontiguousarray(arr).tobytes())
+    return digest.digest()
+
+
 class RefTable(ABC):
     def __init__(self, index_cols: list[str]):
         self._index_cols: list[str] = index_cols
         self._upper_col_bound: Optional[int] = None
+        self._interpolators: dict[tuple, Any] = {}
+        self._digests: dict[tuple[bool, str], bytes] = {}
 
     @staticmethod
     def _set_upper_col_bound(non_index_col_names: list[str]) -> Optional[int]:
@@ -49,33 +147,238 @@ class RefTable(ABC):
     def col_array(self, col_name: str) -> np.ndarray:
         pass
 
+    @abstractmethod
+    def index_array(self, col_name: str) -> np.ndarray:
+        pass
+
     @abstractmethod
     def _retrieve_value(self, index_values: dict[str, Any], return_col: str) -> Optional[Any]:
         pass
 
-    def interpolated_lookup(self, index_values: dict[str, Any], return_col: str):
-        raise NotImplementedError()
+    def _column_digest(self, col: str, is_index: bool) -> bytes:
+        key = (is_index, col)
+        if key not in self._digests:
+            self._digests[key] = _array_digest(self.index_array(col) if is_index else self.col_array(col))
+        return self._digests[key]
+
+    def refresh(self):
+        """Forget digests and interpolators derived from the table's data, after changing it in place."""
+        self._digests.clear()
+        self._interpolators.clear()
+
+    def fingerprint(self, column: Optional[str] = None) -> str:
+        """Digest of the table contents, or of its index and a single column, that is stable across processes.
+
+        Column digests are computed once per table, so later fingerprints cost no more than a few hashes.
+        Assigning a new frame to a CsvTable resets them, but arrays changed in place are not noticed until
+        refresh() is called.
+        """
+        digest = hashlib.sha256()
+        for is_index, cols in ((True, self.index_cols), (False, self.non_index_cols if column is None else [column])):
+            for col in cols:
+                digest.update(repr((is_index, str(col))).encode())
+                digest.update(self._column_digest(col, is_index))
+        return digest.hexdigest()
+
+    def _retrieve_values(self, index_values: dict[str, Any], return_col: str) -> np.ndarray:
+        """Batched lookup where at least one index value is an array; backends should override."""
+        keys = np.broadcast_arrays(*(np.asarray(index_values[col]) for col in self.index_cols))
+        flat_keys = [key.ravel() for key in keys]
+        values = [
+            self._retrieve_value(dict(zip(self.index_cols, row)), return_col)
+            for row in zip(*flat_keys)
+        ]
+        return np.asarray(values).reshape(keys[0].shape)
+
+    def lookup_many(self, index_arrays: dict[str, Any], return_col: str) -> np.ndarray:
+        """Look up one value per element of the broadcast index arrays."""
+        missing_index_cols = [col for col in self.index_cols if col not in index_arrays.keys()]
+        if missing_index_cols:
+            raise LookupError(f"Not all index columns specified: {', '.join(missing_index_cols)}")
+
+        self._count_lookup()
+        return self._retrieve_values(index_arrays, return_col)
+
+    def _count_lookup(self):
+        profiler = _active_profiler.get()
+        if profiler is not None:
+            profiler.count_lookup(self)
+
+    @property
+    def duration_cols(self) -> dict[int, str]:
+        """Integer named columns, such as select period durations, keyed by their duration."""
+        durations = {}
+        for col in self.non_index_cols:
+            try:
+                durations[int(col)] = col
+            except (ValueError, TypeError):
+                continue
+        return dict(sorted(durations.items()))
+
+    def _index_interpolators(self, return_col: str, interpolate_on: str,
+                             method: InterpolationMethod) -> dict[tuple, Interpolator]:
+        key = ('index', return_col, interpolate_on, method)
+        if key not in self._interpolators:
+            other_cols = [col for col in self.index_cols if col != interpolate_on]
+            x = self.index_array(interpolate_on)
+            y = self.col_array(return_col)
+            rows_by_group: dict[tuple, list[int]] = {}
+            group_keys = zip(*(self.index_array(col).tolist() for col in other_cols)) if other_cols else [()] * len(x)
+            for row, group in enumerate(group_keys):
+                rows_by_group.setdefault(group, []).append(row)
+            self._interpolators[key] = {group: Interpolator(x[rows], y[rows], method)
+                                        for group, rows in rows_by_group.items()}
+        return self._interpolators[key]
+
+    def _interpolate_index(self, index_values: dict[str, Any], return_col: str, interpolate_on: str,
+                           method: InterpolationMethod) -> Any:
+        if interpolate_on not in self.index_cols:
+            raise LookupError(f"Cannot interpolate on {interpolate_on}, it is not an index column")
+
+        interpolators = self._index_interpolators(return_col, interpolate_on, method)
+        other_cols = [col for col in self.index_cols if col != interpolate_on]
+        if not other_cols:
+            return interpolators[()](index_values[interpolate_on])
+
+        keys = np.broadcast_arrays(*(np.asarray(index_values[col]) for col in [interpolate_on] + other_cols))
+        if keys[0].ndim == 0:
+            return interpolators[tuple(key.item() for key in keys[1:])](keys[0])
+
+        x = keys[0].ravel()
+        # Group ids come from the codes of each key column, so keys of mixed types are never cast to a common one
+        uniques, codes = zip(*(np.unique(key.ravel(), return_inverse=True) for key in keys[1:]))
+        combos, group_ids = np.unique(np.stack([code.ravel() for code in codes], axis=1), axis=0, return_inverse=True)
+        group_ids = group_ids.ravel()
+        unique_values = [unique.tolist() for unique in uniques]
+
+        # Keys sorted by group, so each group is interpolated over one contiguous slice
+        order = np.argsort(group_ids, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(group_ids, minlength=len(combos)))])
+        result = np.empty(x.shape, dtype=np.float64)
+        for i, combo in enumerate(combos):
+            rows = order[bounds[i]:bounds[i + 1]]
+            group = tuple(values[code] for values, code in zip(unique_values, combo))
+            result[rows] = interpolators[group](x[rows])
+        return result.reshape(keys[0].shape)
+
+    def _interpolate_durations(self, index_values: dict[str, Any], duration: Any, interpolate_on: Optional[str],
+                               method: InterpolationMethod) -> Any:
+        duration_cols = self.duration_cols
+        if not duration_cols:
+            raise LookupError('Table has no integer named duration columns to interpolate across')
+
+        breakpoints = np.array(list(duration_cols.keys()), dtype=np.float64)
+        names = list(duration_cols.values())
+
+        def col_values(col: str) -> Any:
+            if interpolate_on is not None:
+                return self._interpolate_index(index_values, col, interpolate_on, method)
+            elif any(isinstance(index_values[index_col], np.ndarray) for index_col in self.index_cols):
+                return self._retrieve_values(index_values, col)
+            return self._retrieve_value(index_values, col)
+
+        if len(names) == 1:
+            return col_values(names[0])
+
+        # Durations beyond the upper bound fall into the final (ultimate) column
+        d = np.clip(np.asarray(duration, dtype=np.float64), breakpoints[0], self._upper_col_bound)
+        lower = np.clip(np.searchsorted(breakpoints, d, side='right') - 1, 0, len(names) - 2)
+        weight = (d - breakpoints[lower]) / (breakpoints[lower + 1] - breakpoints[lower])
+
+        values = {i: np.asarray(col_values(names[i]), dtype=np.float64) for i in np.unique(np.append(lower, lower + 1))}
+        lower, *columns = np.broadcast_arrays(lower, *(values.get(i, np.nan) for i in range(len(names))))
+        stacked = np.stack(columns)
+        lower_values = np.take_along_axis(stacked, lower[np.newaxis], axis=0)[0]
+        upper_values = np.take_along_axis(stacked, lower[np.newaxis] + 1, axis=0)[0]
+
+        if method == InterpolationMethod.LOG_LINEAR:
+            if np.any(lower_values <= 0) or np.any(upper_values <= 0):
+                raise ValueError('Log-linear interpolation requires strictly positive values')
+            result = np.exp(np.log(lower_values) + weight * (np.log(upper_values) - np.log(lower_values)))
+        else:
+            result = lower_values + weight * (upper_values - lower_values)
+        result = np.where(weight == 0, lower_values, result)
+        return result[()] if result.ndim == 0 else result
+
+    def interpolated_lookup(self, index_values: dict[str, Any], return_col: Any,
+                            method: InterpolationMethod = InterpolationMethod.LINEAR,
+                            interpolate_on: Optional[str] = None) -> Any:
+        """Interpolate between table entries for scalar or array keys.
+
+        A numeric return_col is treated as a duration and interpolated across the integer named
+        columns, with index values matched exactly unless interpolate_on names an index column.
+        A column name return_col is interpolated along interpolate_on, defaulting to the last index column.
+        """
+        missing_index_cols = [col for col in self.index_cols if col not in index_values.keys()]
+        if missing_index_cols:
+            raise LookupError(f"Not all index columns specified: {', '.join(missing_index_cols)}")
+
+        self._count_lookup()
+        if isinstance(return_col, str):
+            return self._interpolate_index(index_values, return_col, interpolate_on or self.index_cols[-1], method)
+        else:
+            return self._interpolate_durations(index_values, return_col, interpolate_on, method)
+
+    def lookup_with(self, args: LookupArgs) -> Any:
+        return self.lookup(args.index_values, args.return_col, args.interpolated_lookup)
 
     def lookup(self, index_values: dict[str, Any], return_col: str, interpolated_lookup: bool = False) -> Any:
         missing_index_cols = [col for col in self.index_cols if col not in index_values.keys()]
         if missing_index_cols:
-            raise LookupError(f"Not all index columns specified: {", ".join(missing_index_cols)}")
+            raise LookupError(f"Not all index columns specified: {', '.join(missing_index_cols)}")
 
         if interpolated_lookup:
-            pass
+            return self.interpolated_lookup(index_values, return_col)
+        elif any(isinstance(index_values[col], np.ndarray) for col in self.index_cols):
+            return self.lookup_many(index_values, return_col)
         else:
+            self._count_lookup()
             return self._retrieve_value(index_values, return_col)
 
 
 class CsvTable(RefTable):
-    from pandas import DataFrame
+    """Table read with pandas, which is imported when the first CsvTable is created rather than with this module."""
 
-    def __init__(self, index_cols: list[str], csv: str | Path | DataFrame):
+    def __init__(self, index_cols: list[str], csv: 'str | Path | DataFrame'):
         super().__init__(index_cols)
         self._df = self._get_df(csv, index_cols)
+
+    @property
+    def _df(self) -> 'DataFrame':
+        return self._frame
+
+    @_df.setter
+    def _df(self, df: 'DataFrame'):
+        self._frame = df
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the lookup index and forget digests, after the frame was changed in place."""
+        super().refresh()
         self._upper_col_bound = self._set_upper_col_bound(self.non_index_cols)
+        self._compile()
+
+    def _compile(self):
+        """Build the lookup index and column arrays used in place of pandas indexing on the hot path."""
+        self._columns: dict[str, np.ndarray] = {col: self._df[col].to_numpy() for col in self.non_index_cols}
+        if self._df.index.is_unique:
+            index_arrays = [self._df.index.get_level_values(level).to_numpy() for level in self._df.index.names]
+            self._lookup_index: Optional[_CompiledIndex] = _CompiledIndex(index_arrays)
+        else:
+            self._lookup_index = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        # The compiled structures are rebuilt on unpickling rather than shipped alongside the DataFrame
+        state = self.__dict__.copy()
+        del state['_columns'], state['_lookup_index']
+        state['_interpolators'] = {}
+        return state
 
-    def _get_df(self, csv: str | Path | DataFrame, index_cols: list[str]) -> DataFrame:
+    def __setstate__(self, state: dict[str, Any]):
+        self.__dict__.update(state)
+        self._compile()
+
+    def _get_df(self, csv: 'str | Path | DataFrame', index_cols: list[str]) -> 'DataFrame':
         from pandas import read_csv, DataFrame
 
         df = csv if isinstance(csv, DataFrame) else read_csv(csv)
@@ -96,6 +399,9 @@ class CsvTable(RefTable):
     def col_array(self, col_name: str) -> np.ndarray:
         return self._df[col_name].to_numpy()
 
+    def index_array(self, col_name: str) -> np.ndarray:
+        return self._df.index.get_level_values(col_name).to_numpy()
+
     @property
     def non_index_cols(self) -> list[str]:
         return [col for col in self._df.columns if col not in self._df.index.names]
@@ -104,6 +410,9 @@ class CsvTable(RefTable):
         from pandas import Series
 
         index_tuple = tuple(index_values[level] for level in self._df.index.names)
+        if self._lookup_index is not None and return_col in self._columns:
+            return self._columns[return_col][self._lookup_index.position(index_tuple)]
+
         retrieved_value = self._df.loc[index_tuple, return_col]
 
         if isinstance(retrieved_value, Series):
@@ -112,6 +421,163 @@ class CsvTable(RefTable):
         else:
             return retrieved_value
 
+    def _retrieve_values(self, index_values: dict[str, Any], return_col: str) -> np.ndarray:
+        from pandas import MultiIndex
+
+        keys = np.broadcast_arrays(*(np.asarray(index_values[level]) for level in self._df.index.names))
+        if self._lookup_index is not None and return_col in self._columns:
+            flat_keys = [key.ravel() for key in keys]
+            return self._columns[return_col][self._lookup_index.positions(flat_keys)].reshape(keys[0].shape)
+
+        if self._df.index.nlevels == 1:
+            positions = self._df.index.get_indexer(keys[0].ravel())
+        else:
+            positions = self._df.index.get_indexer(MultiIndex.from_arrays([key.ravel() for key in keys]))
+
+        if (positions < 0).any():
+            raise KeyError(f"Index values not found in table: {', '.join(self._df.index.names)}")
+
+        return self.col_array(return_col)[positions].reshape(keys[0].shape)
+
+
+class ArrayTable(RefTable):
+    """Reference table held as one NumPy array per column."""
+
+    def __init__(self, index_cols: list[str], index_arrays: Mapping[str, np.ndarray],
+                 columns: Mapping[str, np.ndarray], lookup_index: Optional[_CompiledIndex] = None):
+        super().__init__(index_cols)
+        missing_index_cols = [col for col in index_cols if col not in index_arrays]
+        if missing_index_cols:
+            raise ValueError(f"The following index columns have no array: {', '.join(missing_index_cols)}")
+
+        self._index_arrays: Mapping[str, np.ndarray] = index_arrays
+        self._columns: Mapping[str, np.ndarray] = columns
+        self._lookup_index: Optional[_CompiledIndex] = lookup_index
+        self._upper_col_bound = self._set_upper_col_bound(self.non_index_cols)
+
+    @classmethod
+    def from_table(cls, table: RefTable) -> 'ArrayTable':
+        return cls(table.index_cols,
+                   {col: np.asarray(table.index_array(col)) for col in table.index_cols},
+                   {col: np.asarray(table.col_array(col)) for col in table.non_index_cols})
+
+    def refresh(self):
+        """Forget the lookup index and digests, after the arrays were changed in place."""
+        super().refresh()
+        self._lookup_index = None
+        self._upper_col_bound = self._set_upper_col_bound(self.non_index_cols)
+
+    @property
+    def _index(self) -> _CompiledIndex:
+        if self._lookup_index is None:
+            self._lookup_index = _CompiledIndex([self._index_arrays[col] for col in self.index_cols])
+        return self._lookup_index
+
+    @property
+    def non_index_cols(self) -> list[str]:
+        return list(self._columns.keys())
+
+    def col_array(self, col_name: str) -> np.ndarray:
+        return self._columns[col_name]
+
+    def index_array(self, col_name: str) -> np.ndarray:
+        return self._index_arrays[col_name]
+
+    def _retrieve_value(self, index_values: dict[str, Any], return_col: str) -> Optional[Any]:
+        return self._columns[return_col][self._index.position(tuple(index_values[col] for col in self.index_cols))]
+
+    def _retrieve_values(self, index_values: dict[str, Any], return_col: str) -> np.ndarray:
+        keys = np.broadcast_arrays(*(np.asarray(index_values[col]) for col in self.index_cols))
+        positions = self._index.positions([key.ravel() for key in keys])
+        return self._columns[return_col][positions].reshape(keys[0].shape)
+
+
+class _MmapColumns(Mapping):
+    """Opens column files as read-only memory maps the first time each column is used."""
+
+    def __init__(self, directory: Path, files: dict[str, str]):
+        self._directory: Path = directory
+        self._files: dict[str, str] = files
+        self._arrays: dict[str, np.ndarray] = {}
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        if col not in self._arrays:
+            self._arrays[col] = np.load(self._directory / self._files[col], mmap_mode='r')
+        return self._arrays[col]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._files)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+
+class MmapTable(ArrayTable):
+    """Reference table stored as one .npy file per column plus a JSON sidecar, opened as memory maps.
+
+    Processes opening the same directory share pages through the OS page cache, and opening reads only
+    the sidecar. Pickling ships the directory path rather than the data.
+    """
+    SIDECAR = 'table.json'
+    POSITIONS = 'positions.npy'
+
+    def __init__(self, directory: str | Path):
+        self._directory: Path = Path(directory)
+        sidecar = json.loads((self._directory / self.SIDECAR).read_text())
+
+        lookup_index = None
+        if sidecar['dense_offset'] is not None:
+            positions = np.load(self._directory / self.POSITIONS, mmap_mode='r')
+            lookup_index = _CompiledIndex.from_dense(sidecar['dense_offset'], positions)
+
+        super().__init__(sidecar['index_cols'],
+                         _MmapColumns(self._directory, sidecar['index_files']),
+                         _MmapColumns(self._directory, sidecar['column_files']),
+                         lookup_index)
+
+    @classmethod
+    def write(cls, table: RefTable, directory: str | Path) -> 'MmapTable':
+        """Convert any RefTable, such as a CsvTable, into the memory-mapped file layout."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def save(arrays: dict[str, np.ndarray], prefix: str) -> dict[str, str]:
+            files = {}
+            for i, (col, arr) in enumerate(arrays.items()):
+                # Object arrays cannot be memory mapped, so strings are stored fixed width
+                arr = arr.astype(str) if arr.dtype == object else arr
+                files[col] = f'{prefix}_{i}.npy'
+                np.save(directory / files[col], arr, allow_pickle=False)
+            return files
+
+        index_arrays = {col: np.asarray(table.index_array(col)) for col in table.index_cols}
+        dense = _CompiledIndex([index_arrays[col] for col in table.index_cols]).dense
+        if dense is not None:
+            np.save(directory / cls.POSITIONS, dense[1], allow_pickle=False)
+
+        sidecar = {
+            'index_cols': table.index_cols,
+            'index_files': save(index_arrays, 'index'),
+            'column_files': save({col: np.asarray(table.col_array(col)) for col in table.non_index_cols}, 'col'),
+            'dense_offset': None if dense is None else dense[0],
+        }
+        (directory / cls.SIDECAR).write_text(json.dumps(sidecar, indent=2))
+        return cls(directory)
+
+    @classmethod
+    def from_csv(cls, csv: str | Path, index_cols: list[str], directory: str | Path) -> 'MmapTable':
+        return cls.write(CsvTable(index_cols=index_cols, csv=csv), directory)
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {'directory': self._directory}
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(state['directory'])
+
 
 @dataclass(frozen=True)
 class RefData:
@@ -121,3 +587,13 @@ class RefData:
 
     def __hash__(self):
         return hash(id(self))
+
+    @property
+    def batch_size(self) -> Optional[int]:
+        """Number of model points when policy values are held as arrays, None for a single model point."""
+        sizes = {len(value) for value in self.policy_values.values() if isinstance(value, np.ndarray)}
+        if not sizes:
+            return None
+        elif len(sizes) > 1:
+            raise ValueError('All batched policy value arrays must have the same length')
+        return sizes.pop()
@@ -1,25 +1,17 @@
-import functools
-import importlib
 import inspect
-from collections.abc import Callable
-from dataclasses import dataclass, replace, astuple
+from dataclasses import dataclass, replace
+from pathlib import Path
 from typing import Optional
 
 from src.lib.calculation import Calc, _CalcCreator
 from src.lib.dimension import DimProjection
+from src.lib.discovery import discover_module
+from src.lib.dispatch import DispatchTable, resolve_overrides
+from src.lib.plan import CalcPlan
+from src.lib.scheduler import CalcGraph
 from src.lib.types import FunctionDetails, FunctionPriority
 
 
-def _create_cached_function_details(cache_size: Optional[int], func_detail: FunctionDetails) -> FunctionDetails:
-    if _already_lru_cached(func_detail.func):
-        return func_detail
-    else:
-        cached_func = functools.lru_cache(maxsize=cache_size)(func_detail.func)
-        name, func, module, group = astuple(func_detail)
-        func.__globals__[name] = cached_func
-        return replace(func_detail, func=cached_func)
-
-
 def register_func_group(group: str):
     def wrapper(func):
         func._group_name = group
@@ -28,16 +20,6 @@ def register_func_group(group: str):
     return wrapper
 
 
-def _already_lru_cached(func: Callable) -> bool:
-    return hasattr(func, 'cache_info')
-
-
-def _is_function(obj):
-    return (inspect.isfunction(obj) or
-            (callable(obj) and hasattr(obj, '__wrapped__') and inspect.isfunction(obj.__wrapped__))
-            )
-
-
 @dataclass(frozen=True)
 class CalcModule:
     name: str
@@ -54,38 +36,72 @@ class CalcModule:
         return {cls.from_tuple(item) for item in data}
 
 
-def _load_functions(modules: list[CalcModule]) -> list[FunctionDetails]:
-    funcs = []
-    for module in modules:
-        mod = importlib.import_module(module.name)
-        for name, func_obj in inspect.getmembers(mod, _is_function):
-            if hasattr(func_obj, '_group_name'):
-                group_name: str = getattr(func_obj, '_group_name')
-                func_group = group_name
-            else:
-                func_group = None
-            funcs.append(FunctionDetails(name=name, func=func_obj, module=mod.__name__, func_group=func_group))
-    return funcs
+def _load_functions(modules: list[CalcModule], cache_dir: Optional[str | Path] = None) -> list[FunctionDetails]:
+    """Functions of the modules, keeping only the highest priority definition of each name.
+
+    Grouped functions are taken wherever they are found. Ungrouped ones, such as helpers, are only taken from
+    the module defining them, so functions a module merely imports are not treated as part of the model.
+    """
+    candidates = []
+    for module in sorted(modules, key=lambda module: (-module.priority.value, module.name)):
+        mod, discovered = discover_module(module.name, cache_dir)
+        for details, func_obj in discovered:
+            if details.func_group is None and inspect.unwrap(func_obj).__module__ != mod.__name__:
+                continue
+            candidates.append((FunctionDetails(name=details.name, func=func_obj, module=mod.__name__,
+                                               func_group=details.func_group), module.priority))
+    return resolve_overrides(candidates)
 
 
 class CalcRegistry:
+    """Modules and function groups that make up a model.
 
-    def __init__(self):
+    Module discovery is cached per module version for the life of the process. Given ``discovery_cache``,
+    a directory, it is also kept on disk so later processes, such as fresh workers, skip it too.
+    """
+
+    def __init__(self, discovery_cache: Optional[str | Path] = None):
         self._registry: set[FunctionDetails] = set()
         self._function_groups: set[str] = set()
         self._search_modules: set[CalcModule] = set()
+        self._dependency_graph: Optional[CalcGraph] = None
+        self._dispatch_table: Optional[DispatchTable] = None
+        self._discovery_cache: Optional[str | Path] = discovery_cache
+
+    def create_calculations(self, dim_ranges: DimProjection) -> list[Calc]:
+        """Calcs of the registered function groups, calling each other through a new dispatch table.
 
-    def create_calculations(self, dim_ranges: DimProjection, function_cache_size: Optional[int] = 10) -> list[Calc]:
+        Where modules define the same function name, the definition from the highest priority module wins
+        and every call to that name, from any module, reaches it.
+        """
         model_calculations: list[Calc] = []
-        loaded_functions: list[FunctionDetails] = _load_functions(list(self._search_modules))
+        loaded_functions: list[FunctionDetails] = _load_functions(list(self._search_modules), self._discovery_cache)
+        dispatch_table = DispatchTable(loaded_functions)
 
         for func_detail in loaded_functions:
-            cached_func_detail = _create_cached_function_details(function_cache_size, func_detail)
-            if cached_func_detail.func_group in self._function_groups:
-                model_calculations.extend(_CalcCreator.create_calcs(cached_func_detail, dim_ranges))
+            if func_detail.func_group in self._function_groups:
+                bound_detail = replace(func_detail, func=dispatch_table[func_detail.name])
+                model_calculations.extend(_CalcCreator.create_calcs(bound_detail, dim_ranges))
 
+        self._dispatch_table = dispatch_table
+        self._dependency_graph = CalcGraph.from_calcs(model_calculations)
         return model_calculations
 
+    def compile_plan(self, dim_ranges: DimProjection) -> CalcPlan:
+        """Create the calcs once and capture them as a picklable plan that workers load without rediscovery."""
+        calcs = self.create_calculations(dim_ranges)
+        return CalcPlan.from_calcs(calcs, self._dependency_graph, self._dispatch_table)
+
+    @property
+    def dispatch_table(self) -> Optional[DispatchTable]:
+        """Functions resolved by the last create_calculations, None before any calcs are created."""
+        return self._dispatch_table
+
+    @property
+    def dependency_graph(self) -> Optional[CalcGraph]:
+        """Call graph traced by the last create_calculations, None before any calcs are created."""
+        return self._dependency_graph
+
     @property
     def search_modules(self) -> set[str]:
         return {name for name, priority in self._search_modules}
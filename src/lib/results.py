@@ -1,13 +1,207 @@
-from queue import Queue
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Any, Optional
 
-class ResultWriter:
-    pass
+import numpy as np
+from numpy.typing import DTypeLike
+
+_STOP = object()
+
+
+class ResultWriter(ABC):
+    """Receives full column buffers from a ResultHandler on its writer thread."""
+
+    @abstractmethod
+    def write(self, batch: dict[str, np.ndarray]):
+        """Write a batch of columns. The arrays are reused once this returns, so must not be kept."""
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryWriter(ResultWriter):
+    """Collects batches in memory, for small runs and for returning results from a partition."""
+
+    def __init__(self):
+        self._batches: list[dict[str, np.ndarray]] = []
+
+    def write(self, batch: dict[str, np.ndarray]):
+        self._batches.append({col: values.copy() for col, values in batch.items()})
+
+    def result(self) -> dict[str, np.ndarray]:
+        if not self._batches:
+            return {}
+        return {col: np.concatenate([batch[col] for batch in self._batches]) for col in self._batches[0]}
+
+
+class NpyWriter(ResultWriter):
+    """Writes each batch to a numbered .npz file holding one array per column."""
+
+    def __init__(self, directory: str | Path):
+        self._directory: Path = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._part: int = 0
+
+    def write(self, batch: dict[str, np.ndarray]):
+        np.savez(self._directory / f'part-{self._part:05d}.npz', **batch)
+        self._part += 1
+
+
+class _ArrowWriter(ResultWriter, ABC):
+    def __init__(self, path: str | Path):
+        self._path: Path = Path(path)
+        self._writer = None
+
+    @abstractmethod
+    def _open(self, schema):
+        pass
+
+    def write(self, batch: dict[str, np.ndarray]):
+        import pyarrow as pa
+
+        # Arrow may wrap the buffers without copying, so the batch is written before returning
+        record_batch = pa.RecordBatch.from_pydict(batch)
+        if self._writer is None:
+            self._writer = self._open(record_batch.schema)
+        self._writer.write_batch(record_batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ParquetWriter(_ArrowWriter):
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self._path, schema)
+
+
+class ArrowIpcWriter(_ArrowWriter):
+    def _open(self, schema):
+        import pyarrow as pa
+        return pa.ipc.new_file(self._path, schema)
 
 
 class ResultHandler:
-    def __init__(self, size: int, writer):
+    """Buffers results into preallocated column arrays and hands full buffers to a writer thread.
+
+    At most ``size`` full buffers wait in the queue; adding results blocks while it is full, so memory is
+    bounded by the buffer size and queue length rather than by the number of results.
+    """
+
+    def __init__(self, size: int, writer: ResultWriter, buffer_rows: int = 65_536,
+                 dtypes: Optional[dict[str, DTypeLike]] = None):
         self._queue: Queue = Queue(maxsize=size)
-        self.writer = writer
+        self._free: Queue = Queue()
+        self.writer: ResultWriter = writer
+        self._buffer_rows: int = buffer_rows
+        self._dtypes: dict[str, DTypeLike] = dict(dtypes or {})
+        self._buffers: Optional[dict[str, np.ndarray]] = None
+        self._num_rows: int = 0
+        self._rows_written: int = 0
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    def declare_dtypes(self, dtypes: dict[str, DTypeLike]):
+        """Set column dtypes ahead of the first results, without overriding dtypes already given."""
+        if self._buffers is not None:
+            # Columns are fixed once results have been added
+            return
+        for col, dtype in dtypes.items():
+            self._dtypes.setdefault(col, dtype)
+
+    @property
+    def rows_written(self) -> int:
+        return self._rows_written
+
+    def _column_dtype(self, col: str, value: Any) -> np.dtype:
+        if col in self._dtypes:
+            return np.dtype(self._dtypes[col])
+        # Calcs can return ints for early t and floats later, so numeric columns default to float
+        return np.dtype(np.float64) if np.asarray(value).dtype.kind in 'biuf' else np.dtype(object)
+
+    def _take_buffers(self) -> dict[str, np.ndarray]:
+        try:
+            return self._free.get_nowait()
+        except Empty:
+            return {col: np.empty(self._buffer_rows, dtype=dtype) for col, dtype in self._dtypes.items()}
+
+    def _run_writer(self):
+        while True:
+            buffers, num_rows = self._queue.get()
+            if buffers is _STOP:
+                return
+            if self._error is None:
+                try:
+                    self.writer.write({col: values[:num_rows] for col, values in buffers.items()})
+                except BaseException as e:
+                    # Keep draining so producers blocked on the queue are released and see the error
+                    self._error = e
+            self._free.put(buffers)
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError('Result writer failed') from self._error
+
+    def add_result(self, result: dict[str, Any]):
+        """Add a single row of results."""
+        self.add_results({col: [value] for col, value in result.items()})
+
+    def add_results(self, columns: dict[str, Any]):
+        """Add rows given as equal length columns, with scalar values repeated for every row."""
+        self._check_error()
+        if self._buffers is None:
+            for col, values in columns.items():
+                self._dtypes.setdefault(col, self._column_dtype(col, values))
+            self._dtypes = {col: self._dtypes[col] for col in columns}
+            self._buffers = self._take_buffers()
+        elif columns.keys() != self._dtypes.keys():
+            raise ValueError('Results must have the same columns as earlier results')
+
+        num_rows = max((np.size(values) for values in columns.values() if np.ndim(values) > 0), default=1)
+        start = 0
+        while start < num_rows:
+            count = min(num_rows - start, self._buffer_rows - self._num_rows)
+            for col, values in columns.items():
+                chunk = values[start:start + count] if np.ndim(values) > 0 else values
+                self._buffers[col][self._num_rows:self._num_rows + count] = chunk
+            self._num_rows += count
+            start += count
+            if self._num_rows == self._buffer_rows:
+                self.flush()
+
+    def flush(self):
+        """Hand any buffered rows to the writer thread, blocking while the queue is full."""
+        if self._buffers is None or self._num_rows == 0:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_writer, name='result-writer', daemon=True)
+            self._thread.start()
+
+        self._queue.put((self._buffers, self._num_rows))
+        self._rows_written += self._num_rows
+        self._buffers = self._take_buffers()
+        self._num_rows = 0
+        self._check_error()
+
+    def close(self):
+        """Flush remaining rows, wait for the writer to finish and close it."""
+        try:
+            self.flush()
+            if self._thread is not None:
+                self._queue.put((_STOP, 0))
+                self._thread.join()
+                self._thread = None
+        finally:
+            self.writer.close()
+        self._check_error()
+
+    def __enter__(self) -> 'ResultHandler':
+        return self
 
-    def add_result(self, result):
-        self.buffer
\ No newline at end of file
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,199 @@
+import os
+from collections import deque
+from collections.abc import Iterator, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field, replace
+from typing import Any, Optional
+
+import numpy as np
+
+from src.lib.aggregation import Aggregation, GroupedTotals
+from src.lib.dimension import DimProjection
+from src.lib.execution import CallPlans, _declare_result_dtypes, run_calcs
+from src.lib.fused import FusedPlans, run_fused
+from src.lib.plan import CalcPlan
+from src.lib.policies import PolicySource, model_points_from_columns
+from src.lib.profiling import CalcProfiler, ProfileReport
+from src.lib.reference import RefTable
+from src.lib.registry import CalcModule, CalcRegistry
+from src.lib.results import MemoryWriter, ResultHandler
+from src.lib.shared import SharedReference
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Everything a worker process needs to build a model: calc modules, groups, dimensions and reference data."""
+    modules: frozenset[CalcModule]
+    function_groups: frozenset[str]
+    dim_projection: DimProjection
+    tables: Optional[dict[str, RefTable]] = field(default=None, hash=False)
+    global_values: Optional[dict[str, Any]] = field(default=None, hash=False)
+
+    def compile_plan(self) -> CalcPlan:
+        registry = (
+            CalcRegistry()
+            .register_modules(set(self.modules))
+            .register_function_groups(set(self.function_groups))
+        )
+        return registry.compile_plan(self.dim_projection)
+
+
+@dataclass
+class _WorkerState:
+    spec: ModelSpec
+    plans: CallPlans
+    fused: Optional[FusedPlans] = None
+    groups: dict[str, str] = field(default_factory=dict)
+
+
+_worker_state: Optional[_WorkerState] = None
+
+
+def _init_worker(spec: ModelSpec, plan: CalcPlan, fused: bool = False):
+    """Load the calc plan and attach reference tables once per worker process, for reuse by every chunk."""
+    global _worker_state
+    fused_plans = FusedPlans(plan.create_calculations(), plan.graph) if fused else None
+    _worker_state = _WorkerState(spec, plan.load(), fused_plans, {calc.name: calc.group_name for calc in plan.calcs})
+
+
+def _run_chunk(first_id: int, chunk: dict[str, np.ndarray], batched: bool, profile: bool = False,
+               aggregation: Optional[Aggregation] = None
+               ) -> tuple[dict[str, np.ndarray] | GroupedTotals, Optional[ProfileReport]]:
+    if _worker_state is None:
+        raise RuntimeError('Worker process was not initialised with a ModelSpec')
+
+    spec = _worker_state.spec
+    if aggregation is not None:
+        writer = GroupedTotals(aggregation, spec.dim_projection.t_range, _worker_state.groups)
+        policy_columns = aggregation.policy_columns
+    else:
+        writer = MemoryWriter()
+        policy_columns = ()
+    profiler = CalcProfiler() if profile else None
+    with ResultHandler(size=2, writer=writer) as result_handler, profiler or nullcontext():
+        model_points = model_points_from_columns(chunk, spec.tables, spec.global_values, batched)
+        if _worker_state.fused is not None:
+            run_fused(_worker_state.fused, model_points, spec.dim_projection, result_handler,
+                      policy_columns=policy_columns)
+        else:
+            run_calcs(_worker_state.plans, model_points, spec.dim_projection, result_handler,
+                      policy_columns=policy_columns)
+
+    report = profiler.report() if profiler is not None else None
+    if isinstance(writer, GroupedTotals):
+        # Only the partial aggregates go back to the parent, not the rows they were built from
+        return writer, report
+    result = writer.result()
+    if 'model_point' in result:
+        result['model_point'] += first_id
+    return result, report
+
+
+def _chunk_policies(policies: Mapping[str, Any] | PolicySource,
+                    chunk_size: int) -> Iterator[tuple[int, dict[str, np.ndarray]]]:
+    if isinstance(policies, PolicySource):
+        start = 0
+        for chunk in policies.chunks(prefetch=2):
+            yield start, chunk
+            start += len(next(iter(chunk.values()))) if chunk else 0
+        return
+
+    columns = {str(col): np.asarray(values) for col, values in policies.items()}
+    num_policies = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, num_policies, chunk_size):
+        yield start, {col: values[start:start + chunk_size] for col, values in columns.items()}
+
+
+class LocalRunner:
+    """Runs a model over a policy file on a local process pool, without dask.
+
+    Policies are split into chunks of ``chunk_size`` rows, or streamed in the chunks of a PolicySource.
+    The calc plan is compiled once up front and each worker loads it once in its initializer, reusing it
+    for every chunk it is given. Chunk results are merged into the caller's ResultHandler as they arrive,
+    in policy order when ``ordered`` is set, otherwise in completion order. At most two chunks per worker
+    are in flight at a time so memory does not grow with the policy count. With ``profile`` set, each
+    chunk runs under a CalcProfiler and the workers' reports are merged into ``profile_report``. With
+    ``fused`` set, workers evaluate eligible calcs with the fused kernel of run_fused, checking the first
+    policy of every chunk against the interpreted engine.
+
+    With an ``aggregation``, each worker reduces its rows as they are produced and returns only the partial
+    aggregates, which are merged and written to the caller's ResultHandler as one row per group and t at
+    the end of the run.
+
+    With ``share_reference`` set, the spec's tables and array global values are published once into shared
+    memory for the run, and workers attach read-only views of them rather than each unpickling a copy.
+    """
+
+    def __init__(self, spec: ModelSpec, workers: Optional[int] = None, chunk_size: int = 1_000,
+                 ordered: bool = True, batched: bool = False, profile: bool = False, fused: bool = False,
+                 aggregation: Optional[Aggregation] = None, share_reference: bool = False):
+        self._spec: ModelSpec = spec
+        self._workers: int = workers or os.cpu_count() or 1
+        self._chunk_size: int = chunk_size
+        self._ordered: bool = ordered
+        self._batched: bool = batched
+        self._profile: bool = profile
+        self._fused: bool = fused
+        self._aggregation: Optional[Aggregation] = aggregation
+        self._share_reference: bool = share_reference
+        self._profile_report: Optional[ProfileReport] = None
+        self._totals: Optional[GroupedTotals] = None
+
+    @property
+    def profile_report(self) -> Optional[ProfileReport]:
+        """Merged profile of every chunk from the last run, when profiling was requested."""
+        return self._profile_report
+
+    @property
+    def totals(self) -> Optional[GroupedTotals]:
+        """Merged aggregates of every chunk from the last run, when an aggregation was given."""
+        return self._totals
+
+    def run(self, policies: Mapping[str, Any] | PolicySource, result_handler: ResultHandler):
+        """Project policies given as columns, such as a DataFrame or a dict of arrays, or streamed from a file."""
+        max_in_flight = 2 * self._workers
+        pending: deque[Future] = deque()
+        _declare_result_dtypes(result_handler, list(self._spec.dim_projection.t_range))
+        plan = self._spec.compile_plan()
+        self._profile_report = ProfileReport() if self._profile else None
+        self._totals = None
+
+        spec = self._spec
+        shared = SharedReference(spec.tables, spec.global_values) if self._share_reference else None
+        if shared is not None:
+            spec = replace(spec, tables=shared.tables, global_values=shared.global_values)
+        # Unlinked once the pool has shut down, after every worker attached in its initializer
+        with shared or nullcontext(), ProcessPoolExecutor(max_workers=self._workers, initializer=_init_worker,
+                                                          initargs=(spec, plan, self._fused)) as pool:
+            for first_id, chunk in _chunk_policies(policies, self._chunk_size):
+                pending.append(pool.submit(_run_chunk, first_id, chunk, self._batched, self._profile,
+                                           self._aggregation))
+                if len(pending) >= max_in_flight:
+                    self._drain(pending, result_handler, wait_for_all=False)
+            self._drain(pending, result_handler, wait_for_all=True)
+
+        if self._totals is not None:
+            result_handler.add_results(self._totals.result())
+
+    def _drain(self, pending: deque[Future], result_handler: ResultHandler, wait_for_all: bool):
+        while pending:
+            if self._ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                result, report = future.result()
+                if isinstance(result, GroupedTotals):
+                    if self._totals is None:
+                        self._totals = result
+                    else:
+                        self._totals.merge(result)
+                elif result:
+                    result_handler.add_results(result)
+                if report is not None and self._profile_report is not None:
+                    self._profile_report.merge(report)
+            if not wait_for_all and len(pending) < 2 * self._workers:
+                return
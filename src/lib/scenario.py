@@ -0,0 +1,135 @@
+import math
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import Any
+
+import numpy as np
+
+
+class ScenarioReducer(ABC):
+    """Reduces values held along the last, scenario, axis to a single statistic."""
+    # Order statistics can share one sort of the scenarios between reducers
+    uses_order: bool = False
+
+    @property
+    @abstractmethod
+    def label(self) -> str:
+        pass
+
+    @abstractmethod
+    def __call__(self, values: np.ndarray) -> Any:
+        pass
+
+    def reduce_sorted(self, sorted_values: np.ndarray) -> Any:
+        """Reduce a single path of scenarios that is already sorted in ascending order."""
+        return self(sorted_values)
+
+    def column_name(self, name: str) -> str:
+        return f'{name}[{self.label}]'
+
+
+class Mean(ScenarioReducer):
+    @property
+    def label(self) -> str:
+        return 'mean'
+
+    def __call__(self, values: np.ndarray) -> Any:
+        return np.mean(values, axis=-1)
+
+
+class Percentile(ScenarioReducer):
+    uses_order = True
+
+    def __init__(self, q: float):
+        if not 0 <= q <= 100:
+            raise ValueError('Percentile must be between 0 and 100')
+        self.q: float = q
+
+    @property
+    def label(self) -> str:
+        return f'p{self.q:g}'
+
+    def __call__(self, values: np.ndarray) -> Any:
+        return np.percentile(values, self.q, axis=-1)
+
+    def reduce_sorted(self, sorted_values: np.ndarray) -> Any:
+        # Linear interpolation between closest ranks, as np.percentile does by default
+        position = (len(sorted_values) - 1) * self.q / 100
+        lower = math.floor(position)
+        upper = min(lower + 1, len(sorted_values) - 1)
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class CTE(ScenarioReducer):
+    """Conditional tail expectation: the mean of the worst (100 - level)% of scenarios.
+
+    The upper tail is used by default, for values where larger is worse such as claims or reserves.
+    """
+    uses_order = True
+
+    def __init__(self, level: float, upper: bool = True):
+        if not 0 <= level < 100:
+            raise ValueError('CTE level must be at least 0 and below 100')
+        self.level: float = level
+        self.upper: bool = upper
+
+    @property
+    def label(self) -> str:
+        return f'cte{self.level:g}' if self.upper else f'cte{self.level:g}_lower'
+
+    def _tail_size(self, num_scenarios: int) -> int:
+        return max(1, math.ceil(num_scenarios * (100 - self.level) / 100))
+
+    def __call__(self, values: np.ndarray) -> Any:
+        values = np.asarray(values, dtype=np.float64)
+        num_scenarios = values.shape[-1]
+        tail_size = self._tail_size(num_scenarios)
+        if self.upper:
+            tail = np.partition(values, num_scenarios - tail_size, axis=-1)[..., num_scenarios - tail_size:]
+        else:
+            tail = np.partition(values, tail_size - 1, axis=-1)[..., :tail_size]
+        return np.mean(tail, axis=-1)
+
+    def reduce_sorted(self, sorted_values: np.ndarray) -> Any:
+        tail_size = self._tail_size(len(sorted_values))
+        tail = sorted_values[len(sorted_values) - tail_size:] if self.upper else sorted_values[:tail_size]
+        return tail.mean()
+
+
+class ScenarioTotals:
+    """Running per-scenario totals of calcs over model points, for statistics of the portfolio as a whole.
+
+    Holds one (t, scenario) array per calc regardless of the number of model points, and can be merged
+    with totals from other workers before reducing.
+    """
+
+    def __init__(self, num_steps: int, num_scenarios: int):
+        self._shape: tuple[int, int] = (num_steps, num_scenarios)
+        self._totals: dict[str, np.ndarray] = {}
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._totals)
+
+    def add(self, name: str, step: int | slice, values: Any):
+        if name not in self._totals:
+            self._totals[name] = np.zeros(self._shape)
+        self._totals[name][step] += values
+
+    def merge(self, other: 'ScenarioTotals'):
+        if other._shape != self._shape:
+            raise ValueError('Cannot merge scenario totals with a different number of steps or scenarios')
+        for name, totals in other._totals.items():
+            if name in self._totals:
+                self._totals[name] += totals
+            else:
+                self._totals[name] = totals.copy()
+
+    def totals(self, name: str) -> np.ndarray:
+        """Totals of one calc with shape (number of steps, number of scenarios)."""
+        return self._totals[name]
+
+    def reduce(self, reducers: Sequence[ScenarioReducer]) -> dict[str, np.ndarray]:
+        """One array over the steps for each calc and reducer, named as in run_calcs results."""
+        return {reducer.column_name(name): reducer(totals)
+                for name, totals in self._totals.items() for reducer in reducers}
@@ -0,0 +1,345 @@
+import ast
+import functools
+import inspect
+from collections import defaultdict
+from collections.abc import Callable, Collection, Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Optional
+
+import numpy as np
+
+from src.lib.cache import CalcCache
+from src.lib.calculation import Calc
+from src.lib.dimension import DimProjection
+from src.lib.discovery import parse_function
+from src.lib.reference import RefData
+
+
+@dataclass(frozen=True)
+class CalcDependency:
+    caller: str
+    callee: str
+    # Number of steps back in t the callee is read at, None if the offset is not a constant
+    lag: Optional[int]
+
+
+class DataSource(Enum):
+    POLICY = 'policy_values'
+    GLOBAL = 'global_values'
+    TABLE = 'tables'
+
+
+@dataclass(frozen=True)
+class DataRead:
+    """A part of RefData a calc reads, or that has changed. A None source, key or column stands for any."""
+    source: Optional[DataSource]
+    key: Optional[str] = None
+    column: Optional[str] = None
+
+    @classmethod
+    def policy(cls, key: str) -> 'DataRead':
+        return cls(DataSource.POLICY, key)
+
+    @classmethod
+    def global_value(cls, key: str) -> 'DataRead':
+        return cls(DataSource.GLOBAL, key)
+
+    @classmethod
+    def table(cls, key: str, column: Optional[str] = None) -> 'DataRead':
+        return cls(DataSource.TABLE, key, column)
+
+    def overlaps(self, other: 'DataRead') -> bool:
+        if self.source is None or other.source is None:
+            return True
+        return self.source == other.source and _matches(self.key, other.key) and _matches(self.column, other.column)
+
+
+def _matches(a: Optional[str], b: Optional[str]) -> bool:
+    return a is None or b is None or a == b
+
+
+_ANY_READ = DataRead(None)
+_SOURCES = {source.value: source for source in DataSource}
+_TABLE_LOOKUPS = {'lookup', 'lookup_many', 'interpolated_lookup'}
+
+
+def _constant(node: ast.expr) -> Optional[str]:
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+
+def _lookup_column(table_node: ast.expr, parents: dict[ast.AST, ast.AST]) -> Optional[str]:
+    method = parents.get(table_node)
+    call = parents.get(method)
+    if not (isinstance(method, ast.Attribute) and method.attr in _TABLE_LOOKUPS and isinstance(call, ast.Call)):
+        return None
+    keyword_col = [kw.value for kw in call.keywords if kw.arg == 'return_col']
+    if keyword_col:
+        return _constant(keyword_col[0])
+    return _constant(call.args[1]) if len(call.args) > 1 else None
+
+
+def _field_read(source: DataSource, field_node: ast.Attribute, parents: dict[ast.AST, ast.AST]) -> DataRead:
+    container = parents.get(field_node)
+    if isinstance(container, ast.Subscript) and container.value is field_node:
+        key, accessed = _constant(container.slice), container
+    elif isinstance(container, ast.Attribute) and container.attr == 'get' \
+            and isinstance(parents.get(container), ast.Call) and parents[container].args:
+        key, accessed = _constant(parents[container].args[0]), parents[container]
+    else:
+        # The whole mapping escapes, so any key may be read
+        return DataRead(source)
+
+    column = _lookup_column(accessed, parents) if source == DataSource.TABLE and key is not None else None
+    return DataRead(source, key, column)
+
+
+def _find_data_reads(calc: Calc, calc_names: Collection[str]) -> frozenset[DataRead]:
+    """Parts of RefData a calc reads directly, leaving reads made through other calcs to those calcs."""
+    if calc.data_arg is None:
+        return frozenset()
+    tree = parse_function(_raw_function(calc.function))
+    if tree is None:
+        return frozenset({_ANY_READ})
+
+    parents = {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+    reads = set()
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Name) and node.id == calc.data_arg):
+            continue
+        parent = parents.get(node)
+        match parent:
+            case ast.Call(func=ast.Name(id=callee)) if callee in calc_names:
+                continue
+            case ast.Attribute(attr='batch_size'):
+                # The number of policies in a batch depends on all of them
+                reads.add(DataRead(DataSource.POLICY))
+            case ast.Attribute(attr=attr) if attr in _SOURCES:
+                reads.add(_field_read(_SOURCES[attr], parent, parents))
+            case _:
+                # Passed somewhere that cannot be traced, so treat it as reading everything
+                reads.add(_ANY_READ)
+    return frozenset(reads)
+
+
+def _raw_function(func: Callable) -> Callable:
+    if isinstance(func, functools.partial):
+        func = func.func
+    return inspect.unwrap(func)
+
+
+def _time_lag(node: ast.expr, t_arg: str) -> Optional[int]:
+    match node:
+        case ast.Name(id=name) if name == t_arg:
+            return 0
+        case ast.BinOp(left=ast.Name(id=name), op=ast.Sub(), right=ast.Constant(value=int() as offset)) \
+                if name == t_arg:
+            return offset
+        case ast.BinOp(left=ast.Name(id=name), op=ast.Add(), right=ast.Constant(value=int() as offset)) \
+                if name == t_arg:
+            return -offset
+        case _:
+            return None
+
+
+def _find_dependencies(calc: Calc, callee_t_args: dict[str, Optional[str]]) -> list[CalcDependency]:
+    tree = parse_function(_raw_function(calc.function))
+    if tree is None:
+        return []
+
+    dependencies = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in callee_t_args):
+            continue
+
+        callee = node.func.id
+        callee_t_arg = callee_t_args[callee]
+        t_expr = None
+        if callee_t_arg is not None:
+            keyword_t = [kw.value for kw in node.keywords if kw.arg == callee_t_arg]
+            t_expr = keyword_t[0] if keyword_t else (node.args[0] if node.args else None)
+
+        lag = _time_lag(t_expr, calc.t_arg) if (t_expr is not None and calc.t_arg is not None) else None
+        dependencies.append(CalcDependency(caller=calc.original_name, callee=callee, lag=lag))
+
+    return dependencies
+
+
+class CalcGraph:
+    """Calc-to-calc call graph traced from function source, with the time lag of every call.
+
+    The graph also records which parts of RefData each calc reads, so a change to reference data can be
+    traced to the calcs it affects. A graph built without reads treats every calc as reading everything.
+    """
+
+    def __init__(self, names: list[str], dependencies: list[CalcDependency],
+                 data_reads: Optional[Mapping[str, frozenset[DataRead]]] = None):
+        self._names: list[str] = list(dict.fromkeys(names))
+        self._dependencies: list[CalcDependency] = dependencies
+        self._data_reads: dict[str, frozenset[DataRead]] = dict(data_reads or {})
+        self._callees: dict[str, set[str]] = defaultdict(set)
+        self._callers: dict[str, set[str]] = defaultdict(set)
+        for dep in dependencies:
+            self._callees[dep.caller].add(dep.callee)
+            self._callers[dep.callee].add(dep.caller)
+
+    @classmethod
+    def from_calcs(cls, calcs: list[Calc]) -> 'CalcGraph':
+        callee_t_args = {calc.original_name: calc.t_arg for calc in calcs}
+        dependencies = []
+        data_reads = {}
+        for calc in calcs:
+            # Alt dimension partials share their function body so only need tracing once
+            if calc.original_name not in data_reads:
+                data_reads[calc.original_name] = _find_data_reads(calc, callee_t_args)
+                dependencies.extend(_find_dependencies(calc, callee_t_args))
+        return cls([calc.original_name for calc in calcs], list(dict.fromkeys(dependencies)), data_reads)
+
+    @property
+    def names(self) -> list[str]:
+        return self._names
+
+    @property
+    def dependencies(self) -> list[CalcDependency]:
+        return self._dependencies
+
+    @property
+    def data_reads(self) -> dict[str, frozenset[DataRead]]:
+        return dict(self._data_reads)
+
+    def reads(self, name: str) -> frozenset[DataRead]:
+        return self._data_reads.get(name, frozenset({_ANY_READ}))
+
+    def affected_by(self, changes: Iterable[DataRead]) -> set[str]:
+        """Calcs reading any of the changed data, directly or through the calcs they call."""
+        changes = list(changes)
+        affected = {name for name in self._names
+                    if any(read.overlaps(change) for read in self.reads(name) for change in changes)}
+        pending = list(affected)
+        while pending:
+            for caller in self._callers.get(pending.pop(), ()):
+                if caller not in affected:
+                    affected.add(caller)
+                    pending.append(caller)
+        return affected
+
+    def policy_invariant(self) -> set[str]:
+        """Calcs reading no policy values, directly or through the calcs they call.
+
+        Their results depend only on t, alt dimensions, global values and tables, so are the same for
+        every model point sharing those.
+        """
+        return set(self._names) - self.affected_by([DataRead(DataSource.POLICY)])
+
+    def callees(self, name: str) -> set[str]:
+        return set(self._callees.get(name, set()))
+
+    def callers(self, name: str) -> set[str]:
+        return set(self._callers.get(name, set()))
+
+    def window(self, name: str) -> Optional[int]:
+        """Number of earlier time steps of a calc that must be kept, None if unbounded."""
+        lags = [dep.lag for dep in self._dependencies if dep.callee == name]
+        if any(lag is None for lag in lags):
+            return None
+        return max((lag for lag in lags if lag > 0), default=0)
+
+    def evaluation_order(self) -> list[str]:
+        """Order calcs so that every same-t dependency is evaluated before its caller."""
+        same_t_callees: dict[str, set[str]] = defaultdict(set)
+        for dep in self._dependencies:
+            if dep.lag == 0 and dep.caller != dep.callee:
+                same_t_callees[dep.caller].add(dep.callee)
+
+        ordered: list[str] = []
+        state: dict[str, bool] = {}
+
+        def visit(name: str):
+            if state.get(name) is True:
+                return
+            elif state.get(name) is False:
+                raise ValueError(f'Calc {name} depends on itself at the same time step')
+            state[name] = False
+            for callee in sorted(same_t_callees[name]):
+                visit(callee)
+            state[name] = True
+            ordered.append(name)
+
+        for name in self._names:
+            visit(name)
+        return [name for name in ordered if name in self._names]
+
+
+class TimeSweep:
+    """Evaluates registry calcs forward in t order, so recursive calls on earlier t are served from a lag window."""
+
+    def __init__(self, calcs: list[Calc], dim_ranges: DimProjection, graph: Optional[CalcGraph] = None):
+        self._graph: CalcGraph = graph if graph is not None else CalcGraph.from_calcs(calcs)
+        rank = {name: i for i, name in enumerate(self._graph.evaluation_order())}
+        self._calcs: list[Calc] = sorted(calcs, key=lambda calc: rank.get(calc.original_name, len(rank)))
+        self._t_values: list = list(dim_ranges.t_range)
+
+    @property
+    def graph(self) -> CalcGraph:
+        return self._graph
+
+    def _bound_calcs(self) -> Iterator[tuple[Calc, str, tuple]]:
+        """Each calc bound to each of its combos, with the name and combo its results are cached under."""
+        for calc in self._calcs:
+            if calc.combos is None:
+                yield calc, calc.original_name, ()
+                continue
+            for combo in calc.combos:
+                yield calc.bind(combo), calc.original_name, tuple(sorted(calc.combo_kwargs(combo).items()))
+
+    def _seed(self, cache: CalcCache, bound_calcs: list[tuple[Calc, str, tuple]], seed: Mapping[str, Sequence]):
+        for calc, name, combo in bound_calcs:
+            if calc.name not in seed:
+                continue
+            values = seed[calc.name]
+            if calc.t_arg is None:
+                cache.set(name, combo, None, values[0])
+            else:
+                for t, value in zip(self._t_values, values):
+                    cache.set(name, combo, getattr(t, 'value', t), value)
+
+    def steps(self, data: RefData, only: Optional[Collection[str]] = None,
+              seed: Optional[Mapping[str, Sequence]] = None) -> Iterator[tuple[Any, dict[str, Any]]]:
+        """Yield (t, {calc name: value}) for each t, keeping only the lag window of each calc in memory.
+
+        ``only`` restricts evaluation to the named calcs. ``seed`` gives earlier results by calc name, one value
+        per t, which are served from the cache instead of being recomputed.
+        """
+        cache = CalcCache(windows={name: self._graph.window(name) for name in self._graph.names})
+        bound_calcs = list(self._bound_calcs())
+        calls = []
+        for calc, _, _ in bound_calcs:
+            if only is not None and calc.name not in only:
+                continue
+            kwargs = {calc.data_arg: data} if calc.data_arg is not None else {}
+            calls.append((calc.name, calc.t_arg, functools.partial(calc.function, **kwargs)))
+
+        cache.bind(data)
+        try:
+            if seed is not None:
+                self._seed(cache, bound_calcs, {name: values for name, values in seed.items()
+                                                if only is None or name not in only})
+            for t in self._t_values:
+                with cache:
+                    step = {name: func(**{t_arg: t}) if t_arg is not None else func() for name, t_arg, func in calls}
+                yield t, step
+                cache.evict(getattr(t, 'value', t))
+        finally:
+            cache.clear()
+
+    def run(self, data: RefData, only: Optional[Collection[str]] = None,
+            seed: Optional[Mapping[str, Sequence]] = None) -> dict[str, np.ndarray]:
+        """Evaluate the full projection into one dense array per calc, indexed by position in t_range."""
+        batch_size = data.batch_size
+        results: dict[str, list] = {}
+        for t, step in self.steps(data, only, seed):
+            for name, value in step.items():
+                value = value if batch_size is None else np.broadcast_to(value, (batch_size,))
+                results.setdefault(name, []).append(value)
+        return {name: np.asarray(values) if batch_size is None else np.stack(values)
+                for name, values in results.items()}
@@ -0,0 +1,255 @@
+"""Reference tables and global values published once into shared memory and attached by local workers.
+
+The publishing process copies every array into a single shared memory segment. Pickling a SharedTable, or
+a global value array, ships only the segment name and the layout of its arrays, so unpickling in another
+process maps the segment and wraps read-only NumPy views around it without copying, in time independent
+of the table size.
+"""
+import os
+import sys
+import weakref
+from collections.abc import Mapping
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Optional
+
+import numpy as np
+
+from src.lib.reference import ArrayTable, RefTable, _CompiledIndex
+
+_ALIGNMENT = 64
+
+# Segments attached by this process, kept open for its lifetime so views into them stay valid
+_attached: dict[str, SharedMemory] = {}
+
+
+def _untracked(shm: SharedMemory) -> SharedMemory:
+    # The resource tracker unlinks segments when a process that opened them exits, including attached
+    # workers, so segments are kept out of it and the publisher unlinks them itself
+    if sys.version_info < (3, 13) and os.name == 'posix':
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _create(size: int) -> SharedMemory:
+    if sys.version_info >= (3, 13):
+        return SharedMemory(create=True, size=size, track=False)
+    return _untracked(SharedMemory(create=True, size=size))
+
+
+def _attach(name: str) -> SharedMemory:
+    if name not in _attached:
+        if sys.version_info >= (3, 13):
+            _attached[name] = SharedMemory(name, track=False)
+        else:
+            _attached[name] = _untracked(SharedMemory(name))
+    return _attached[name]
+
+
+def _unlink(shm: SharedMemory, pid: int):
+    if os.getpid() != pid:
+        # A forked worker holding a copy of the publisher never removes the segment
+        return
+    if sys.version_info < (3, 13) and os.name == 'posix':
+        # Registered again so unlinking, which unregisters it, leaves the tracker balanced
+        resource_tracker.register(shm._name, 'shared_memory')
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedArrays(Mapping[str, np.ndarray]):
+    """Named arrays packed into one shared memory segment, read as read-only views."""
+
+    def __init__(self, name: str, layout: dict[str, tuple[int, str, tuple[int, ...]]],
+                 shm: Optional[SharedMemory] = None):
+        self._name: str = name
+        self._layout: dict[str, tuple[int, str, tuple[int, ...]]] = layout
+        self._shm: SharedMemory = shm if shm is not None else _attach(name)
+        self._views: dict[str, np.ndarray] = {}
+        self._finalizer: Optional[weakref.finalize] = None
+
+    @classmethod
+    def create(cls, arrays: Mapping[str, np.ndarray]) -> 'SharedArrays':
+        """Copy arrays into a new segment, owned by the returned object until unlink() is called."""
+        layout = {}
+        size = 0
+        for key, arr in arrays.items():
+            arr = np.asarray(arr)
+            if arr.dtype.hasobject:
+                raise ValueError(f'{key} holds Python objects, which cannot be placed in shared memory')
+            size = -(-size // _ALIGNMENT) * _ALIGNMENT
+            layout[key] = (size, arr.dtype.str, arr.shape)
+            size += arr.nbytes
+
+        shm = _create(max(size, 1))
+        shared = cls(shm.name, layout, shm)
+        for key, arr in arrays.items():
+            offset, dtype, shape = layout[key]
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = arr
+        # Unlinked at the latest when the publisher exits, so an unclosed run does not leak the segment
+        shared._finalizer = weakref.finalize(shared, _unlink, shm, os.getpid())
+        return shared
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def nbytes(self) -> int:
+        return self._shm.size
+
+    def unlink(self):
+        """Remove the segment once every worker has attached or finished; views stay valid until released."""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        if key not in self._views:
+            offset, dtype, shape = self._layout[key]
+            view = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+            view.flags.writeable = False
+            self._views[key] = view
+        return self._views[key]
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self) -> int:
+        return len(self._layout)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {'name': self._name, 'layout': self._layout}
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(state['name'], state['layout'])
+
+
+class _Prefixed(Mapping[str, np.ndarray]):
+    """The arrays of one table within a SharedArrays, keyed by column name."""
+
+    def __init__(self, arrays: SharedArrays, keys: dict[str, str]):
+        self._arrays: SharedArrays = arrays
+        self._keys: dict[str, str] = keys
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        return self._arrays[self._keys[col]]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class SharedTable(ArrayTable):
+    """Reference table whose columns, and dense index positions, are views into a SharedArrays segment.
+
+    Pickling ships the segment name and layout rather than the data, as MmapTable ships its directory.
+    """
+
+    def __init__(self, arrays: SharedArrays, index_cols: list[str], index_keys: dict[str, str],
+                 column_keys: dict[str, str], positions_key: Optional[str] = None, dense_offset: Optional[int] = None):
+        self._arrays: SharedArrays = arrays
+        self._keys: tuple = (index_keys, column_keys, positions_key, dense_offset)
+        lookup_index = None
+        if positions_key is not None:
+            lookup_index = _CompiledIndex.from_dense(dense_offset, arrays[positions_key],
+                                                     len(arrays[index_keys[index_cols[0]]]))
+        super().__init__(index_cols, _Prefixed(arrays, index_keys), _Prefixed(arrays, column_keys), lookup_index)
+
+    @staticmethod
+    def arrays_of(table: RefTable, prefix: str) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+        """Arrays to publish for a table, keyed under prefix, and the arguments that rebuild it from them."""
+        def fixed_width(arr: np.ndarray) -> np.ndarray:
+            # Object arrays cannot be shared, so strings are stored fixed width as MmapTable stores them
+            arr = np.asarray(arr)
+            return arr.astype(str) if arr.dtype == object else arr
+
+        arrays = {}
+        index_keys = {}
+        for i, col in enumerate(table.index_cols):
+            index_keys[col] = f'{prefix}/index_{i}'
+            arrays[index_keys[col]] = fixed_width(table.index_array(col))
+        column_keys = {}
+        for i, col in enumerate(table.non_index_cols):
+            column_keys[col] = f'{prefix}/col_{i}'
+            arrays[column_keys[col]] = fixed_width(table.col_array(col))
+
+        positions_key, dense_offset = None, None
+        dense = _CompiledIndex([arrays[index_keys[col]] for col in table.index_cols]).dense
+        if dense is not None:
+            positions_key, dense_offset = f'{prefix}/positions', dense[0]
+            arrays[positions_key] = dense[1]
+        return arrays, {'index_cols': list(table.index_cols), 'index_keys': index_keys, 'column_keys': column_keys,
+                        'positions_key': positions_key, 'dense_offset': dense_offset}
+
+    @classmethod
+    def publish(cls, table: RefTable) -> 'SharedTable':
+        """Copy any RefTable into a segment of its own, unlinked when the returned table's arrays are."""
+        arrays, kwargs = cls.arrays_of(table, 'table')
+        return cls(SharedArrays.create(arrays), **kwargs)
+
+    @property
+    def arrays(self) -> SharedArrays:
+        return self._arrays
+
+    def __getstate__(self) -> dict[str, Any]:
+        index_keys, column_keys, positions_key, dense_offset = self._keys
+        return {'arrays': self._arrays, 'index_cols': self.index_cols, 'index_keys': index_keys,
+                'column_keys': column_keys, 'positions_key': positions_key, 'dense_offset': dense_offset}
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(**state)
+
+
+class SharedGlobals(dict):
+    """Global values whose arrays are views into shared memory, pickled by reference to the segment."""
+
+    def __init__(self, arrays: SharedArrays, values: dict[str, Any], shared: frozenset[str] = frozenset()):
+        super().__init__({name: arrays[f'globals/{name}'] if name in shared else value
+                          for name, value in values.items()})
+        self._arrays: SharedArrays = arrays
+
+    def __reduce__(self):
+        # Values replaced since publishing are pickled as they are
+        shared = frozenset(name for name, value in self.items()
+                           if f'globals/{name}' in self._arrays and value is self._arrays[f'globals/{name}'])
+        return type(self), (self._arrays, {name: None if name in shared else value for name, value in self.items()},
+                            shared)
+
+
+class SharedReference:
+    """Tables and global values of a run, published together into one shared memory segment.
+
+    Tables become SharedTables and array global values become read-only views, while other global values
+    are kept as they are. Pass ``tables`` and ``global_values`` to workers in place of the originals, and
+    unlink the segment, or leave the with block, once the workers are done.
+    """
+
+    def __init__(self, tables: Optional[dict[str, RefTable]] = None, global_values: Optional[dict[str, Any]] = None):
+        arrays: dict[str, np.ndarray] = {}
+        table_kwargs = {}
+        for name, table in (tables or {}).items():
+            table_arrays, table_kwargs[name] = SharedTable.arrays_of(table, f'tables/{name}')
+            arrays.update(table_arrays)
+        shared_globals = [name for name, value in (global_values or {}).items()
+                          if isinstance(value, np.ndarray) and not value.dtype.hasobject]
+        arrays.update({f'globals/{name}': global_values[name] for name in shared_globals})
+
+        self.arrays: SharedArrays = SharedArrays.create(arrays)
+        self.tables: Optional[dict[str, RefTable]] = None if tables is None else {
+            name: SharedTable(self.arrays, **kwargs) for name, kwargs in table_kwargs.items()
+        }
+        self.global_values: Optional[dict[str, Any]] = None if global_values is None else SharedGlobals(
+            self.arrays, global_values, frozenset(shared_globals))
+
+    def unlink(self):
+        self.arrays.unlink()
+
+    def __enter__(self) -> 'SharedReference':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.unlink()
@@ -1,60 +1,74 @@
+import numpy as np
 import pandas as pd
 from dask.distributed import Client
 import dask.dataframe as dd
 import dask
 from distributed import get_worker
 
+from src.lib.aggregation import Aggregation, GroupedTotals
 from src.lib.dimension import DimProjection
-from src.lib.reference import CsvTable, RefData, RefTable
+from src.lib.execution import run_calcs
+from src.lib.plan import CalcPlan
+from src.lib.policies import model_points_from_columns
+from src.lib.reference import CsvTable, RefTable
 from src.lib.registry import CalcRegistry, CalcModule, FunctionPriority
+from src.lib.results import ResultHandler
+from src.lib.shared import SharedReference
 
 
-def run_model(policy_rows: pd.DataFrame, mort_table: RefTable):
-    modules = CalcModule.from_tuples([
-        ('model_funcs', FunctionPriority.GENERAL)
-    ])
+dr = DimProjection(range(0, 10))
+POLICY_DTYPES = {'init_age': np.int64, 'sum_assured': np.float64}
+# Sums merge across partitions by adding, so each partition only returns its totals per t
+AGGREGATION = Aggregation(('pv_claim', 'expected_claim', 'num_alive'), stats=('sum',))
 
-    dr = DimProjection(range(0, 10))
 
-    calcs = (
-        CalcRegistry()
-        .register_modules(modules)
-        .register_function_groups({'a'})
-    ).create_calculations(dr, function_cache_size=2)
+def run_model(policy_rows: pd.DataFrame, mort_table: RefTable, plan: CalcPlan):
+    # Functions are resolved on the first partition a worker sees; later partitions reuse them
+    plans = plan.load()
 
     disc_rate_pa = 0.04
 
-    data = RefData(policy_values=dict(init_age=65, sum_assured=100_000),
-                   tables={'mort_table': mort_table},
-                   global_values={'disc_rate_pm': (1 + disc_rate_pa) ** (1 / 12) - 1})
+    policies = {col: policy_rows[col].to_numpy(dtype=dtype) for col, dtype in POLICY_DTYPES.items()}
+    model_points = model_points_from_columns(policies, tables={'mort_table': mort_table},
+                                             global_values={'disc_rate_pm': (1 + disc_rate_pa) ** (1 / 12) - 1})
 
-    flattened_res = []
     worker = get_worker()
+    totals = GroupedTotals(AGGREGATION, dr.t_range)
 
-    for index, policy in policy_rows.iterrows():
-        for t in dr.t_range:
-            row = {'t': t}
-            for calc in calcs:
-                row[calc.name] = calc.function(t, **{str(calc.data_arg): data})
-                flattened_res.append(row)
+    with ResultHandler(size=4, writer=totals) as result_handler:
+        run_calcs(plans, model_points, dr, result_handler, policy_columns=AGGREGATION.policy_columns)
     print(f"Worker {worker.address} processed policy partition")
-    return pd.DataFrame(flattened_res)
+    return pd.DataFrame(totals.result())
 
 
 if __name__ == "__main__":
     client = Client(processes=True)
     print(client.dashboard_link)
-    tables = CsvTable(csv='mort.csv', index_cols=['age'])
-    send_data = client.scatter(tables, broadcast=True)
 
-    df: dask.dataframe.DataFrame = dd.read_csv('policy.csv')
+    modules = CalcModule.from_tuples([
+        ('model_funcs', FunctionPriority.GENERAL)
+    ])
+    registry = (
+        CalcRegistry()
+        .register_modules(modules)
+        .register_function_groups({'a'})
+    )
+    # Discovery and dependency analysis happen once here rather than in every partition
+    plan = registry.compile_plan(dr)
+
+    # Published once into shared memory; local workers attach read-only views from the pickled segment name
+    shared = SharedReference(tables={'mort_table': CsvTable(index_cols=['age'], csv='mort.csv')})
+    send_data = client.scatter(shared.tables['mort_table'], broadcast=True)
+
+    df: dask.dataframe.DataFrame = dd.read_csv('policy.csv', usecols=list(POLICY_DTYPES), dtype=POLICY_DTYPES)
     meta = pd.DataFrame(
-        columns=['t', 'age', 'expected_claim', 'num_alive', 'num_deaths', 'pv_claim', 'q_x', 'q_x_m', 'v']
+        columns=['t'] + [Aggregation.column_name(value, 'sum') for value in AGGREGATION.values]
     )
     repartitioned_df = df.repartition(npartitions=40)
-    res: dask.dataframe.DataFrame = repartitioned_df.map_partitions(run_model, mort_table=send_data, meta=meta)
-    res2 = res.groupby(['num_alive']).count().compute()
+    res: dask.dataframe.DataFrame = repartitioned_df.map_partitions(run_model, mort_table=send_data, plan=plan, meta=meta)
+    res2 = res.groupby(['t']).sum().compute()
     print(res2)
+    shared.unlink()
     1
 
 
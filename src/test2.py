@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from dask.distributed import Client
 import dask.dataframe as dd
@@ -5,39 +6,29 @@ import dask
 from distributed import get_worker
 
 from src.lib.dimension import DimProjection
-from src.lib.reference import CsvTable, RefData, RefTable
+from src.lib.execution import run_batch
+from src.lib.plan import CalcPlan
+from src.lib.reference import MmapTable, RefData, RefTable
 from src.lib.registry import CalcRegistry, CalcModule, FunctionPriority
 
 
-def run_model(policy_rows: pd.DataFrame, mort_table: RefTable):
-    modules = CalcModule.from_tuples([
-        ('model_funcs', FunctionPriority.GENERAL)
-    ])
+dr = DimProjection(range(0, 100))
+POLICY_DTYPES = {'init_age': np.int64, 'sum_assured': np.float64}
 
-    dr = DimProjection(range(0, 100))
 
-    calcs = (
-        CalcRegistry()
-        .register_modules(modules)
-        .register_function_groups({'a'})
-    ).create_calculations(dr, function_cache_size=2)
+def run_model(policy_rows: pd.DataFrame, mort_table: RefTable, plan: CalcPlan):
+    calcs = plan.create_calculations()
 
     disc_rate_pa = 0.04
 
-    data = RefData(policy_values=dict(init_age=65, sum_assured=100_000),
+    data = RefData(policy_values={col: policy_rows[col].to_numpy(dtype=dtype) for col, dtype in POLICY_DTYPES.items()},
                    tables={'mort_table': mort_table},
                    global_values={'disc_rate_pm': (1 + disc_rate_pa) ** (1 / 12) - 1})
 
     worker = get_worker()
-    flattened_res = {}
-    for calc in calcs:
-        flattened_res[calc.name] = []
-
-    for index, policy in policy_rows.iterrows():
-        for t in dr.t_range:
-            for calc in calcs:
-                res = calc.function(t, **{str(calc.data_arg): data})
-                flattened_res[calc.name].append(res)
+    batch_res = run_batch(calcs, data, dr)
+    # Results are (t, policy); transpose so rows stay ordered by policy then t
+    flattened_res = {name: values.T.ravel() for name, values in batch_res.items()}
     print(f"Worker {worker.address} processed policy partition")
     return pd.DataFrame(flattened_res)
 
@@ -46,15 +37,25 @@ if __name__ == "__main__":
     client = Client(processes=True)
     print(client.dashboard_link)
 
-    tables = CsvTable(csv='mort.csv', index_cols=['age'])
+    modules = CalcModule.from_tuples([
+        ('model_funcs', FunctionPriority.GENERAL)
+    ])
+    plan = (
+        CalcRegistry()
+        .register_modules(modules)
+        .register_function_groups({'a'})
+    ).compile_plan(dr)
+
+    # Workers reopen the memory-mapped files from the pickled path instead of receiving a copy of the table
+    tables = MmapTable.from_csv('mort.csv', index_cols=['age'], directory='mort_table')
     send_data = client.scatter(tables, broadcast=True)
 
-    df: dask.dataframe.DataFrame = dd.read_csv('policy.csv')
+    df: dask.dataframe.DataFrame = dd.read_csv('policy.csv', usecols=list(POLICY_DTYPES), dtype=POLICY_DTYPES)
     meta = pd.DataFrame(
         columns=['age', 'expected_claim', 'num_alive', 'num_deaths', 'pv_claim', 'q_x', 'q_x_m', 't', 'v']
     )
     repartitioned_df = df.repartition(npartitions=100)
-    res: dask.dataframe.DataFrame = repartitioned_df.map_partitions(run_model, mort_table=send_data, meta=meta)
+    res: dask.dataframe.DataFrame = repartitioned_df.map_partitions(run_model, mort_table=send_data, plan=plan, meta=meta)
     res2 = res.shape[0].compute()
     print(res2)
     1
@@ -0,0 +1,135 @@
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+from src.benchmarks.lookup import synthetic_mortality
+from src.benchmarks.suite import synthetic_policies
+from src.lib.dimension import DimProjection
+from src.lib.execution import run_calcs
+from src.lib.fused import FusedPlans, run_fused
+from src.lib.policies import model_points_from_columns
+from src.lib.reference import CsvTable, RefData
+from src.lib.registry import CalcModule, CalcRegistry, FunctionPriority
+from src.lib.results import MemoryWriter, ResultHandler
+
+NUM_T = 120
+NUM_POLICIES = 20
+
+MODULE = '''from src.lib.dimension import Time
+from src.lib.reference import RefData
+from src.lib.registry import register_func_group
+
+
+@register_func_group('a')
+def growth(t: Time, data: RefData):
+    total = 0.0
+    for _ in range(2):
+        total += data.policy_values['x']
+    return total * t
+
+
+@register_func_group('a')
+def value(t: Time, data: RefData):
+    if t == 0:
+        return data.policy_values['x']
+    return value(t - 1, data) + growth(t, data)
+
+
+@register_func_group('a')
+def scaled(t: Time, data: RefData):
+    return value(t, data) * 2
+'''
+
+
+@pytest.fixture(scope='module')
+def mort_table() -> CsvTable:
+    return CsvTable(index_cols=['age'], csv=synthetic_mortality(max_age=250))
+
+
+@pytest.fixture
+def write_model(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    (tmp_path / 'fused_model.py').write_text(MODULE)
+    sys.modules.pop('fused_model', None)
+    importlib.invalidate_caches()
+    yield 'fused_model'
+    sys.modules.pop('fused_model', None)
+
+
+def _project(run, module: str, group: str, data: list[RefData], dim_projection: DimProjection,
+             **kwargs) -> dict[str, np.ndarray]:
+    registry = (
+        CalcRegistry()
+        .register_modules(CalcModule.from_tuples([(module, FunctionPriority.GENERAL)]))
+        .register_function_groups({group})
+    )
+    calcs = registry.create_calculations(dim_projection)
+    writer = MemoryWriter()
+    with ResultHandler(size=2, writer=writer) as result_handler:
+        run(calcs, data, dim_projection, result_handler, registry.dependency_graph, **kwargs)
+    result = writer.result()
+    order = np.lexsort((result['t'], result['model_point']))
+    return {col: values[order] for col, values in result.items()}
+
+
+def _assert_equal(fused: dict[str, np.ndarray], interpreted: dict[str, np.ndarray]):
+    assert list(fused) == list(interpreted)
+    for col, values in interpreted.items():
+        assert np.allclose(fused[col], values, rtol=1e-9), col
+
+
+def _terms(num_policies: int = NUM_POLICIES) -> np.ndarray:
+    return np.random.default_rng(1).integers(0, NUM_T + 12, num_policies)
+
+
+def _model_points(mort_table: CsvTable, batched: bool, num_policies: int = NUM_POLICIES) -> list[RefData]:
+    policies = synthetic_policies(num_policies)
+    policies['term'] = _terms(num_policies)
+    return list(model_points_from_columns(policies, {'mort_table': mort_table}, {'disc_rate_pm': 0.003}, batched))
+
+
+def _run_off(values) -> np.ndarray:
+    return np.asarray(values['num_alive']) < 0.9
+
+
+@pytest.mark.parametrize('batched', [False, True])
+@pytest.mark.parametrize('module, group, dim_projection', [
+    ('src.model_funcs', 'a', DimProjection(range(NUM_T))),
+    ('src.model_funcs', 'a', DimProjection(range(NUM_T), term='term', run_off=_run_off)),
+    ('src.benchmarks.model', 'fan_out', DimProjection(range(NUM_T))),
+    ('src.benchmarks.model', 'fan_out', DimProjection(range(NUM_T), term='term', padding=-1.0)),
+])
+def test_fused_matches_interpreted(mort_table, batched, module, group, dim_projection):
+    data = _model_points(mort_table, batched)
+    interpreted = _project(run_calcs, module, group, data, dim_projection)
+    # Without verification the kernel's own results are compared
+    fused = _project(run_fused, module, group, data, dim_projection, verify=0)
+    _assert_equal(fused, interpreted)
+    if dim_projection.term is not None:
+        padded = fused['t'] >= _terms()[fused['model_point']]
+        assert padded.any()
+        for col in fused.keys() - {'model_point', 't'}:
+            assert np.all(fused[col][padded] == dim_projection.padding), col
+
+
+def test_unsupported_calcs_fall_back(write_model):
+    dim_projection = DimProjection(range(12))
+    registry = (
+        CalcRegistry()
+        .register_modules(CalcModule.from_tuples([(write_model, FunctionPriority.GENERAL)]))
+        .register_function_groups({'a'})
+    )
+    plans = FusedPlans(registry.create_calculations(dim_projection), registry.dependency_graph)
+    assert 'growth' in plans.unsupported
+    # Calcs depending on one that is not fused are left to the interpreter too
+    assert 'value' in plans.unsupported
+    assert not plans.complete
+
+    data = [RefData(policy_values={'x': 1.5}), RefData(policy_values={'x': np.array([2.0, 3.0])})]
+    interpreted = _project(run_calcs, write_model, 'a', data, dim_projection)
+    fused = _project(run_fused, write_model, 'a', data, dim_projection, verify=0)
+    _assert_equal(fused, interpreted)
+    assert np.allclose(interpreted['value'][:12], 1.5 + 3.0 * np.cumsum(np.arange(12)))
@@ -0,0 +1,78 @@
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+from src.lib.dimension import DimProjection
+from src.lib.persistent import PersistentProjection, ResultStore
+from src.lib.reference import RefData
+from src.lib.registry import CalcModule, CalcRegistry, FunctionPriority
+
+MODULE = '''from src.lib.dimension import Time
+from src.lib.reference import RefData
+from src.lib.registry import register_func_group
+
+RATE = {rate}
+
+
+def helper(x):
+    return x * {multiplier}
+
+
+@register_func_group('a')
+def value(t: Time, data: RefData):
+    return helper(data.policy_values['x']) * (1 + RATE) ** t
+'''
+
+
+@pytest.fixture
+def write_model(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+
+    def write(source: str):
+        (tmp_path / 'persisted_model.py').write_text(source)
+        sys.modules.pop('persisted_model', None)
+        importlib.invalidate_caches()
+
+    yield write
+    sys.modules.pop('persisted_model', None)
+
+
+def _project(store: ResultStore) -> np.ndarray:
+    registry = (
+        CalcRegistry()
+        .register_modules(CalcModule.from_tuples([('persisted_model', FunctionPriority.GENERAL)]))
+        .register_function_groups({'a'})
+    )
+    dim_projection = DimProjection(range(5))
+    calcs = registry.create_calculations(dim_projection)
+    projection = PersistentProjection(calcs, dim_projection, store, registry.dependency_graph)
+    return projection.run(RefData(policy_values={'x': 2.0}))['value']
+
+
+def test_stored_results_are_reused(tmp_path, write_model):
+    write_model(MODULE.format(rate=0.1, multiplier=1))
+    with ResultStore(tmp_path / 'results.db') as store:
+        first = _project(store)
+        assert np.allclose(_project(store), first)
+        assert len(store) == 1
+
+
+@pytest.mark.parametrize('changed', [{'rate': 0.1, 'multiplier': 30}, {'rate': 0.25, 'multiplier': 1}])
+def test_helper_and_constant_edits_change_the_key(tmp_path, write_model, changed):
+    write_model(MODULE.format(rate=0.1, multiplier=1))
+    with ResultStore(tmp_path / 'results.db') as store:
+        _project(store)
+        write_model(MODULE.format(**changed))
+        expected = 2.0 * changed['multiplier'] * (1 + changed['rate']) ** np.arange(5)
+        assert np.allclose(_project(store), expected)
+
+
+def test_unresolvable_globals_are_not_stored(tmp_path, write_model):
+    source = MODULE.format(rate='object()', multiplier=1).replace('(1 + RATE)', '(1 + 0 * (RATE is None))')
+    write_model(source)
+    with ResultStore(tmp_path / 'results.db') as store:
+        assert np.allclose(_project(store), 2.0)
+        assert len(store) == 0
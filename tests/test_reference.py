@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.lib.interpolation import InterpolationMethod
+from src.lib.reference import ArrayTable, CsvTable
+
+
+def test_assigning_a_frame_changes_the_fingerprint():
+    table = CsvTable(index_cols=['age'], csv=pd.DataFrame({'age': [1, 2, 3], 'q_x': [0.1, 0.2, 0.3]}))
+    before = table.fingerprint()
+    table._df = pd.DataFrame({'age': [1, 2, 3], 'q_x': [0.1, 0.2, 0.4]}).set_index('age')
+    assert table.fingerprint() != before
+    assert table.lookup({'age': 3}, 'q_x') == 0.4
+
+
+def test_refresh_after_changing_data_in_place():
+    table = CsvTable(index_cols=['age'], csv=pd.DataFrame({'age': [1, 2, 3], 'q_x': [0.1, 0.2, 0.3]}))
+    before = table.fingerprint('q_x')
+    table._df.loc[3, 'q_x'] = 0.5
+    table.refresh()
+    assert table.fingerprint('q_x') != before
+    assert table.lookup({'age': 3}, 'q_x') == 0.5
+
+    array_table = ArrayTable(['k'], {'k': np.arange(3)}, {'v': np.arange(3.0)})
+    before = array_table.fingerprint()
+    array_table.col_array('v')[0] = 9.0
+    array_table.refresh()
+    assert array_table.fingerprint() != before
+
+
+def test_interpolating_arrays_by_group_matches_scalar_lookups():
+    rows = [(sex, group, age, age * (1 + group) + (sex == 'F')) for sex in 'MF' for group in range(4)
+            for age in range(0, 100, 5)]
+    table = CsvTable(index_cols=['sex', 'group', 'age'], csv=pd.DataFrame(rows, columns=['sex', 'group', 'age', 'q']))
+    rng = np.random.default_rng(0)
+    sex, group, age = rng.choice(['M', 'F'], 500), rng.integers(0, 4, 500), rng.uniform(0, 95, 500)
+
+    values = table.interpolated_lookup({'sex': sex, 'group': group, 'age': age}, 'q', interpolate_on='age')
+    assert np.allclose(values, age * (1 + group) + (sex == 'F'))
+    assert values[7] == pytest.approx(table.interpolated_lookup({'sex': str(sex[7]), 'group': int(group[7]),
+                                                                 'age': float(age[7])}, 'q', interpolate_on='age'))
+
+
+def test_log_linear_durations_require_positive_values():
+    table = CsvTable(index_cols=['age'], csv=pd.DataFrame({'age': [1, 2], '0': [0.1, 0.0], '1': [0.2, 0.3]}))
+    assert table.interpolated_lookup({'age': 1}, 0.5, InterpolationMethod.LOG_LINEAR) == pytest.approx(0.02 ** 0.5)
+    with pytest.raises(ValueError, match='strictly positive'):
+        table.interpolated_lookup({'age': 2}, 0.5, InterpolationMethod.LOG_LINEAR)